@@ -3,6 +3,8 @@ from typing import Dict
 
 import requests
 
+from metrics import PROVIDER_REQUEST_SECONDS, RATE_LIMITED, RETRIES
+import tracing
 from prompt_templates import DEFAULT_PROMPT
 from settings import get_settings
 from secrets_store import get_credential
@@ -13,7 +15,7 @@ def askopenai(prompt: str) -> str:
     api_key = settings.openai_api_key or get_credential("OPENAI_API_KEY")
     if not api_key:
         return "Error: OPENAI_API_KEY is not configured."
-    url = "https://api.openai.com/v1/chat/completions"
+    url = f"{settings.openai_base_url}/chat/completions"
     headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
     data = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": prompt}]}
     retries = 5
@@ -21,8 +23,11 @@ def askopenai(prompt: str) -> str:
         try:
             time.sleep(1 + attempt)  # Increase delay with each retry
             response = requests.post(url, json=data, headers=headers, timeout=10)
+            if response.status_code == 429:
+                RATE_LIMITED.labels("openai", "response").inc()
             if response.status_code == 429 and attempt < retries - 1:
                 # Exponential backoff for rate limit
+                RETRIES.labels("openai").inc()
                 time.sleep(2 ** attempt)
                 continue
             response.raise_for_status()
@@ -33,6 +38,7 @@ def askopenai(prompt: str) -> str:
         except requests.RequestException as e:
             if attempt == retries - 1:
                 return f"Error: {str(e)}"
+            RETRIES.labels("openai").inc()
             time.sleep(2 ** attempt)
     return "Error: OpenAI API failed after retries (rate limit or quota exceeded)."
 
@@ -42,7 +48,7 @@ def askgemini(prompt: str) -> str:
     api_key = settings.gemini_api_key or get_credential("GEMINI_API_KEY")
     if not api_key:
         return "Error: GEMINI_API_KEY is not configured."
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
+    url = f"{settings.gemini_base_url}/models/gemini-2.0-flash:generateContent?key={api_key}"
     data = {
         "contents": [
             {
@@ -84,7 +90,7 @@ def askgroq(prompt: str) -> str:
     api_key = settings.groq_api_key or get_credential("GROQ_API_KEY")
     if not api_key:
         return "Error: GROQ_API_KEY is not configured."
-    url = "https://api.groq.com/openai/v1/chat/completions"
+    url = f"{settings.groq_base_url}/chat/completions"
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {api_key}"
@@ -114,4 +120,13 @@ def askall_models(prompt: str = None) -> Dict[str, str]:
         "Gemini": askgemini,
         "Llama-4": askgroq
     }
-    return {model: func(prompt) for model, func in models.items()}
+    return {model: _timed_call(model, func, prompt) for model, func in models.items()}
+
+def _timed_call(model: str, func, prompt: str) -> str:
+    start = time.perf_counter()
+    with tracing.span(f"provider.{model}", kind=tracing.CLIENT, provider=model) as span:
+        result = func(prompt)
+        outcome = "error" if result.startswith("Error") else "ok"
+        span.set(outcome=outcome)
+    PROVIDER_REQUEST_SECONDS.labels(model, outcome).observe(time.perf_counter() - start)
+    return result
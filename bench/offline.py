@@ -0,0 +1,389 @@
+"""
+End-to-end benchmark against local stub providers (no network, no API keys).
+
+Starts bench.stubs, points every provider and platform base URL at it, serves the app with uvicorn on
+a free local port with a throwaway SQLite database, and runs:
+
+- generate: concurrent POST /generate-content/ calls (all three models per call)
+- watch: a watch session over a synthetic repo; every file is modified, then the session is stopped
+  and finalized (one generation per changed file)
+- publish: bulk publishing of approved posts to X and LinkedIn through the outbox workers
+
+Each scenario reports throughput and p50/p95/p99 latency. Results are written as JSON
+(bench/results/offline-<timestamp>.json by default). With --baseline, p95 latency and throughput are
+compared with an earlier result and the exit status is 1 when either regresses by more than --tolerance.
+
+Usage:
+    python -m bench.offline --latency-ms 50 --jitter-ms 20 --error-rate 0.02
+    python -m bench.offline --scenario publish --posts 500 --baseline bench/results/offline-old.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.stubs import StubConfig, StubServer, StubState  # noqa: E402
+
+SCENARIOS = ("generate", "watch", "publish")
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+# Results compared against a baseline: (scenario key, higher is better)
+_TRACKED = (("p95_ms", False), ("throughput_per_second", True))
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    """
+    Nearest-rank p50/p95/p99 (and max) of samples in seconds, reported in milliseconds.
+    """
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        index = max(0, math.ceil(p / 100.0 * len(ordered)) - 1)
+        return round(ordered[index] * 1000, 1)
+
+    return {"p50_ms": rank(50), "p95_ms": rank(95), "p99_ms": rank(99), "max_ms": round(ordered[-1] * 1000, 1)}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _environment(stubs: StubServer, workdir: str, port: int) -> Dict[str, str]:
+    env = {
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "APP_BASE_URL": f"http://127.0.0.1:{port}",
+        "OPENAI_API_KEY": "stub",
+        "GEMINI_API_KEY": "stub",
+        "GROQ_API_KEY": "stub",
+        "X_BEARER_TOKEN": "stub",
+        "X_CONSUMER_KEY": "stub",
+        "X_CONSUMER_SECRET": "stub",
+        "X_ACCESS_TOKEN": "stub",
+        "X_ACCESS_TOKEN_SECRET": "stub",
+        "LINKEDIN_ACCESS_TOKEN": "stub",
+        "LINKEDIN_AUTHOR_URN": "urn:li:person:stub",
+        "LINKEDIN_ORGANIZATION_URN": "urn:li:organization:stub",
+        # Unset credentials fall back to the encrypted store, which needs a key.
+        "SECRET_KEY": "bench-secret-key",
+        # Local caps would turn a large bulk publish into a rate-limit test.
+        "X_POSTS_PER_DAY": "0",
+        "LINKEDIN_POSTS_PER_DAY": "0",
+        "RUN_MONTHLY_POSTS": "false",
+        "LOG_LEVEL": "WARNING",
+    }
+    env.update(stubs.base_urls())
+    return env
+
+
+class _App:
+    """
+    The app served by uvicorn in a background thread of this process.
+    """
+
+    def __init__(self, port: int):
+        import uvicorn
+
+        import main
+
+        self.url = f"http://127.0.0.1:{port}"
+        self.main = main
+        self._server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, name="bench-app", daemon=True)
+
+    def __enter__(self) -> "_App":
+        self._thread.start()
+        deadline = time.monotonic() + 30
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("App did not start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.should_exit = True
+        self._thread.join(30)
+
+
+def _timed_request(session, method: str, url: str, **kwargs):
+    start = time.perf_counter()
+    resp = session.request(method, url, timeout=120, **kwargs)
+    return time.perf_counter() - start, resp
+
+
+def run_generate(app: _App, requests_count: int, concurrency: int) -> dict:
+    import requests
+
+    local = threading.local()
+
+    def call(i: int):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        elapsed, resp = _timed_request(local.session, "POST", f"{app.url}/generate-content/", json={"prompt": f"bench prompt {i}"})
+        responses = resp.json().get("model_responses", {}) if resp.ok else {}
+        errors = sum(1 for v in responses.values() if str(v).startswith("Error"))
+        return elapsed, resp.ok, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, range(requests_count)))
+    elapsed = time.perf_counter() - start
+    latencies = [r[0] for r in results]
+    return {
+        "requests": requests_count,
+        "concurrency": concurrency,
+        "failed_requests": sum(1 for r in results if not r[1]),
+        "model_errors": sum(r[2] for r in results),
+        "seconds": round(elapsed, 3),
+        "throughput_per_second": round(requests_count / elapsed, 2) if elapsed else None,
+        **percentiles(latencies),
+    }
+
+
+def _make_repo(path: str, files: int) -> List[str]:
+    paths = []
+    for i in range(files):
+        sub = os.path.join(path, f"pkg{i % 10}")
+        os.makedirs(sub, exist_ok=True)
+        file_path = os.path.join(sub, f"module_{i}.py")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("".join(f"def f{j}(x):\n    return x + {j}\n\n" for j in range(40)))
+        paths.append(file_path)
+    return paths
+
+
+def _wait_for(predicate, timeout: float, interval: float = 0.1):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = predicate()
+        if value:
+            return value
+        time.sleep(interval)
+    return None
+
+
+def run_watch(app: _App, workdir: str, files: int, timeout: float) -> dict:
+    import requests
+
+    from db import FileChangeLog, SessionLocal
+
+    repo = os.path.join(workdir, "repo")
+    paths = _make_repo(repo, files)
+    http = requests.Session()
+    resp = http.post(f"{app.url}/start-watch-session/", json={"path": repo, "duration": 60, "duration_unit": "minutes"})
+    resp.raise_for_status()
+    time.sleep(0.5)  # let the observer start
+
+    modified_at = time.perf_counter()
+    for file_path in paths:
+        with open(file_path, "a", encoding="utf-8") as f:
+            f.write("\ndef added(x):\n    return x * 2\n")
+
+    def all_seen():
+        status = http.get(f"{app.url}/watch-session-status/").json()
+        return len(status.get("changed_files", [])) >= files
+
+    seen = _wait_for(all_seen, timeout)
+    detect_seconds = time.perf_counter() - modified_at
+
+    stopped_at = time.perf_counter()
+    http.post(f"{app.url}/stop-watch-session/").raise_for_status()
+
+    # Per-file latency: time from stopping the session until the file's change log row is stored.
+    stored: Dict[str, float] = {}
+
+    def finished():
+        db = SessionLocal()
+        try:
+            for (file_path,) in db.query(FileChangeLog.file_path).all():
+                stored.setdefault(file_path, time.perf_counter() - stopped_at)
+        finally:
+            db.close()
+        status = http.get(f"{app.url}/watch-session-status/").json()
+        return status if not status.get("active") and status.get("results") else None
+
+    status = _wait_for(finished, timeout, interval=0.05)
+    finalize_seconds = time.perf_counter() - stopped_at
+    summaries = (status or {}).get("results", {}).get("file_summaries", {})
+    failed = sum(1 for v in summaries.values() if isinstance(v, str) and v.startswith("Error"))
+    per_file = list(stored.values())
+    return {
+        "files": files,
+        "all_changes_seen": bool(seen),
+        "detect_seconds": round(detect_seconds, 3),
+        "finalize_seconds": round(finalize_seconds, 3) if status else None,
+        "files_summarized": len(summaries),
+        "failed_files": failed,
+        "throughput_per_second": round(len(summaries) / finalize_seconds, 2) if status and finalize_seconds else None,
+        **percentiles(per_file),
+    }
+
+
+def run_publish(app: _App, posts: int, platforms: List[str], timeout: float) -> dict:
+    import requests
+
+    from db import GeneratedPost, SessionLocal
+    from outbox import PublishJob
+
+    db = SessionLocal()
+    try:
+        rows = [GeneratedPost(file="bench", content=f"Benchmark post {i}", status="approved") for i in range(posts)]
+        db.add_all(rows)
+        db.commit()
+        ids = [row.id for row in rows]
+    finally:
+        db.close()
+
+    enqueue_seconds, resp = _timed_request(
+        requests.Session(), "POST", f"{app.url}/bulk/post-content/", json={"ids": ids, "platform": platforms}
+    )
+    resp.raise_for_status()
+    started = time.perf_counter()
+    expected = posts * len(platforms)
+
+    def drained():
+        db = SessionLocal()
+        try:
+            pending = (
+                db.query(PublishJob)
+                .filter(PublishJob.post_id.in_(ids), PublishJob.status.in_(("queued", "running")))
+                .count()
+            )
+            return pending == 0
+        finally:
+            db.close()
+
+    done = _wait_for(drained, timeout, interval=0.1)
+    drain_seconds = time.perf_counter() - started
+
+    db = SessionLocal()
+    try:
+        jobs = db.query(PublishJob).filter(PublishJob.post_id.in_(ids)).all()
+        latencies = [(j.completed_at - j.created_at).total_seconds() for j in jobs if j.completed_at]
+        statuses: Dict[str, int] = {}
+        for j in jobs:
+            statuses[j.status] = statuses.get(j.status, 0) + 1
+    finally:
+        db.close()
+    return {
+        "posts": posts,
+        "platforms": platforms,
+        "jobs": expected,
+        "drained": bool(done),
+        "enqueue_ms": round(enqueue_seconds * 1000, 1),
+        "drain_seconds": round(drain_seconds, 3),
+        "statuses": statuses,
+        "throughput_per_second": round(len(latencies) / drain_seconds, 2) if drain_seconds else None,
+        **percentiles(latencies),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Regressions of results against baseline beyond tolerance (a fraction), as readable lines.
+    """
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for key, higher_is_better in _TRACKED:
+            old, new = previous.get(key), current.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{name}.{key}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append", help="repeatable; default: all")
+    parser.add_argument("--requests", type=int, default=50, help="generate: number of calls")
+    parser.add_argument("--concurrency", type=int, default=8, help="generate: concurrent clients")
+    parser.add_argument("--files", type=int, default=20, help="watch: files in the synthetic repo")
+    parser.add_argument("--posts", type=int, default=100, help="publish: approved posts to publish")
+    parser.add_argument("--platform", action="append", choices=("twitter", "linkedin"), help="publish: default both")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="stub latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub calls answering 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of stub calls answering 429")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=600.0, help="per-scenario wait limit in seconds")
+    parser.add_argument("--out", help="result file (default: bench/results/offline-<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression, e.g. 0.2 = 20%%")
+    args = parser.parse_args(argv)
+
+    stub_config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate)
+    workdir = tempfile.mkdtemp(prefix="autosocial-offline-")
+    port = _free_port()
+    scenarios = args.scenario or list(SCENARIOS)
+    results = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "scenarios": {},
+    }
+
+    with StubServer(StubState(default=stub_config, seed=args.seed)) as stubs:
+        # Settings are read once per process, so the environment must be in place before main is imported.
+        os.environ.update(_environment(stubs, workdir, port))
+        with _App(port) as app:
+            if "generate" in scenarios:
+                results["scenarios"]["generate"] = run_generate(app, args.requests, args.concurrency)
+            if "watch" in scenarios:
+                results["scenarios"]["watch"] = run_watch(app, workdir, args.files, args.timeout)
+            if "publish" in scenarios:
+                platforms = args.platform or ["twitter", "linkedin"]
+                results["scenarios"]["publish"] = run_publish(app, args.posts, platforms, args.timeout)
+        results["stub_requests"] = dict(stubs.state.requests)
+
+    print(f"{'scenario':<10}{'throughput/s':>14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in results["scenarios"].items():
+        print(f"{name:<10}{str(r['throughput_per_second']):>14}{str(r['p50_ms']):>10}{str(r['p95_ms']):>10}{str(r['p99_ms']):>10}")
+
+    out = args.out or os.path.join(RESULTS_DIR, f"offline-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,160 @@
+"""
+Serialization benchmark: how long large list and watch-session payloads take to encode.
+
+Payloads are synthetic file-change logs (unified diffs plus one output per model, like
+/file-change-logs/ and /watch-session-results/) of roughly --sizes megabytes each. Encoders:
+
+- fastapi_default: what a plain dict return used to cost, jsonable_encoder + Starlette's JSONResponse
+- default_class: a plain dict return now, jsonable_encoder + FastJSONResponse
+- fast_json: FastJSONResponse on the dict directly (the list endpoints and watch-session results)
+- ndjson: ndjson_lines over the rows (?format=ndjson), in NDJSON_BATCH_SIZE chunks
+
+fast_json and ndjson use orjson when it is installed and json.dumps otherwise; the backend is recorded
+in the results. Results (p50/p95/p99 per payload and encoder, plus MB/s) are written as JSON
+(bench/results/serialization-<timestamp>.json by default). With --baseline, p95 is compared with an
+earlier result and the exit status is 1 on a regression beyond --tolerance.
+
+Usage:
+    python -m bench.serialization --sizes 1 5 20
+    python -m bench.serialization --baseline bench/results/serialization-old.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+import fastjson  # noqa: E402
+from bench.offline import RESULTS_DIR, _git_commit, compare, percentiles  # noqa: E402
+from fastjson import FastJSONResponse, ndjson_lines  # noqa: E402
+from list_cache import NDJSON_BATCH_SIZE  # noqa: E402
+
+MODELS = ("openai", "anthropic", "gemini", "mistral")
+
+
+def _text(rng: random.Random, size: int) -> str:
+    words = []
+    length = 0
+    while length < size:
+        word = "".join(rng.choices(string.ascii_letters, k=rng.randint(2, 9)))
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def _diff(rng: random.Random, lines: int) -> str:
+    out = ["--- before", "+++ after", f"@@ -1,{lines} +1,{lines} @@"]
+    for i in range(lines):
+        out.append(rng.choice("+- ") + f"    value_{i} = compute({_text(rng, 40)!r})  # é")
+    return "\n".join(out)
+
+
+def make_rows(megabytes: float, seed: int = 7) -> List[dict]:
+    """
+    File-change-log rows totalling about megabytes of encoded JSON.
+    """
+    rng = random.Random(seed)
+    rows, size, target = [], 0, int(megabytes * 1024 * 1024)
+    while size < target:
+        row = {
+            "id": len(rows) + 1,
+            "session_id": 1 + len(rows) // 20,
+            "file_path": f"/repo/src/module_{len(rows)}.py",
+            "diff_summary": _diff(rng, rng.randint(20, 120)),
+            "ai_results": {model: _text(rng, rng.randint(800, 2500)) for model in MODELS},
+            "trace_id": "%032x" % rng.getrandbits(128),
+        }
+        size += len(json.dumps(row))
+        rows.append(row)
+    return rows
+
+
+def _encoders(rows: List[dict]) -> Dict[str, Callable[[], int]]:
+    results = {"file_summaries": rows, "session_summary": {"summary": "synthetic", "files": len(rows)}}
+
+    def ndjson() -> int:
+        return sum(len(ndjson_lines(rows[i:i + NDJSON_BATCH_SIZE])) for i in range(0, len(rows), NDJSON_BATCH_SIZE))
+
+    return {
+        "fastapi_default": lambda: len(JSONResponse(jsonable_encoder(results)).body),
+        "default_class": lambda: len(FastJSONResponse(jsonable_encoder(results)).body),
+        "fast_json": lambda: len(FastJSONResponse(results).body),
+        "ndjson": ndjson,
+    }
+
+
+def run(sizes: List[float], runs: int) -> dict:
+    scenarios = {}
+    for megabytes in sizes:
+        rows = make_rows(megabytes)
+        for name, encode in _encoders(rows).items():
+            encoded = encode()  # warm-up
+            samples = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                encode()
+                samples.append(time.perf_counter() - started)
+            stats = percentiles(samples)
+            scenarios[f"{megabytes:g}mb.{name}"] = {
+                "runs": runs,
+                "rows": len(rows),
+                "bytes": encoded,
+                **stats,
+                "mb_per_second": round(encoded / 1024 / 1024 / (stats["p50_ms"] / 1000), 1) if stats["p50_ms"] else None,
+            }
+    return scenarios
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 5, 20], help="payload sizes in MB")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--out", help="result file (default: bench/results/serialization-<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression, e.g. 0.2 = 20%%")
+    args = parser.parse_args(argv)
+
+    results = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "backend": "orjson" if fastjson.orjson is not None else "json",
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "scenarios": run(args.sizes, args.runs),
+    }
+
+    print(f"backend: {results['backend']}")
+    print(f"{'scenario':<24}{'p50 ms':>10}{'p95 ms':>10}{'MB/s':>10}")
+    for name, r in results["scenarios"].items():
+        print(f"{name:<24}{str(r['p50_ms']):>10}{str(r['p95_ms']):>10}{str(r['mb_per_second']):>10}")
+
+    out = args.out or os.path.join(RESULTS_DIR, f"serialization-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
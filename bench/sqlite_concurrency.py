@@ -0,0 +1,151 @@
+"""
+Concurrent write benchmark for the local SQLite database.
+
+Runs writer threads alongside reader threads that scan the table (like the list endpoints), once per
+profile. Each write transaction inserts --batch GeneratedPost rows, looking each one up first like the
+duplicate check does, so it holds the write lock for a while (like the batching writer and session
+finalize); --batch 1 is the plain per-row commit of the watcher threads.
+
+- legacy: the previous db.py setup (rollback journal, pysqlite's default 5 s busy timeout)
+- tuned: SQLITE_TUNED pragmas (WAL, synchronous=NORMAL, busy timeout, mmap, cache)
+- tuned+single-writer: tuned plus SQLITE_SINGLE_WRITER
+
+"committed" counts rows and "locked" failed transactions. With the defaults, legacy writers give up with "database is locked" once they have waited 5 s behind the
+others; the tuned profiles wait longer (SQLITE_BUSY_TIMEOUT_MS), and single-writer queues them in-process.
+
+Usage:
+    python -m bench.sqlite_concurrency --writers 16 --rows 5 --batch 100 --readers 4
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from db import Base, GeneratedPost, configure_sqlite, sqlite_pragmas  # noqa: E402
+from settings import Settings  # noqa: E402
+
+PROFILES = ("legacy", "tuned", "tuned+single-writer")
+# pysqlite's default, which the original db.py left in place
+LEGACY_TIMEOUT_SECONDS = 5.0
+
+
+def _engine(path: str, profile: str, busy_timeout_ms: int):
+    connect_args = {"check_same_thread": False}
+    engine_settings = Settings(SQLITE_TUNED=profile != "legacy", SQLITE_BUSY_TIMEOUT_MS=busy_timeout_ms)
+    connect_args["timeout"] = LEGACY_TIMEOUT_SECONDS if profile == "legacy" else busy_timeout_ms / 1000.0
+    engine = create_engine(f"sqlite:///{path}", connect_args=connect_args, pool_pre_ping=True)
+    configure_sqlite(engine, sqlite_pragmas(engine_settings), single_writer=profile == "tuned+single-writer")
+    return engine
+
+
+def run_profile(profile: str, writers: int, rows: int, readers: int, busy_timeout_ms: int, batch: int = 1) -> dict:
+    tmpdir = tempfile.mkdtemp(prefix="autosocial-bench-")
+    engine = _engine(os.path.join(tmpdir, "bench.db"), profile, busy_timeout_ms)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    # Blob offloading, search indexing and dedupe listeners are not registered here: only the
+    # plain per-row commit pattern is measured.
+    errors = {"locked": 0, "other": 0}
+    committed = [0]
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def writer(n: int):
+        for i in range(rows):
+            db = Session()
+            try:
+                for j in range(batch):
+                    content = f"writer {n} row {i}.{j} " * 20
+                    fingerprint = hashlib.sha256(content.encode("utf-8")).hexdigest()
+                    db.execute(select(GeneratedPost.id).where(GeneratedPost.fingerprint == fingerprint)).first()
+                    db.add(GeneratedPost(file=f"w{n}", content=content, status="pending", fingerprint=fingerprint))
+                    db.flush()
+                db.commit()
+                with lock:
+                    committed[0] += batch
+            except OperationalError as e:
+                db.rollback()
+                with lock:
+                    errors["locked" if "locked" in str(e) or "busy" in str(e) else "other"] += 1
+            finally:
+                db.close()
+
+    def reader():
+        while not done.is_set():
+            db = Session()
+            try:
+                db.query(GeneratedPost).all()
+            except OperationalError as e:
+                with lock:
+                    errors["locked" if "locked" in str(e) else "other"] += 1
+            finally:
+                db.close()
+
+    reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+    writer_threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    start = time.perf_counter()
+    for t in reader_threads + writer_threads:
+        t.start()
+    for t in writer_threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for t in reader_threads:
+        t.join()
+    engine.dispose()
+
+    return {
+        "profile": profile,
+        "writers": writers,
+        "readers": readers,
+        "batch": batch,
+        "attempted": writers * rows * batch,
+        "committed": committed[0],
+        "locked_errors": errors["locked"],
+        "other_errors": errors["other"],
+        "seconds": round(elapsed, 3),
+        "commits_per_second": round(committed[0] / elapsed, 1) if elapsed else None,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--rows", type=int, default=5, help="transactions per writer")
+    parser.add_argument("--batch", type=int, default=100, help="rows per transaction")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--busy-timeout-ms", type=int, default=15000)
+    parser.add_argument("--profile", choices=PROFILES, action="append", help="repeatable; default: all")
+    parser.add_argument("--json", dest="json_path", help="write results to this file")
+    args = parser.parse_args(argv)
+
+    results = [
+        run_profile(p, args.writers, args.rows, args.readers, args.busy_timeout_ms, args.batch)
+        for p in (args.profile or PROFILES)
+    ]
+    print(f"{'profile':<22}{'committed':>10}{'locked':>8}{'other':>7}{'seconds':>9}{'commits/s':>11}")
+    for r in results:
+        print(
+            f"{r['profile']:<22}{r['committed']:>10}{r['locked_errors']:>8}{r['other_errors']:>7}"
+            f"{r['seconds']:>9}{r['commits_per_second']:>11}"
+        )
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
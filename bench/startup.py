@@ -0,0 +1,145 @@
+"""
+Cold-start benchmark: how long a fresh worker takes to import the app and to answer its first requests.
+
+Every run uses a new Python process and a throwaway SQLite database (already migrated unless
+--auto-migrate, which makes each worker create the tables itself as before) and measures:
+
+- import: `import main` in a fresh interpreter
+- ready: from spawning `uvicorn main:app` until GET /healthz answers
+- first_request: the first GET /generated-posts/ after that (opens the first DB connection)
+
+Results (p50/p95/p99 per phase) are written as JSON (bench/results/startup-<timestamp>.json by default).
+With --baseline, p95 is compared with an earlier result and the exit status is 1 on a regression
+beyond --tolerance.
+
+Usage:
+    python -m bench.startup --runs 10
+    python -m bench.startup --baseline bench/results/startup-old.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.offline import RESULTS_DIR, _free_port, _git_commit, compare, percentiles  # noqa: E402
+
+PHASES = ("import", "ready", "first_request")
+
+_IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def _environment(workdir: str, auto_migrate: bool) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "AUTO_MIGRATE": "true" if auto_migrate else "false",
+        "RUN_MONTHLY_POSTS": "false",
+        "RUN_RETENTION": "false",
+        "PUBLISH_WORKERS": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+    return env
+
+
+def measure_import(env: Dict[str, str]) -> float:
+    out = subprocess.run([sys.executable, "-c", _IMPORT_SNIPPET], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def measure_serve(env: Dict[str, str], timeout: float) -> Dict[str, float]:
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {proc.returncode}")
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError("App did not become ready")
+            try:
+                if requests.get(f"{url}/healthz", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            time.sleep(0.01)
+        ready = time.perf_counter() - started
+        first = time.perf_counter()
+        requests.get(f"{url}/generated-posts/", timeout=timeout).raise_for_status()
+        return {"ready": ready, "first_request": time.perf_counter() - first}
+    finally:
+        proc.terminate()
+        proc.wait(30)
+
+
+def run(runs: int, auto_migrate: bool, timeout: float) -> dict:
+    samples: Dict[str, List[float]] = {phase: [] for phase in PHASES}
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory(prefix="autosocial-startup-") as workdir:
+            env = _environment(workdir, auto_migrate)
+            if not auto_migrate:
+                subprocess.run([sys.executable, "-m", "migrate"], cwd=ROOT, env=env, capture_output=True, check=True)
+            samples["import"].append(measure_import(env))
+            for phase, seconds in measure_serve(env, timeout).items():
+                samples[phase].append(seconds)
+    return {phase: {"runs": len(values), **percentiles(values)} for phase, values in samples.items()}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--auto-migrate", action="store_true", help="create tables in the worker at startup")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-run wait limit in seconds")
+    parser.add_argument("--out", help="result file (default: bench/results/startup-<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression, e.g. 0.2 = 20%%")
+    args = parser.parse_args(argv)
+
+    results = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "scenarios": run(args.runs, args.auto_migrate, args.timeout),
+    }
+
+    print(f"{'phase':<15}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, r in results["scenarios"].items():
+        print(f"{name:<15}{str(r['p50_ms']):>10}{str(r['p95_ms']):>10}{str(r['max_ms']):>10}")
+
+    out = args.out or os.path.join(RESULTS_DIR, f"startup-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,222 @@
+"""
+Local stand-ins for the OpenAI, Gemini, Groq, X and LinkedIn APIs (plus an OTLP trace collector).
+
+One threaded HTTP server answers every provider under its own path prefix, so the app is pointed at it
+through the *_BASE_URL settings (see base_urls()). Each provider has a configurable latency (with
+jitter) and error rates: error_rate answers 500, rate_limit_rate answers 429 with Retry-After.
+
+Usage:
+    python -m bench.stubs --port 8900 --latency-ms 200 --error-rate 0.01
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+PROVIDERS = ("openai", "gemini", "groq", "x", "linkedin", "otlp")
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after_seconds: int = 1
+
+
+@dataclass
+class StubState:
+    default: StubConfig = field(default_factory=StubConfig)
+    providers: Dict[str, StubConfig] = field(default_factory=dict)
+    requests: Counter = field(default_factory=Counter)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    seed: Optional[int] = None
+
+    def __post_init__(self):
+        self.random = random.Random(self.seed)
+
+    def config(self, provider: str) -> StubConfig:
+        return self.providers.get(provider, self.default)
+
+
+def _completion(text: str) -> dict:
+    return {"choices": [{"message": {"role": "assistant", "content": text}}]}
+
+
+def _respond(provider: str, method: str, path: str, body: dict, state: StubState):
+    """
+    Return (status, payload, headers) for a successful call, mimicking the parts of each API the app reads.
+    """
+    if provider in ("openai", "groq") and path.endswith("/chat/completions"):
+        prompt = (body.get("messages") or [{}])[-1].get("content", "")
+        return 200, _completion(f"[{provider}] {prompt[:80]}"), {}
+    if provider == "gemini" and ":generateContent" in path:
+        prompt = body.get("contents", [{}])[0].get("parts", [{}])[0].get("text", "")
+        return 200, {"candidates": [{"content": {"parts": [{"text": f"[gemini] {prompt[:80]}"}]}}]}, {}
+    if provider in ("openai", "groq") and path.endswith("/models"):
+        return 200, {"data": [{"id": "stub"}]}, {}
+    if provider == "x":
+        reset = str(int(time.time()) + 900)
+        headers = {"x-rate-limit-limit": "100000", "x-rate-limit-remaining": "99999", "x-rate-limit-reset": reset}
+        if path.startswith("/2/tweets"):
+            with state.lock:
+                n = state.requests["x:tweet"]
+            return 201, {"data": {"id": str(10**15 + n), "text": body.get("text", "")}}, headers
+        if path.startswith("/1.1/trends/place.json"):
+            return 200, [{"trends": [{"name": f"#stub{i}"} for i in range(10)]}], headers
+        if path.startswith("/2/users/me"):
+            return 200, {"data": {"id": "1", "username": "stub"}}, headers
+    if provider == "linkedin":
+        if path.startswith("/v2/ugcPosts"):
+            return 201, {"id": f"urn:li:share:{state.random.randrange(10**12)}"}, {}
+        if path.startswith("/v2/userinfo"):
+            return 200, {"sub": "stub"}, {}
+    if provider == "otlp" and path == "/v1/traces":
+        spans = [
+            span
+            for resource in body.get("resourceSpans", [])
+            for scope in resource.get("scopeSpans", [])
+            for span in scope.get("spans", [])
+        ]
+        with state.lock:
+            state.requests["otlp:spans"] += len(spans)
+        return 200, {}, {}
+    return 404, {"error": f"stub has no route for {method} {path}"}, {}
+
+
+def _handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _handle(self, method: str):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            provider, _, rest = self.path.lstrip("/").partition("/")
+            path = "/" + rest
+            if provider not in PROVIDERS:
+                self._send(404, {"error": "unknown provider"}, {})
+                return
+            try:
+                body = json.loads(raw) if raw else {}
+            except ValueError:
+                body = {}
+
+            config = state.config(provider)
+            with state.lock:
+                state.requests[provider] += 1
+                if provider == "x" and path.startswith("/2/tweets"):
+                    state.requests["x:tweet"] += 1
+                roll = state.random.random()
+                delay = config.latency_ms + state.random.uniform(-config.jitter_ms, config.jitter_ms)
+            if delay > 0:
+                time.sleep(delay / 1000.0)
+            if roll < config.rate_limit_rate:
+                with state.lock:
+                    state.requests[f"{provider}:429"] += 1
+                self._send(429, {"error": "rate limited"}, {"Retry-After": str(config.retry_after_seconds)})
+                return
+            if roll < config.rate_limit_rate + config.error_rate:
+                with state.lock:
+                    state.requests[f"{provider}:500"] += 1
+                self._send(500, {"error": "stub failure"}, {})
+                return
+            self._send(*_respond(provider, method, path, body, state))
+
+        def _send(self, status: int, payload, headers: dict):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+    return Handler
+
+
+class StubServer:
+    """
+    Serves all stub providers from a background thread; use as a context manager.
+    """
+
+    def __init__(self, state: Optional[StubState] = None, host: str = "127.0.0.1", port: int = 0):
+        self.state = state or StubState()
+        self._server = ThreadingHTTPServer((host, port), _handler(self.state))
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def base_urls(self) -> Dict[str, str]:
+        """
+        Settings overrides that route every provider call to this server.
+        """
+        return {
+            "OPENAI_BASE_URL": f"{self.url}/openai/v1",
+            "GEMINI_BASE_URL": f"{self.url}/gemini/v1beta",
+            "GROQ_BASE_URL": f"{self.url}/groq/openai/v1",
+            "X_API_BASE_URL": f"{self.url}/x",
+            "LINKEDIN_API_BASE_URL": f"{self.url}/linkedin",
+            "TRACING_OTLP_ENDPOINT": f"{self.url}/otlp/v1/traces",
+        }
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="bench-stubs", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate)
+    server = StubServer(StubState(default=config), port=args.port).start()
+    for name, value in server.base_urls().items():
+        print(f"{name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,326 @@
+"""
+File-churn load generator for the watcher path.
+
+Builds a synthetic repo (configurable size, depth and fan-out, plus .gitignore'd build/ and
+node_modules/ trees), starts the app's watcher on it in-process and replays churn patterns:
+
+- editor-save: atomic saves at a fixed rate (write a temp file next to the target, rename over it)
+- mass-rewrite: every tracked file rewritten as fast as possible (build tool, git checkout)
+- rename: files renamed in place
+- ignored-noise: writes under the ignored directories only
+
+For every pattern it reports event-to-enqueue latency (file written -> path recorded in the watch
+session's changed set), dropped paths (never recorded before --settle seconds of quiet), ignored paths
+that were recorded anyway, CPU used by the watchdog threads and the whole process, and resident memory.
+
+--watcher session drives POST /start-watch-session/ (the session observer, including its initial
+scan); --watcher watcher drives start_watcher (the WATCH_PATH observer) while a session is marked
+active, so events are only recorded. Provider calls made when the session ends go to bench.stubs.
+
+Usage:
+    python -m bench.watch_churn --files 5000 --depth 4 --fanout 6 --json churn.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.offline import _environment, percentiles  # noqa: E402
+from bench.stubs import StubServer  # noqa: E402
+
+PATTERNS = ("editor-save", "mass-rewrite", "rename", "ignored-noise")
+IGNORED_DIRS = ("node_modules", "build")
+_POLL_SECONDS = 0.002
+
+
+def _body(n: int, generation: int) -> str:
+    return "".join(f"def f{j}_{generation}(x):\n    return x + {j}\n\n" for j in range(n))
+
+
+def make_repo(path: str, files: int, depth: int, fanout: int, lines: int) -> List[str]:
+    """
+    Create files spread over a directory tree of the given depth and fan-out. Returns their paths.
+    """
+    dirs = [path]
+    for _ in range(depth):
+        dirs = [os.path.join(d, f"d{i}") for d in dirs for i in range(fanout)]
+    paths = []
+    for i in range(files):
+        directory = dirs[i % len(dirs)]
+        os.makedirs(directory, exist_ok=True)
+        file_path = os.path.join(directory, f"m{i}.py")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(_body(lines, 0))
+        paths.append(os.path.abspath(file_path))
+    for name in IGNORED_DIRS:
+        os.makedirs(os.path.join(path, name), exist_ok=True)
+    with open(os.path.join(path, ".gitignore"), "w", encoding="utf-8") as f:
+        f.write("".join(f"{name}/\n" for name in IGNORED_DIRS))
+    return paths
+
+
+class ChangeRecorder:
+    """
+    Polls the watch session's changed set and notes when each path first appears.
+    """
+
+    def __init__(self, changed: Set[str]):
+        self._changed = changed
+        self.first_seen: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="churn-recorder", daemon=True)
+
+    def start(self) -> "ChangeRecorder":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def reset(self) -> None:
+        self._changed.clear()
+        self.first_seen = {}
+
+    def _run(self) -> None:
+        size = 0
+        while not self._stop.wait(_POLL_SECONDS):
+            if len(self._changed) == size:
+                continue
+            try:
+                current = set(self._changed)
+            except RuntimeError:
+                continue  # the observer added a path mid-copy; try again next tick
+            now = time.perf_counter()
+            size = len(current)
+            for path in current.difference(self.first_seen):
+                self.first_seen[path] = now
+
+    def wait_quiet(self, expected: Set[str], settle: float) -> None:
+        """
+        Return once every expected path was seen, or nothing new has appeared for settle seconds.
+        """
+        last_count, last_change = -1, time.monotonic()
+        while time.monotonic() - last_change < settle:
+            seen = len(self.first_seen)
+            if seen != last_count:
+                last_count, last_change = seen, time.monotonic()
+            if expected and expected.issubset(self.first_seen):
+                time.sleep(min(settle, 0.2))  # give stragglers (e.g. ignored paths) a moment
+                return
+            time.sleep(0.01)
+
+
+def _watchdog_threads() -> List[threading.Thread]:
+    from watchdog.observers.api import BaseObserver, EventEmitter
+
+    return [t for t in threading.enumerate() if isinstance(t, (BaseObserver, EventEmitter)) and t.is_alive()]
+
+
+def _thread_cpu(threads: List[threading.Thread]) -> Dict[int, float]:
+    cpu = {}
+    for t in threads:
+        try:
+            cpu[t.ident] = time.clock_gettime(time.pthread_getcpuclockid(t.ident))
+        except (AttributeError, OSError, ProcessLookupError):
+            continue  # not supported on this platform, or the thread has exited
+    return cpu
+
+
+def _memory_kb() -> Dict[str, Optional[int]]:
+    values: Dict[str, Optional[int]] = {"rss_kb": None, "peak_rss_kb": None}
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    values["rss_kb"] = int(line.split()[1])
+                elif line.startswith("VmHWM:"):
+                    values["peak_rss_kb"] = int(line.split()[1])
+    except OSError:
+        import resource
+
+        values["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return values
+
+
+def _write(path: str, text: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def run_pattern(name: str, repo: str, files: List[str], recorder: ChangeRecorder, args, generation: int) -> Tuple[dict, List[str]]:
+    """
+    Replay one pattern. Returns its measurements and the (possibly renamed) tracked files.
+    """
+    recorder.reset()
+    written: Dict[str, float] = {}  # expected path -> time its write completed
+    ignored: Set[str] = set()
+    threads = _watchdog_threads()
+    cpu_before = _thread_cpu(threads)
+    process_before = time.process_time()
+    memory_before = _memory_kb()
+    started = time.perf_counter()
+
+    if name == "editor-save":
+        interval = 1.0 / args.rate if args.rate > 0 else 0.0
+        for i in range(args.saves):
+            target = files[i % len(files)]
+            tmp = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.swp")
+            _write(tmp, _body(args.lines, generation))
+            os.replace(tmp, target)
+            written[target] = time.perf_counter()
+            if interval:
+                time.sleep(interval)
+    elif name == "mass-rewrite":
+        for target in files:
+            _write(target, _body(args.lines, generation))
+            written[target] = time.perf_counter()
+    elif name == "rename":
+        renamed = list(files)
+        for i in range(min(args.renames, len(files))):
+            source = files[i]
+            target = source[:-3] + f"_r{generation}.py"
+            os.rename(source, target)
+            renamed[i] = target
+            written[target] = time.perf_counter()
+        files = renamed
+    elif name == "ignored-noise":
+        for i in range(args.noise):
+            directory = os.path.join(repo, IGNORED_DIRS[i % len(IGNORED_DIRS)], f"pkg{i % 50}")
+            os.makedirs(directory, exist_ok=True)
+            target = os.path.abspath(os.path.join(directory, f"gen{i}.js"))
+            _write(target, f"module.exports = {i};\n")
+            ignored.add(target)
+
+    write_seconds = time.perf_counter() - started
+    recorder.wait_quiet(set(written), args.settle)
+    elapsed = time.perf_counter() - started
+
+    seen = recorder.first_seen
+    latencies = [max(0.0, seen[p] - t) for p, t in written.items() if p in seen]
+    dropped = [p for p in written if p not in seen]
+    cpu_after = _thread_cpu(_watchdog_threads())
+    watcher_cpu = sum(cpu_after[i] - cpu_before.get(i, 0.0) for i in cpu_after)
+    memory_after = _memory_kb()
+    result = {
+        "pattern": name,
+        "operations": len(written) or len(ignored),
+        "write_seconds": round(write_seconds, 3),
+        "ops_per_second": round((len(written) or len(ignored)) / write_seconds, 1) if write_seconds else None,
+        "expected": len(written),
+        "recorded": len(seen),
+        "dropped": len(dropped),
+        "dropped_examples": [os.path.relpath(p, repo) for p in dropped[:5]],
+        "ignored_recorded": len(ignored.intersection(seen)),
+        # Anything else recorded: temp files, rename sources, directories.
+        "other_recorded": len(set(seen) - set(written) - ignored),
+        "seconds": round(elapsed, 3),
+        "watcher_cpu_seconds": round(watcher_cpu, 3),
+        "process_cpu_seconds": round(time.process_time() - process_before, 3),
+        "rss_kb": memory_after["rss_kb"],
+        "rss_delta_kb": (memory_after["rss_kb"] - memory_before["rss_kb"]) if memory_after["rss_kb"] and memory_before["rss_kb"] else None,
+        "peak_rss_kb": memory_after["peak_rss_kb"],
+        **percentiles(latencies),
+    }
+    return result, files
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=2000, help="tracked files in the synthetic repo")
+    parser.add_argument("--depth", type=int, default=3, help="directory levels")
+    parser.add_argument("--fanout", type=int, default=5, help="subdirectories per level")
+    parser.add_argument("--lines", type=int, default=20, help="functions per file (file size)")
+    parser.add_argument("--pattern", choices=PATTERNS, action="append", help="repeatable; default: all")
+    parser.add_argument("--saves", type=int, default=200, help="editor-save: number of saves")
+    parser.add_argument("--rate", type=float, default=50.0, help="editor-save: saves per second (0 = unthrottled)")
+    parser.add_argument("--renames", type=int, default=500, help="rename: files renamed")
+    parser.add_argument("--noise", type=int, default=2000, help="ignored-noise: files written under ignored dirs")
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds without new events before a pattern ends")
+    parser.add_argument("--watcher", choices=("session", "watcher"), default="session")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic repo")
+    parser.add_argument("--json", dest="json_path", help="write results to this file")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="autosocial-churn-")
+    repo = os.path.join(workdir, "repo")
+    files = make_repo(repo, args.files, args.depth, args.fanout, args.lines)
+    results = {"config": {k: v for k, v in vars(args).items() if k != "json_path"}, "patterns": []}
+
+    with StubServer() as stubs:
+        os.environ.update(_environment(stubs, workdir, 0))
+        os.environ.setdefault("WATCH_SCAN_MAX_FILES", str(args.files + 1000))
+        from fastapi.testclient import TestClient
+
+        import main as app_main
+
+        with TestClient(app_main.app) as client:
+            stop_event = threading.Event()
+            scan_started = time.perf_counter()
+            if args.watcher == "session":
+                resp = client.post("/start-watch-session/", json={"path": repo, "duration": 12, "duration_unit": "hours"})
+                resp.raise_for_status()
+            else:
+                app_main.watch_session.update({"active": True, "changed_files": set()})
+                watcher = threading.Thread(target=app_main.start_watcher, args=(repo, stop_event), daemon=True)
+                watcher.start()
+            results["start_seconds"] = round(time.perf_counter() - scan_started, 3)
+            deadline = time.monotonic() + 10
+            while not _watchdog_threads() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            time.sleep(0.5)  # inotify watches are added while the observer starts
+
+            recorder = ChangeRecorder(app_main.watch_session["changed_files"]).start()
+            try:
+                for generation, name in enumerate(args.pattern or PATTERNS, start=1):
+                    result, files = run_pattern(name, repo, files, recorder, args, generation)
+                    results["patterns"].append(result)
+            finally:
+                recorder.stop()
+                # Nothing left to summarize, so ending the session makes no per-file generation calls.
+                recorder.reset()
+                if args.watcher == "session":
+                    client.post("/stop-watch-session/")
+                    thread = app_main.watch_session.get("thread")
+                    if thread is not None:
+                        thread.join(30)
+                else:
+                    # Stop the observer before clearing the flag, or late events would trigger generation.
+                    stop_event.set()
+                    watcher.join(30)
+                    time.sleep(0.2)
+                    app_main.watch_session["active"] = False
+
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"start ({args.watcher}, {args.files} files): {results['start_seconds']}s")
+    print(
+        f"{'pattern':<15}{'ops':>7}{'ops/s':>9}{'recorded':>10}{'dropped':>9}{'ignored':>9}{'other':>7}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'cpu s':>8}{'rss MB':>8}"
+    )
+    for r in results["patterns"]:
+        rss = round(r["rss_kb"] / 1024, 1) if r["rss_kb"] else None
+        print(
+            f"{r['pattern']:<15}{r['operations']:>7}{str(r['ops_per_second']):>9}{r['recorded']:>10}{r['dropped']:>9}"
+            f"{r['ignored_recorded']:>9}{r['other_recorded']:>7}{str(r['p50_ms']):>9}{str(r['p95_ms']):>9}"
+            f"{str(r['p99_ms']):>9}{r['watcher_cpu_seconds']:>8}{str(rss):>8}"
+        )
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,410 @@
+from __future__ import annotations
+
+import ast
+import hashlib
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Column, Integer, LargeBinary, String, event, select
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm.attributes import set_committed_value
+
+from db import Base, GeneratedPost, FileChangeLog
+from metrics import CACHE_REQUESTS
+from settings import get_settings
+
+try:  # Optional: better ratio and speed than zlib when installed.
+    import zstandard as _zstd
+except ImportError:  # pragma: no cover - depends on environment
+    _zstd = None
+
+
+class ContentBlob(Base):
+    """
+    Compressed text keyed by the sha256 of its UTF-8 bytes.
+    Blobs are immutable; identical text written by different rows is stored once.
+    """
+
+    __tablename__ = "content_blobs"
+
+    hash = Column(String(64), primary_key=True)
+    codec = Column(String(8), nullable=False)  # zstd|zlib|raw
+    size = Column(Integer, nullable=False)  # uncompressed bytes
+    data = Column(LargeBinary, nullable=False)
+
+
+# (text attribute, hash attribute, value stored inline once offloaded)
+_OFFLOADED_FIELDS = {
+    GeneratedPost: (("content", "content_hash", ""),),
+    FileChangeLog: (("diff_summary", "diff_hash", None),),
+}
+
+_LOOKUP_CHUNK = 500
+
+_cache: "OrderedDict[str, str]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def content_hash(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def _compress(raw: bytes) -> tuple[str, bytes]:
+    codec = (get_settings().blob_codec or "auto").strip().lower()
+    if codec == "raw":
+        return "raw", raw
+    if codec in ("auto", "zstd") and _zstd is not None:
+        packed = _zstd.ZstdCompressor(level=10).compress(raw)
+        codec = "zstd"
+    else:
+        packed = zlib.compress(raw, 6)
+        codec = "zlib"
+    # Tiny or already-dense text can grow when compressed.
+    if len(packed) >= len(raw):
+        return "raw", raw
+    return codec, packed
+
+
+def _decompress(codec: str, data: bytes) -> str:
+    if codec == "zstd":
+        if _zstd is None:
+            raise RuntimeError("Blob is zstd-compressed but the 'zstandard' package is not installed.")
+        raw = _zstd.ZstdDecompressor().decompress(data)
+    elif codec == "zlib":
+        raw = zlib.decompress(data)
+    else:
+        raw = data
+    return bytes(raw).decode("utf-8")
+
+
+def _cache_get(h: str) -> Optional[str]:
+    with _cache_lock:
+        value = _cache.get(h)
+        if value is not None:
+            _cache.move_to_end(h)
+        return value
+
+
+def _cache_put(h: str, value: str) -> None:
+    limit = get_settings().blob_cache_entries
+    if limit <= 0:
+        return
+    with _cache_lock:
+        _cache[h] = value
+        _cache.move_to_end(h)
+        while len(_cache) > limit:
+            _cache.popitem(last=False)
+
+
+def _insert_blobs(connection, rows: List[dict]) -> None:
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect.startswith("postgres"):
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        present = set(connection.execute(
+            select(ContentBlob.hash).where(ContentBlob.hash.in_([r["hash"] for r in rows]))
+        ).scalars())
+        rows = [r for r in rows if r["hash"] not in present]
+        if rows:
+            connection.execute(ContentBlob.__table__.insert(), rows)
+        return
+    connection.execute(insert(ContentBlob).on_conflict_do_nothing(index_elements=["hash"]), rows)
+
+
+def _pin(connection, hashes: List[str]) -> set:
+    # Share-lock the blobs until the caller commits, so compact_blobs (which locks them for update
+    # before re-checking references) cannot delete one the caller is about to reference.
+    # SQLite has no row locks; there the insert above already holds the database write lock.
+    return set(connection.execute(
+        select(ContentBlob.hash).where(ContentBlob.hash.in_(hashes)).with_for_update(read=True)
+    ).scalars())
+
+
+def store_text(connection, value: str) -> str:
+    """
+    Write `value` as a blob (if not already present) and return its hash.
+    """
+    return store_texts(connection, [value])[0]
+
+
+def store_texts(connection, values: Iterable[str]) -> List[str]:
+    """
+    Write every value as a blob (insert-or-ignore) and return their hashes, in order.
+    """
+    values = list(values)
+    hashes = [content_hash(v) for v in values]
+    unique = list(dict.fromkeys(zip(hashes, values)))
+    # Always insert rather than skip hashes that look present: compaction may delete a blob between
+    # that lookup and the commit of the row referencing it.
+    for i in range(0, len(unique), _LOOKUP_CHUNK):
+        rows = {}
+        for h, value in unique[i:i + _LOOKUP_CHUNK]:
+            raw = value.encode("utf-8")
+            codec, data = _compress(raw)
+            rows[h] = {"hash": h, "codec": codec, "size": len(raw), "data": data}
+        pending = list(rows)
+        for _ in range(3):
+            _insert_blobs(connection, [rows[h] for h in pending])
+            if connection.dialect.name == "sqlite":
+                break
+            locked = _pin(connection, pending)
+            # A blob deleted by a compaction that held its lock is gone once the lock is granted.
+            pending = [h for h in pending if h not in locked]
+            if not pending:
+                break
+        else:
+            raise RuntimeError(f"Could not store {len(pending)} content blobs")
+    return hashes
+
+
+def load_texts(connection, hashes: Iterable[str]) -> Dict[str, str]:
+    """
+    Resolve blob hashes to text, using the in-process cache before querying in chunks.
+    """
+    found: Dict[str, str] = {}
+    missing = []
+    for h in set(hashes):
+        cached = _cache_get(h)
+        if cached is None:
+            missing.append(h)
+        else:
+            found[h] = cached
+    if found:
+        CACHE_REQUESTS.labels("blob", "hit").inc(len(found))
+    if missing:
+        CACHE_REQUESTS.labels("blob", "miss").inc(len(missing))
+    for i in range(0, len(missing), _LOOKUP_CHUNK):
+        chunk = missing[i:i + _LOOKUP_CHUNK]
+        rows = connection.execute(
+            select(ContentBlob.hash, ContentBlob.codec, ContentBlob.data).where(ContentBlob.hash.in_(chunk))
+        )
+        for h, codec, data in rows:
+            value = _decompress(codec, data)
+            _cache_put(h, value)
+            found[h] = value
+    return found
+
+
+def _should_offload(value: Optional[str]) -> bool:
+    settings = get_settings()
+    if not settings.blob_storage or not value:
+        return False
+    return len(value.encode("utf-8")) >= settings.blob_min_bytes
+
+
+def offload_rows(connection, model, rows: List[dict]) -> None:
+    """
+    For bulk statements, which skip the flush listeners: offload the text columns present in raw row
+    dicts, in place, storing every blob with one store_texts() call. ai_results is left alone.
+    """
+    pending = [
+        (row, text_attr, hash_attr, inline_value)
+        for row in rows
+        for text_attr, hash_attr, inline_value in _OFFLOADED_FIELDS.get(model, ())
+        if text_attr in row
+    ]
+    offloaded = [p for p in pending if _should_offload(p[0][p[1]])]
+    hashes = store_texts(connection, [row[text_attr] for row, text_attr, _, _ in offloaded])
+    for (row, text_attr, hash_attr, inline_value), h in zip(offloaded, hashes):
+        row[hash_attr] = h
+        row[text_attr] = inline_value
+    for row, text_attr, hash_attr, _ in pending:
+        row.setdefault(hash_attr, None)
+
+
+def _parse_model_results(value: str) -> Optional[Dict[str, str]]:
+    # ai_results is written as str(responses) for a {model: text} dict.
+    if not value.startswith("{"):
+        return None
+    try:
+        parsed = ast.literal_eval(value)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+    if not isinstance(parsed, dict):
+        return None
+    if not all(isinstance(k, str) and isinstance(v, str) for k, v in parsed.items()):
+        return None
+    # Only offload when the round trip reproduces the stored string exactly.
+    return parsed if str(parsed) == value else None
+
+
+def _offload(connection, target, only_changed: bool) -> None:
+    state = sa_inspect(target)
+    state.info.pop("blob_plain", None)
+    plain = {}
+    for text_attr, hash_attr, inline_value in _OFFLOADED_FIELDS.get(type(target), ()):
+        if only_changed and not state.attrs[text_attr].history.has_changes():
+            continue
+        value = getattr(target, text_attr)
+        if _should_offload(value):
+            setattr(target, hash_attr, store_text(connection, value))
+            setattr(target, text_attr, inline_value)
+            plain[text_attr] = value
+        else:
+            setattr(target, hash_attr, None)
+
+    if isinstance(target, FileChangeLog) and not (only_changed and not state.attrs.ai_results.history.has_changes()):
+        value = target.ai_results
+        refs = None
+        if _should_offload(value):
+            models = _parse_model_results(value)
+            if models is not None:
+                # Per-model blobs share hashes with the GeneratedPost rows written for the same outputs.
+                refs = {"models": {name: store_text(connection, text) for name, text in models.items()}}
+            else:
+                refs = {"text": store_text(connection, value)}
+        target.ai_results_refs = json.dumps(refs) if refs else None
+        if refs:
+            target.ai_results = None
+            plain["ai_results"] = value
+
+    if plain:
+        state.info["blob_plain"] = plain
+
+
+def _restore_plain(target) -> None:
+    # Keep the in-memory object readable after flush without reloading it.
+    # The stash stays until the next flush so other after_* listeners can see what was offloaded.
+    plain = sa_inspect(target).info.get("blob_plain")
+    for attr, value in (plain or {}).items():
+        set_committed_value(target, attr, value)
+
+
+def offloaded_in_flush(target) -> Dict[str, str]:
+    """
+    Plain text of attributes offloaded during the current flush, for use from after_insert/after_update listeners.
+    """
+    return dict(sa_inspect(target).info.get("blob_plain") or {})
+
+
+def _ref_hashes(refs_json: str) -> set:
+    refs = json.loads(refs_json)
+    hashes = set(refs.get("models", {}).values())
+    if refs.get("text"):
+        hashes.add(refs["text"])
+    return hashes
+
+
+def _ref_text(refs_json: str, texts: Dict[str, str]) -> Optional[str]:
+    refs = json.loads(refs_json)
+    if "models" in refs:
+        if not all(h in texts for h in refs["models"].values()):
+            return None
+        return str({name: texts[h] for name, h in refs["models"].items()})
+    return texts.get(refs.get("text"))
+
+
+def _needed_hashes(target) -> set:
+    values = sa_inspect(target).dict
+    needed = set()
+    for text_attr, hash_attr, inline_value in _OFFLOADED_FIELDS.get(type(target), ()):
+        if values.get(hash_attr) and text_attr in values and values[text_attr] == inline_value:
+            needed.add(values[hash_attr])
+    if isinstance(target, FileChangeLog) and values.get("ai_results_refs") and values.get("ai_results") is None:
+        needed |= _ref_hashes(values["ai_results_refs"])
+    return needed
+
+
+def _apply(target, texts: Dict[str, str]) -> None:
+    values = sa_inspect(target).dict
+    for text_attr, hash_attr, inline_value in _OFFLOADED_FIELDS.get(type(target), ()):
+        h = values.get(hash_attr)
+        if h and text_attr in values and values[text_attr] == inline_value and h in texts:
+            set_committed_value(target, text_attr, texts[h])
+    if isinstance(target, FileChangeLog) and values.get("ai_results_refs") and values.get("ai_results") is None:
+        value = _ref_text(values["ai_results_refs"], texts)
+        if value is not None:
+            set_committed_value(target, "ai_results", value)
+
+
+def resolve_rows(connection, model, rows) -> list:
+    """
+    Plain-text copies of raw table rows (e.g. for export), with blob references resolved.
+    """
+    rows = [dict(r) for r in rows]
+    fields = _OFFLOADED_FIELDS.get(model, ())
+    needed = set()
+    for row in rows:
+        needed.update(row[hash_attr] for _, hash_attr, _ in fields if row.get(hash_attr))
+        if row.get("ai_results_refs"):
+            needed |= _ref_hashes(row["ai_results_refs"])
+    texts = load_texts(connection, needed) if needed else {}
+    for row in rows:
+        for text_attr, hash_attr, _ in fields:
+            if row.get(hash_attr) in texts:
+                row[text_attr] = texts[row[hash_attr]]
+        if row.get("ai_results_refs"):
+            value = _ref_text(row["ai_results_refs"], texts)
+            if value is not None:
+                row["ai_results"] = value
+    return rows
+
+
+def referenced_hashes(model, row) -> set:
+    """
+    Blob hashes a raw row of `model` points at.
+    """
+    hashes = {row[hash_attr] for _, hash_attr, _ in _OFFLOADED_FIELDS.get(model, ()) if row.get(hash_attr)}
+    if row.get("ai_results_refs"):
+        hashes |= _ref_hashes(row["ai_results_refs"])
+    return hashes
+
+
+def hydrate(session, targets) -> None:
+    """
+    Fill offloaded text attributes on loaded rows with a single blob lookup.
+    """
+    targets = list(targets)
+    needed = set()
+    for target in targets:
+        needed |= _needed_hashes(target)
+    if not needed:
+        return
+    texts = load_texts(session.connection(), needed)
+    for target in targets:
+        _apply(target, texts)
+
+
+@contextmanager
+def batched_hydration(session):
+    """
+    Defer blob lookups for rows loaded inside the block and resolve them in one batch on exit.
+    Use around list queries to avoid one blob query per row.
+    """
+    pending = []
+    session.info["blob_pending"] = pending
+    try:
+        yield
+    finally:
+        session.info.pop("blob_pending", None)
+    hydrate(session, pending)
+
+
+def _on_load(target, context):
+    session = context.session
+    if session is None:
+        return
+    pending = session.info.get("blob_pending")
+    if pending is not None:
+        pending.append(target)
+        return
+    hydrate(session, [target])
+
+
+def _on_refresh(target, context, attrs):
+    _on_load(target, context)
+
+
+for _model in _OFFLOADED_FIELDS:
+    event.listen(_model, "before_insert", lambda mapper, connection, target: _offload(connection, target, False))
+    event.listen(_model, "before_update", lambda mapper, connection, target: _offload(connection, target, True))
+    event.listen(_model, "after_insert", lambda mapper, connection, target: _restore_plain(target))
+    event.listen(_model, "after_update", lambda mapper, connection, target: _restore_plain(target))
+    event.listen(_model, "load", _on_load)
+    event.listen(_model, "refresh", _on_refresh)
@@ -1,9 +1,15 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+from sqlalchemy import create_engine, event, Column, Integer, BigInteger, String, Text, DateTime, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.dml import Delete, Insert, Update
+from contextlib import contextmanager
+from functools import lru_cache
+import threading
 from sqlalchemy.sql import func
 from datetime import datetime
 from settings import get_settings
+from metrics import instrument_engine
+import querystats
 
 def _with_sslmode(url: str, sslmode: str | None) -> str:
     if not sslmode:
@@ -19,35 +25,127 @@ def _default_sqlite_url() -> str:
     return "sqlite:///./autosocial.db"
 
 
-settings = get_settings()
-DATABASE_URL = settings.database_url or _default_sqlite_url()
-DATABASE_URL = _with_sslmode(DATABASE_URL, settings.db_sslmode)
-
-# Engine options
-connect_args = {}
-engine_kwargs = {}
-if DATABASE_URL.startswith("sqlite"):
-    # Allow multi-threaded use in dev.
-    connect_args = {"check_same_thread": False}
-else:
-    # Sensible defaults for Postgres in containers.
-    engine_kwargs = {
-        "pool_size": settings.db_pool_size,
-        "max_overflow": settings.db_max_overflow,
-    }
-
-# Create database engine
-engine = create_engine(
-    DATABASE_URL,
-    echo=settings.db_echo,
-    pool_pre_ping=True,
-    future=True,
-    connect_args=connect_args,
-    **engine_kwargs,
-)
-
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def sqlite_pragmas(settings) -> list:
+    """
+    Per-connection pragmas for the tuned SQLite profile (SQLITE_TUNED=true).
+    WAL lets readers run alongside the single writer; synchronous=NORMAL is durable in WAL mode
+    except for the last transactions before a power loss.
+    """
+    if not settings.sqlite_tuned:
+        return []
+    return [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}",
+        f"PRAGMA mmap_size={int(settings.sqlite_mmap_bytes)}",
+        f"PRAGMA cache_size=-{int(settings.sqlite_cache_kb)}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+def configure_sqlite(engine, pragmas, single_writer=False):
+    """
+    Apply pragmas on every new connection and optionally serialize writes within the process.
+    """
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    if not single_writer:
+        return
+
+    # pysqlite opens a transaction right before the first INSERT/UPDATE/DELETE, so taking the lock
+    # there and releasing it at commit/rollback makes write transactions queue in-process instead
+    # of spinning on SQLite's busy handler.
+    write_lock = threading.RLock()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _acquire_write_lock(conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get("sqlite_write_lock"):
+            return
+        if statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE", "REPLAC"):
+            write_lock.acquire()
+            conn.info["sqlite_write_lock"] = True
+
+    def _release_write_lock(conn):
+        if conn.info.pop("sqlite_write_lock", False):
+            write_lock.release()
+
+    event.listen(engine, "commit", _release_write_lock)
+    event.listen(engine, "rollback", _release_write_lock)
+
+    @event.listens_for(engine, "checkin")
+    def _release_on_checkin(dbapi_connection, connection_record):
+        # Connections returned without an explicit commit/rollback are reset by the pool.
+        if connection_record.info.pop("sqlite_write_lock", False):
+            write_lock.release()
+
+
+def database_url(settings=None) -> str:
+    settings = settings or get_settings()
+    return _with_sslmode(settings.database_url or _default_sqlite_url(), settings.db_sslmode)
+
+
+@lru_cache
+def get_engine():
+    """
+    The process-wide engine, created on first use so importing the app stays cheap.
+    """
+    settings = get_settings()
+    url = database_url(settings)
+
+    # Engine options
+    connect_args = {}
+    engine_kwargs = {}
+    if url.startswith("sqlite"):
+        # Allow multi-threaded use in dev.
+        connect_args = {"check_same_thread": False}
+        if settings.sqlite_tuned:
+            connect_args["timeout"] = settings.sqlite_busy_timeout_ms / 1000.0
+    else:
+        # Sensible defaults for Postgres in containers.
+        engine_kwargs = {
+            "pool_size": settings.db_pool_size,
+            "max_overflow": settings.db_max_overflow,
+        }
+
+    engine = create_engine(
+        url,
+        echo=settings.db_echo,
+        pool_pre_ping=True,
+        future=True,
+        connect_args=connect_args,
+        **engine_kwargs,
+    )
+    if url.startswith("sqlite"):
+        configure_sqlite(engine, sqlite_pragmas(settings), single_writer=settings.sqlite_single_writer)
+    if settings.metrics_enabled:
+        instrument_engine(engine)
+    if settings.query_stats_enabled:
+        querystats.instrument_engine(engine)
+    track_table_versions(engine)
+    return engine
+
+
+def __getattr__(name):
+    # `from db import engine` keeps working, at the cost of creating the engine on import.
+    if name == "engine":
+        return get_engine()
+    if name == "DATABASE_URL":
+        return database_url()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _LazyBindSession(Session):
+    def __init__(self, bind=None, **kwargs):
+        super().__init__(bind=bind if bind is not None else get_engine(), **kwargs)
+
+
+# Create session factory; sessions bind to the engine when first opened
+SessionLocal = sessionmaker(class_=_LazyBindSession, autocommit=False, autoflush=False)
 
 # Base class for models
 Base = declarative_base()
@@ -60,6 +158,14 @@ class GeneratedPost(Base):
     content = Column(Text, nullable=False)
     status = Column(String, default="pending")  # pending, approved, rejected, posted
     platform = Column(String, nullable=True)    # Set when posted
+    content_hash = Column(String(64), nullable=True, index=True)  # content_blobs.hash when offloaded
+    created_at = Column(DateTime, default=func.now(), index=True)
+    fingerprint = Column(String(64), nullable=True, index=True)  # sha256 of normalized content
+    simhash = Column(BigInteger, nullable=True)  # 64-bit SimHash, stored signed
+    duplicate_of = Column(Integer, nullable=True, index=True)  # earliest matching post when linked
+    scheduled_at = Column(DateTime, nullable=True, index=True)  # local time its publish jobs become due
+    session_id = Column(Integer, nullable=True, index=True)  # watch_session_logs.id when generated by a session
+    trace_id = Column(String(32), nullable=True, index=True)  # trace from the file event (see tracing.py)
 
 class SessionSummaryPost(Base):
     __tablename__ = "session_summary_posts"
@@ -85,25 +191,161 @@ class FileChangeLog(Base):
     file_path = Column(String, nullable=False)
     diff_summary = Column(Text, nullable=True)
     ai_results = Column(Text, nullable=True)  # Store as JSON string
+    diff_hash = Column(String(64), nullable=True, index=True)  # content_blobs.hash when offloaded
+    ai_results_refs = Column(Text, nullable=True)  # JSON blob references when offloaded
+    created_at = Column(DateTime, default=func.now(), index=True)
+    trace_id = Column(String(32), nullable=True, index=True)
+
+class TableVersion(Base):
+    """
+    Change counter per table, bumped once per transaction that inserts, updates or deletes rows.
+    Together with max(id) it stamps a table's contents; see list_cache.py. max(id) alone is not enough:
+    on Postgres a lower id can commit after a higher one.
+    """
+    __tablename__ = "table_versions"
+    table_name = Column(String(64), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+# Tables whose list endpoints are served with ETags
+VERSIONED_TABLES = ("generated_posts", "watch_session_logs", "file_change_logs")
 
 # NOTE: API key storage model lives in secrets_store.py (ApiCredential) but shares this Base.
+# NOTE: Compressed text storage lives in blob_store.py (ContentBlob) and hooks into the models above.
+# NOTE: Duplicate detection (PostSignatureBand) lives in dedupe.py and fills the signature columns above.
+# NOTE: Publishing outbox (PublishJob) lives in outbox.py.
+# NOTE: Publishing budgets (RateLimitBudget) live in ratelimit.py.
+# NOTE: Cached trending topics (TrendsCacheEntry) live in trends.py.
+# NOTE: Once-per-period claims for scheduled tasks (ScheduledRun) live in scheduler.py.
+# NOTE: Watch-session checkpoints (WatchSessionCheckpoint, WatchSessionFile) live in watch_checkpoint.py.
 
 # --- DB Utility Functions ---
 
+def _add_missing_columns():
+    """
+    Add columns introduced after a table was first created.
+    create_all() only creates missing tables, so existing installs need this to pick up new nullable columns.
+    """
+    engine = get_engine()
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
+                if column.default is not None and column.default.is_clause_element:
+                    # e.g. created_at: existing rows get the migration time rather than NULL.
+                    conn.execute(table.update().where(column.is_(None)).values({column.name: column.default.arg}))
+                for index in table.indexes:
+                    if column.name in index.columns:
+                        index.create(conn, checkfirst=True)
+
 def create_all_tables():
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
+    _add_missing_columns()
+    _seed_table_versions()
+
+def _seed_table_versions():
+    # Rows must exist up front: bumping only UPDATEs them, so concurrent first writes can't collide on INSERT.
+    with get_engine().begin() as conn:
+        existing = set(conn.execute(text("SELECT table_name FROM table_versions")).scalars())
+        for name in VERSIONED_TABLES:
+            if name not in existing:
+                conn.execute(TableVersion.__table__.insert().values(table_name=name, version=0))
+
+def track_table_versions(engine):
+    """
+    Bump table_versions in the same transaction as any INSERT/UPDATE/DELETE on a versioned table, whether
+    it comes from an ORM flush, a Core bulk statement or retention. The bump row-locks the counter until
+    commit, so writers to one table commit in bump order and every commit changes the stamp.
+    """
+    versions = TableVersion.__table__
+
+    @event.listens_for(engine, "after_execute")
+    def _bump(conn, clauseelement, multiparams, params, execution_options, result):
+        if not isinstance(clauseelement, (Insert, Update, Delete)):
+            return
+        name = getattr(clauseelement.table, "name", None)
+        if name not in VERSIONED_TABLES:
+            return
+        bumped = conn.info.setdefault("bumped_table_versions", set())
+        if name in bumped:
+            return
+        bumped.add(name)
+        conn.execute(versions.update().where(versions.c.table_name == name).values(version=versions.c.version + 1))
+
+    def _reset(conn):
+        conn.info.pop("bumped_table_versions", None)
+
+    event.listen(engine, "commit", _reset)
+    event.listen(engine, "rollback", _reset)
+
+    @event.listens_for(engine, "checkin")
+    def _reset_on_checkin(dbapi_connection, connection_record):
+        # Connections returned without an explicit commit/rollback are reset by the pool.
+        connection_record.info.pop("bumped_table_versions", None)
+
+def table_stamp(conn, table_name: str) -> str:
+    """
+    "<max id>.<version>" for a versioned table; changes whenever its rows do.
+    """
+    if table_name not in VERSIONED_TABLES:
+        raise ValueError(f"{table_name} is not versioned")
+    row = conn.execute(
+        text(
+            f"SELECT (SELECT max(id) FROM {table_name}), "
+            "(SELECT version FROM table_versions WHERE table_name = :name)"
+        ),
+        {"name": table_name},
+    ).one()
+    return f"{row[0] or 0}.{row[1] or 0}"
 
 def get_session():
     return SessionLocal()
 
+@contextmanager
+def advisory_lock(key):
+    """
+    Run a block at most once across workers.
+    Uses a Postgres session-level advisory lock held on a dedicated connection; other databases always acquire.
+    Yields True when the lock was taken.
+    """
+    engine = get_engine()
+    if not engine.dialect.name.startswith("postgres"):
+        yield True
+        return
+    with engine.connect() as conn:
+        taken = bool(conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": key}).scalar())
+        conn.commit()
+        try:
+            yield taken
+        finally:
+            if taken:
+                try:
+                    conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                    conn.commit()
+                except Exception:
+                    pass
+
 # CRUD for GeneratedPost
 def add_generated_post(file, content, status="pending", platform=None):
+    from dedupe import existing_duplicate
+    from write_queue import write_queue
+
     db = get_session()
-    post = GeneratedPost(file=file, content=content, status=status, platform=platform)
-    db.add(post)
-    db.commit()
-    db.refresh(post)
+    duplicate_id = existing_duplicate(db, content)
+    if duplicate_id is not None:
+        post = db.query(GeneratedPost).filter(GeneratedPost.id == duplicate_id).first()
+        db.close()
+        return post
     db.close()
+    post = GeneratedPost(file=file, content=content, status=status, platform=platform)
+    # Committed by the batching writer thread; wait so callers get a persisted row.
+    write_queue.submit(post).result()
     return post
 
 def update_generated_post_content(post_id, new_content):
@@ -127,8 +369,11 @@ def set_generated_post_status(post_id, status):
     return post
 
 def list_generated_posts():
+    from blob_store import batched_hydration
+
     db = get_session()
-    posts = db.query(GeneratedPost).all()
+    with batched_hydration(db):
+        posts = db.query(GeneratedPost).all()
     result = [
         {
             "id": p.id,
@@ -136,7 +381,10 @@ def list_generated_posts():
             "content": str(p.content),
             "status": p.status,
             "platform": p.platform,
-            "type": "custom" if p.file == "custom" else "ai"
+            "type": "custom" if p.file == "custom" else "ai",
+            "duplicate_of": p.duplicate_of,
+            "scheduled_at": p.scheduled_at.isoformat() if p.scheduled_at else None,
+            "session_id": p.session_id,
         }
         for p in posts
     ]
@@ -178,14 +426,13 @@ def update_watch_session_log(session_id, ended_at, result_summary):
 
 # CRUD for FileChangeLog
 def add_file_change_log(session_id, file_path, diff_summary, ai_results):
-    db = get_session()
+    from write_queue import write_queue
+
     file_log = FileChangeLog(
         session_id=session_id,
         file_path=file_path,
         diff_summary=diff_summary,
         ai_results=ai_results
     )
-    db.add(file_log)
-    db.commit()
-    db.close()
+    write_queue.submit(file_log).result()
     return file_log
\ No newline at end of file
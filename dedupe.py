@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Column, Index, Integer, event, select
+from sqlalchemy import inspect as sa_inspect
+
+from blob_store import offloaded_in_flush
+from db import Base, GeneratedPost
+from settings import get_settings
+
+# 64-bit SimHash split into 6 bands of 10-11 bits: two signatures within Hamming distance 5
+# always share at least one band exactly, so banded lookups find every candidate.
+_BAND_WIDTHS = (11, 11, 11, 11, 10, 10)
+_MAX_SUPPORTED_DISTANCE = len(_BAND_WIDTHS) - 1
+# Caps the work per lookup when a bucket is very common (e.g. boilerplate error strings).
+_MAX_CANDIDATES_PER_BAND = 200
+
+
+class PostSignatureBand(Base):
+    """
+    LSH index over GeneratedPost.simhash: one row per (post, band).
+    """
+
+    __tablename__ = "post_signature_bands"
+
+    id = Column(Integer, primary_key=True)
+    post_id = Column(Integer, nullable=False, index=True)
+    band = Column(Integer, nullable=False)
+    bucket = Column(Integer, nullable=False)
+
+    __table_args__ = (Index("ix_post_signature_bands_lookup", "band", "bucket"),)
+
+
+def normalize(content: str) -> str:
+    return re.sub(r"\s+", " ", (content or "").lower()).strip()
+
+
+def fingerprint(content: str) -> str:
+    return hashlib.sha256(normalize(content).encode("utf-8")).hexdigest()
+
+
+def simhash(content: str) -> int:
+    """
+    64-bit SimHash over the words of the normalized text (unsigned).
+    Single words rather than shingles keep signatures stable for short, post-sized text.
+    """
+    words = re.findall(r"\w+", normalize(content)) or [""]
+    weights = [0] * 64
+    for word in words:
+        h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def _to_signed(value: int) -> int:
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def _bands(signature: int):
+    bands = []
+    shift = 0
+    for band, width in enumerate(_BAND_WIDTHS):
+        bands.append((band, (signature >> shift) & ((1 << width) - 1)))
+        shift += width
+    return bands
+
+
+def _max_distance() -> int:
+    return max(0, min(get_settings().dedupe_max_distance, _MAX_SUPPORTED_DISTANCE))
+
+
+def find_duplicate(connection, content: str, exclude_id: Optional[int] = None) -> Tuple[str, int, Optional[int]]:
+    """
+    Return (fingerprint, unsigned simhash, id of the earliest exact or near duplicate or None).
+    """
+    fp = fingerprint(content)
+    sig = simhash(content)
+    posts = GeneratedPost.__table__
+    exclude = [posts.c.id != exclude_id] if exclude_id is not None else []
+
+    exact = connection.execute(
+        select(posts.c.id).where(posts.c.fingerprint == fp, *exclude).order_by(posts.c.id).limit(1)
+    ).scalar()
+    if exact is not None:
+        return fp, sig, exact
+
+    candidates = set()
+    bands = PostSignatureBand.__table__
+    for band, bucket in _bands(sig):
+        candidates.update(
+            connection.execute(
+                select(bands.c.post_id).where(bands.c.band == band, bands.c.bucket == bucket).limit(_MAX_CANDIDATES_PER_BAND)
+            ).scalars()
+        )
+    candidates.discard(exclude_id)
+    if not candidates:
+        return fp, sig, None
+    max_distance = _max_distance()
+    rows = connection.execute(select(posts.c.id, posts.c.simhash).where(posts.c.id.in_(candidates), posts.c.simhash.isnot(None)))
+    matches = [post_id for post_id, other in rows if bin(sig ^ _to_unsigned(other)).count("1") <= max_distance]
+    return fp, sig, (min(matches) if matches else None)
+
+
+def existing_duplicate(db, content: str) -> Optional[int]:
+    """
+    In suppress mode, the id of the post a new draft with `content` would duplicate; otherwise None.
+    Call before creating a GeneratedPost to skip the insert.
+    """
+    if (get_settings().dedupe_mode or "").strip().lower() != "suppress":
+        return None
+    return find_duplicate(db.connection(), content)[2]
+
+
+def _content(target) -> str:
+    return offloaded_in_flush(target).get("content", target.content) or ""
+
+
+def _sign(connection, target, is_insert: bool) -> None:
+    mode = (get_settings().dedupe_mode or "").strip().lower()
+    if mode == "off":
+        return
+    if not is_insert and "content" not in offloaded_in_flush(target) and not sa_inspect(target).attrs.content.history.has_changes():
+        return
+    fp, sig, dup_id = find_duplicate(connection, _content(target), exclude_id=None if is_insert else target.id)
+    target.fingerprint = fp
+    target.simhash = _to_signed(sig)
+    target.duplicate_of = dup_id
+    sa_inspect(target).info["signature_changed"] = True
+
+
+def _replace_bands(connection, signatures: Dict[int, int]) -> None:
+    # post id -> signed simhash
+    bands = PostSignatureBand.__table__
+    connection.execute(bands.delete().where(bands.c.post_id.in_(list(signatures))))
+    connection.execute(
+        bands.insert(),
+        [
+            {"post_id": post_id, "band": band, "bucket": bucket}
+            for post_id, sig in signatures.items()
+            for band, bucket in _bands(_to_unsigned(sig))
+        ],
+    )
+
+
+def _write_bands(connection, target) -> None:
+    if not sa_inspect(target).info.pop("signature_changed", False):
+        return
+    _replace_bands(connection, {target.id: target.simhash})
+
+
+def sign_rows(connection, rows: List[dict]) -> bool:
+    """
+    For bulk UPDATEs of existing posts, which skip the flush listeners: add fingerprint, simhash and
+    duplicate_of to raw row dicts holding "id" and plain "content", in place. Returns False (adding
+    nothing) when duplicate detection is off. Call write_signatures() after the UPDATE.
+    """
+    if (get_settings().dedupe_mode or "").strip().lower() == "off":
+        return False
+    for row in rows:
+        fp, sig, dup_id = find_duplicate(connection, row["content"] or "", exclude_id=row["id"])
+        row.update(fingerprint=fp, simhash=_to_signed(sig), duplicate_of=dup_id)
+    return True
+
+
+def write_signatures(connection, rows: List[dict]) -> None:
+    """
+    Replace the band rows of posts signed by sign_rows(), with one DELETE and one INSERT.
+    """
+    if rows:
+        _replace_bands(connection, {row["id"]: row["simhash"] for row in rows})
+
+
+def remove_signatures(connection, post_ids) -> None:
+    if post_ids:
+        bands = PostSignatureBand.__table__
+        connection.execute(bands.delete().where(bands.c.post_id.in_(list(post_ids))))
+
+
+def backfill_signatures(batch_size: int = 500) -> int:
+    """
+    Sign posts written before duplicate detection existed. Returns rows signed.
+    """
+    from blob_store import batched_hydration
+    from db import SessionLocal
+
+    signed = 0
+    while True:
+        db = SessionLocal()
+        try:
+            with batched_hydration(db):
+                rows = (
+                    db.query(GeneratedPost)
+                    .filter(GeneratedPost.fingerprint.is_(None))
+                    .order_by(GeneratedPost.id)
+                    .limit(batch_size)
+                    .all()
+                )
+            conn = db.connection()
+            for row in rows:
+                # Only link to earlier posts, matching what an in-order insert would have found.
+                fp, sig, dup_id = find_duplicate(conn, row.content or "", exclude_id=row.id)
+                row.fingerprint = fp
+                row.simhash = _to_signed(sig)
+                row.duplicate_of = dup_id if dup_id is not None and dup_id < row.id else None
+                sa_inspect(row).info["signature_changed"] = True
+            db.commit()
+            signed += len(rows)
+        finally:
+            db.close()
+        if len(rows) < batch_size:
+            return signed
+
+
+event.listen(GeneratedPost, "before_insert", lambda mapper, connection, target: _sign(connection, target, True))
+event.listen(GeneratedPost, "before_update", lambda mapper, connection, target: _sign(connection, target, False))
+event.listen(GeneratedPost, "after_insert", lambda mapper, connection, target: _write_bands(connection, target))
+event.listen(GeneratedPost, "after_update", lambda mapper, connection, target: _write_bands(connection, target))
+event.listen(GeneratedPost, "after_delete", lambda mapper, connection, target: remove_signatures(connection, [target.id]))
@@ -0,0 +1,62 @@
+"""
+JSON encoding for API responses: orjson when installed, the standard library otherwise.
+
+FastJSONResponse is the app's default response class. Endpoints that return large payloads (the list
+endpoints, watch-session results) hand it plain dicts directly, which also skips FastAPI's
+jsonable_encoder pass over every nested value; dumps() falls back to jsonable_encoder only for the
+values it cannot encode itself. NDJSONResponse streams newline-delimited JSON, one object per line.
+"""
+from __future__ import annotations
+
+import json
+from datetime import date, datetime, time
+from typing import Any, Iterable
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse, StreamingResponse
+
+try:  # optional: several times faster than json.dumps on large nested results
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return jsonable_encoder(obj)
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Compact UTF-8 JSON for content, matching Starlette's JSONResponse output for plain data.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def ndjson_lines(items: Iterable[Any]) -> bytes:
+    """
+    One JSON document per item, each terminated by a newline.
+    """
+    return b"".join(dumps(item) + b"\n" for item in items)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class NDJSONResponse(StreamingResponse):
+    """
+    Streams an iterable of already encoded NDJSON chunks (see ndjson_lines).
+    """
+
+    media_type = NDJSON_MEDIA_TYPE
@@ -0,0 +1,197 @@
+"""
+Git-backed baselines for watch sessions on git working trees.
+
+Instead of reading every file at session start, a session on a work tree records:
+- the HEAD commit (the empty tree in a repository without commits),
+- the blob ids of changes staged at that moment,
+- the content of files that were modified in the work tree or untracked (usually a handful).
+
+At the end, the files to diff are the ones git reports as different from the recorded commit, committed
+or not, plus the ones that were already dirty. Their start content comes back from the recorded blobs,
+read locally from .git with `git cat-file`.
+
+Only read-only plumbing is run, with optional index locks disabled, so a work tree mounted read-only
+(e.g. the host filesystem in Docker) works too. Without a git executable, outside a work tree, or in a
+repository owned by another user, sessions fall back to scanning files (see main.py).
+
+Watched paths come from API callers, so git's ownership check (safe.directory) is left on: a repository's
+own config could otherwise run commands here (core.fsmonitor, diff drivers). Trusting a mounted tree is
+the operator's call, in the app user's global git config. Commands that could run a configured program
+are switched off on every call as well.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import subprocess
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+# `git hash-object -t tree /dev/null`; git resolves it without it being stored.
+EMPTY_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+_TIMEOUT_SECONDS = 60
+# Same heuristic as git: a NUL byte near the start means binary.
+_BINARY_SNIFF_BYTES = 8000
+# No fsmonitor daemon, hooks or external diff/textconv programs, whatever the repository configures.
+_SAFE_CONFIG = ("-c", "core.fsmonitor=false", "-c", "core.hooksPath=/dev/null", "-c", "core.quotepath=off")
+_NO_DIFF_PROGRAMS = ("--no-ext-diff", "--no-textconv")
+
+logger = logging.getLogger("autosocial.watch")
+
+
+class GitError(RuntimeError):
+    pass
+
+
+@dataclass
+class Snapshot:
+    head: str
+    # Absolute path -> staged blob id
+    staged: Dict[str, str] = field(default_factory=dict)
+    # Absolute path -> work tree content, for files modified, deleted ("") or untracked at the start
+    dirty: Dict[str, str] = field(default_factory=dict)
+
+
+def _git(cwd: str, *args: str, input: Optional[bytes] = None) -> bytes:
+    env = dict(os.environ, GIT_OPTIONAL_LOCKS="0", GIT_TERMINAL_PROMPT="0", LC_ALL="C")
+    try:
+        out = subprocess.run(
+            ["git", *_SAFE_CONFIG, *args],
+            cwd=cwd,
+            env=env,
+            input=input,
+            capture_output=True,
+            timeout=_TIMEOUT_SECONDS,
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        raise GitError(str(e)) from e
+    if out.returncode != 0:
+        raise GitError(out.stderr.decode("utf-8", "replace").strip() or f"git {args[0]} exited with {out.returncode}")
+    return out.stdout
+
+
+def _paths(output: bytes) -> List[str]:
+    return [p.decode("utf-8", "surrogateescape") for p in output.split(b"\0") if p]
+
+
+def is_work_tree(path: str) -> bool:
+    """
+    Whether path is a directory inside a git work tree and a git executable is available.
+    """
+    if not os.path.isdir(path) or shutil.which("git") is None:
+        return False
+    try:
+        return _git(path, "rev-parse", "--is-inside-work-tree").strip() == b"true"
+    except GitError as e:
+        if "dubious ownership" in str(e):
+            logger.warning("%s is owned by another user; git will not read it, so files are scanned instead", path)
+        return False
+
+
+def _head(path: str) -> str:
+    try:
+        return _git(path, "rev-parse", "--verify", "-q", "HEAD").decode().strip()
+    except GitError:
+        return EMPTY_TREE  # no commits yet
+
+
+def _readable(file_path: str, max_bytes: int) -> Optional[str]:
+    # Text content of a file the session can diff, like the file scan accepts; None otherwise.
+    try:
+        if os.path.islink(file_path) or not os.path.isfile(file_path) or os.path.getsize(file_path) > max_bytes:
+            return None
+        with open(file_path, "rb") as f:
+            raw = f.read()
+    except OSError:
+        return None
+    if b"\0" in raw[:_BINARY_SNIFF_BYTES]:
+        return None
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+def snapshot(path: str, max_bytes: int) -> Snapshot:
+    """
+    Record the start state of the work tree under path (a directory).
+    """
+    snap = Snapshot(head=_head(path))
+    # Index vs HEAD: ":<old mode> <new mode> <old id> <new id> <status>\0<path>\0"
+    fields = _git(
+        path, "diff", "--cached", "--raw", "--no-abbrev", "-z", "--no-renames", "--relative", *_NO_DIFF_PROGRAMS, snap.head
+    ).split(b"\0")
+    for meta, rel in zip(fields[0::2], fields[1::2]):
+        if not meta:
+            continue
+        new_id = meta.split()[3].decode()
+        file_path = os.path.join(path, rel.decode("utf-8", "surrogateescape"))
+        if set(new_id) == {"0"}:
+            snap.dirty[file_path] = ""  # staged deletion
+        else:
+            snap.staged[file_path] = new_id
+    modified = _paths(_git(path, "diff-files", "--name-only", "-z", "--relative", *_NO_DIFF_PROGRAMS))
+    untracked = _paths(_git(path, "ls-files", "--others", "--exclude-standard", "-z"))
+    for rel in modified + untracked:
+        file_path = os.path.join(path, rel)
+        if not os.path.lexists(file_path):
+            snap.dirty[file_path] = ""  # deleted in the work tree
+            continue
+        content = _readable(file_path, max_bytes)
+        if content is not None:
+            snap.dirty[file_path] = content
+    return snap
+
+
+def changed_files(path: str, head: str, max_bytes: int) -> List[str]:
+    """
+    Files under path that differ from commit head now: committed since, staged, modified, deleted or
+    untracked. Binary and oversized files are left out.
+    """
+    changed = []
+    # "<added>\t<deleted>\t<path>\0"; binary files show "-\t-".
+    for entry in _paths(_git(path, "diff", "--numstat", "-z", "--no-renames", "--relative", *_NO_DIFF_PROGRAMS, head)):
+        added, _, rel = entry.split("\t", 2)
+        if added == "-":
+            continue
+        file_path = os.path.join(path, rel)
+        if os.path.lexists(file_path) and _readable(file_path, max_bytes) is None:
+            continue
+        changed.append(file_path)
+    for rel in _paths(_git(path, "ls-files", "--others", "--exclude-standard", "-z")):
+        file_path = os.path.join(path, rel)
+        if _readable(file_path, max_bytes) is not None:
+            changed.append(file_path)
+    return changed
+
+
+def read_objects(path: str, specs: Iterable[str]) -> Dict[str, Optional[bytes]]:
+    """
+    Contents of blobs by object name (an id, or "<commit>:./<path relative to path>"); None when missing.
+    One `git cat-file --batch` call for all of them.
+    """
+    specs = list(dict.fromkeys(specs))
+    if not specs:
+        return {}
+    out = _git(path, "cat-file", "--batch", input="".join(f"{s}\n" for s in specs).encode("utf-8", "surrogateescape"))
+    objects: Dict[str, Optional[bytes]] = {}
+    pos = 0
+    for spec in specs:
+        end = out.index(b"\n", pos)
+        header = out[pos:end].split()
+        pos = end + 1
+        if len(header) != 3:  # "<spec> missing" / "ambiguous"
+            objects[spec] = None
+            continue
+        size = int(header[2])
+        objects[spec] = out[pos:pos + size] if header[1] == b"blob" else None
+        pos += size + 1
+    return objects
+
+
+def relative_spec(commit: str, root: str, file_path: str) -> str:
+    """
+    Object name of file_path (under root) in commit, for read_objects(root, ...).
+    """
+    return f"{commit}:./{os.path.relpath(file_path, root).replace(os.sep, '/')}"
@@ -0,0 +1,38 @@
+"""
+Gunicorn hooks (loaded automatically from the working directory).
+
+prometheus_client keeps per-worker samples in PROMETHEUS_MULTIPROC_DIR so /metrics can aggregate all
+workers. The directory must exist and be empty before workers import the app, and a dead worker's live
+gauges must be dropped when it exits.
+
+The schema is brought up to date once, in a separate process before any worker starts, so workers skip
+table creation at startup. A failed migration leaves AUTO_MIGRATE alone and the workers retry it.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+def on_starting(server):
+    path = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "autosocial-metrics"))
+    # Samples left over from a previous master would be summed into the new one's counters.
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+    if os.environ.get("AUTO_MIGRATE", "").lower() not in ("0", "false", "no"):
+        # A subprocess keeps the engine and settings cache out of the master that workers fork from. It
+        # runs without the multiprocess directory so its samples aren't left there for /metrics to sum.
+        env = {k: v for k, v in os.environ.items() if k != "PROMETHEUS_MULTIPROC_DIR"}
+        migrate = subprocess.run([sys.executable, "-m", "migrate"], cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+        if migrate.returncode == 0:
+            os.environ["AUTO_MIGRATE"] = "false"
+        else:
+            server.log.warning("Migration failed; workers will create tables at startup")
+
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
@@ -0,0 +1,120 @@
+"""
+Conditional GET and an in-process response cache for list endpoints.
+
+A list is identified by its table's stamp (max id + table_versions counter, see db.table_stamp) and the
+request's query string. The ETag is derived from both, so an unchanged refresh costs one stamp query and
+either a 304 or the cached JSON body; any insert, update or delete (from any worker) changes the stamp,
+which both invalidates the ETag and makes the cached body miss.
+
+stream_ndjson serves the same rows as newline-delimited JSON without building the whole list: rows are
+read in id order, a batch at a time, each batch in its own short session.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from blob_store import batched_hydration
+from db import SessionLocal, table_stamp
+from fastjson import NDJSONResponse, dumps, ndjson_lines
+from settings import get_settings
+
+
+class ResponseCache:
+    """
+    Small LRU of serialized bodies keyed by (path, query), each remembered with the ETag it was built for.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key: Tuple[str, str], etag: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Tuple[str, str], etag: str, body: bytes) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+cache = ResponseCache(get_settings().list_cache_size)
+
+NDJSON_BATCH_SIZE = 500
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+
+def cached_list(request: Request, table: str, build: Callable[[], Any]) -> Response:
+    """
+    Serve build()'s JSON for a list over `table`, answering 304 or from cache while the table is unchanged.
+    """
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    key = (request.url.path, query)
+    db = SessionLocal()
+    try:
+        stamp = table_stamp(db.connection(), table)
+    finally:
+        db.close()
+    # Weak: the GZip middleware may re-encode the body, which a strong validator would not allow.
+    etag = 'W/"' + hashlib.sha256(f"{table}:{stamp}:{key[0]}?{key[1]}".encode()).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    body = cache.get(key, etag)
+    if body is None:
+        # Built after the stamp was read, so the body is never older than the ETag it is stored under.
+        body = dumps(build())
+        cache.put(key, etag, body)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _row_batches(model, to_dict: Callable[[Any], dict], batch_size: int) -> Iterator[bytes]:
+    last_id = 0
+    while True:
+        db = SessionLocal()
+        try:
+            with batched_hydration(db):
+                rows = db.query(model).filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+            if not rows:
+                return
+            last_id = rows[-1].id
+            chunk = ndjson_lines(to_dict(row) for row in rows)
+        finally:
+            db.close()
+        yield chunk
+
+
+def stream_ndjson(model, to_dict: Callable[[Any], dict], batch_size: int = NDJSON_BATCH_SIZE) -> NDJSONResponse:
+    """
+    Stream every row of model (which needs an integer id) as one to_dict() object per line.
+    """
+    return NDJSONResponse(_row_batches(model, to_dict, batch_size), headers={"Cache-Control": "no-cache"})
@@ -4,15 +4,14 @@ import random
 import requests
 import threading
 import difflib
+import functools
 from pathlib import Path
 from fastapi import FastAPI, Request, BackgroundTasks, Body, Query, Header, HTTPException, status, Depends
 from pydantic import BaseModel
 from typing import Dict, List, Any, Optional
 from ai import askall_models as query_all_models
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.middleware.gzip import GZipMiddleware
 from settings import get_settings
 from db import (
     GeneratedPost,
@@ -30,17 +29,50 @@ from db import (
     add_file_change_log,
     SessionLocal,
     Base,
-    engine,
+    advisory_lock,
 )
-from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy import Column, Integer, String, Text, DateTime, select, update
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import func
-from sqlalchemy import text
-from social import fetch_x_trending_topics, fetch_linkedin_trending_topics, post_to_x, post_to_linkedin
+from social import fetch_linkedin_trending_topics
+from trends import trends_cache
+from ratelimit import rate_limiter
 from datetime import datetime, timedelta
 from prompt_templates import DEFAULT_PROMPT
-from fastapi_utils.tasks import repeat_every
 from secrets_store import set_credential, credential_status, delete_credentials, get_credential
+from blob_store import batched_hydration, offload_rows
+from retention import run_retention
+from dedupe import backfill_signatures, existing_duplicate, sign_rows, write_signatures
+from write_queue import write_queue
+import metrics
+import tracing
+import querystats
+import watch_checkpoint
+import git_baseline
+from profiling import profiler, wants_profile
+from static_assets import PrecompressedStaticFiles, respond
+from list_cache import cached_list, stream_ndjson
+from fastjson import FastJSONResponse
+from watch_events import broker as watch_broker, format_sse
+from scheduler import first_of_next_month, month_period, scheduler
+from outbox import (
+    PUBLISHABLE_STATUSES,
+    PUBLISHERS,
+    PublishJob,
+    enqueue_publish,
+    enqueue_publish_many,
+    job_to_dict,
+    publish_workers,
+    resolve_unknown,
+)
+from search import (
+    DOC_TYPES as SEARCH_DOC_TYPES,
+    ensure_search_index,
+    index_is_empty,
+    index_rows,
+    rebuild_index,
+    search as search_documents,
+)
 
 # Store session state for watch session (move this to the top)
 watch_session = {
@@ -50,10 +82,24 @@ watch_session = {
     "stop_event": None,
     "path": None,
     "end_time": None,
-    "results": None
+    "results": None,
+    # Path -> SpanContext of its first event, so finalize continues each file's trace
+    "event_spans": {},
+    # watch_session_logs.id of the running session (checkpointed in watch_checkpoint.py)
+    "session_id": None,
+    # Set on shutdown: the session is handed over instead of finalized
+    "draining": False,
+    # Session this worker stopped running without finishing it
+    "suspended": None,
+    # Pending lease renewal (a write-queue Future), when it was queued and when a renewal last succeeded
+    "renewal": None,
+    "renewal_sent_at": 0.0,
+    "lease_confirmed_at": 0.0,
+    # Start commit when the session diffs against git instead of a file scan (see git_baseline.py)
+    "git_head": None,
 }
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Basic logging config (safe defaults for containers + local)
 import logging
@@ -105,15 +151,33 @@ def _resolve_watch_path(user_path: str) -> Optional[str]:
 
     return None
 
-# Mount static directory for frontend
+# Mount static directory for frontend (precompressed, with ETags; see static_assets.py)
 static_dir = Path(__file__).resolve().parent / "static"
-app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory=str(static_dir)), name="static")
+
+# Event streams must reach the client as each event is written. Not every Starlette release that
+# requirements.txt allows excludes text/event-stream from gzip, so they are skipped by path.
+_UNCOMPRESSED_PATHS = {"/watch-session-events/"}
+
+
+class _GZipExceptStreams(GZipMiddleware):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in _UNCOMPRESSED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+if get_settings().gzip_minimum_size > 0:
+    # Compresses large JSON lists; responses that already carry Content-Encoding (static assets) pass through.
+    app.add_middleware(_GZipExceptStreams, minimum_size=get_settings().gzip_minimum_size, compresslevel=get_settings().gzip_level)
 
 @app.get("/")
-def read_index():
+def read_index(request: Request):
     # Serve index.html using absolute path to avoid working directory issues
     index_path = os.path.join(os.path.dirname(__file__), "static", "index.html")
-    return FileResponse(index_path)
+    # Unversioned entry point: let browsers cache it but revalidate every load (a cheap 304).
+    return respond(index_path, request.headers, request.method, cache_control="no-cache")
 
 class ReviewRequest(BaseModel):
     post_id: int
@@ -124,6 +188,7 @@ class PostRequest(BaseModel):
     platform: Any  # Accept str or list
     content: str
     urn_type: Optional[str] = None  # "author", "organization", or None
+    scheduled_at: Optional[datetime] = None  # publish at this time instead of now
 
 class GenerateRequest(BaseModel):
     prompt: str
@@ -136,6 +201,26 @@ class EditContentRequest(BaseModel):
     post_id: int
     new_content: str
 
+class BulkSelection(BaseModel):
+    # Criteria are combined with AND; at least one is required.
+    ids: Optional[List[int]] = None
+    session_id: Optional[int] = None  # posts generated by this watch session
+    current_status: Optional[str] = None  # e.g. "pending"
+
+class BulkReviewRequest(BulkSelection):
+    status: str  # "approved" or "rejected"
+
+class BulkEditRequest(BaseModel):
+    edits: List[EditContentRequest]
+
+class BulkPublishRequest(BulkSelection):
+    platform: Any  # Accept str or list
+    urn_type: Optional[str] = None
+    scheduled_at: Optional[datetime] = None
+
+class ResolvePublishJobRequest(BaseModel):
+    posted: bool  # whether the post is live on the platform
+
 @app.get("/healthz")
 def healthz():
     settings = get_settings()
@@ -147,13 +232,146 @@ def healthz():
     }
 
 
+@app.middleware("http")
+async def _record_request_metrics(request: Request, call_next):
+    if not get_settings().metrics_enabled:
+        return await call_next(request)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Label by route template (/publish-jobs/{job_id}), not the raw path, to keep cardinality bounded.
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.labels(
+            request.method, getattr(route, "path", "unmatched"), str(status_code)
+        ).observe(time.perf_counter() - start)
+
+
+@app.middleware("http")
+async def _profile_request(request: Request, call_next):
+    if not wants_profile(request.headers):
+        return await call_next(request)
+    start = time.perf_counter()
+    profile, sampler = profiler.start(request.method, request.url.path, request.scope)
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers["X-Profile-Id"] = str(profile.id)
+        return response
+    finally:
+        route = request.scope.get("route")
+        profiler.finish(profile, sampler, status_code, time.perf_counter() - start, getattr(route, "path", None))
+
+
+@app.middleware("http")
+async def _account_queries(request: Request, call_next):
+    if not get_settings().query_stats_enabled:
+        return await call_next(request)
+    with querystats.track(f"{request.method} {request.url.path}") as stats:
+        response = await call_next(request)
+    if get_settings().app_env == "dev":
+        response.headers.update(stats.headers())
+    return response
+
+
+# Static assets and scrapes/health checks would only add noise to traces.
+_UNTRACED_PREFIXES = ("/static", "/metrics", "/health")
+
+
+@app.middleware("http")
+async def _trace_request(request: Request, call_next):
+    if request.url.path.startswith(_UNTRACED_PREFIXES):
+        return await call_next(request)
+    parent = tracing.extract(request.headers.get("traceparent"))
+    with tracing.span(f"{request.method} {request.url.path}", parent=parent, kind=tracing.SERVER) as span:
+        span.set(**{"http.method": request.method})
+        response = await call_next(request)
+        route = getattr(request.scope.get("route"), "path", None)
+        if route:
+            span.name = f"{request.method} {route}"
+        span.set(**{"http.route": route, "http.status_code": response.status_code})
+        response.headers["X-Trace-Id"] = span.trace_id
+        return response
+
+
+@app.get("/debug/profiles/")
+def list_profiles(_: None = Depends(require_settings_auth)):
+    """
+    Recent request profiles held by this worker, newest first.
+    """
+    return {"enabled": get_settings().profiling_enabled, "profiles": profiler.list()}
+
+
+@app.get("/debug/profiles/{profile_id}")
+def download_profile(
+    profile_id: int,
+    format: str = Query(default="collapsed", pattern="^(collapsed|pstats)$"),
+    _: None = Depends(require_settings_auth),
+):
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found (it may have been evicted or taken by another worker)")
+    if format == "pstats":
+        return Response(
+            content=profile.pstats(),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.pstats"'},
+        )
+    return Response(
+        content=profile.collapsed(),
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.collapsed.txt"'},
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    if not get_settings().metrics_enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+@app.on_event("shutdown")
+def _shutdown_flush_writes():
+    # Hand a running watch session over, then commit everything the watcher/session threads queued.
+    _drain_watch_session()
+    write_queue.shutdown()
+    publish_workers.stop()
+    scheduler.stop()
+
+
 @app.on_event("startup")
 def _startup_create_tables():
-    # Must not crash the app if DB is temporarily unavailable; it will surface on DB usage.
+    # Schema changes normally run once before the workers start (python -m migrate, or the gunicorn
+    # master via gunicorn.conf.py); AUTO_MIGRATE=true keeps doing it per worker for plain uvicorn.
+    if get_settings().auto_migrate:
+        # Must not crash the app if DB is temporarily unavailable; it will surface on DB usage.
+        try:
+            create_all_tables()
+        except Exception as e:
+            logging.getLogger("autosocial").warning("Failed to initialize database tables: %s", e)
+            return
+    publish_workers.start()
+    # Index and sign rows written before search/dedupe existed, off the startup path and once across workers.
+    threading.Thread(target=_backfill_derived_data, args=(ensure_search_index(),), daemon=True).start()
+
+
+def _backfill_derived_data(search_ready: bool):
     try:
-        create_all_tables()
+        with advisory_lock(9042003) as taken:
+            if not taken:
+                return
+            if search_ready and index_is_empty():
+                rebuild_index()
+            if get_settings().dedupe_mode.strip().lower() != "off":
+                backfill_signatures()
     except Exception as e:
-        logging.getLogger("autosocial").warning("Failed to initialize database tables: %s", e)
+        logging.getLogger("autosocial").warning("Backfill of search index/duplicate signatures failed: %s", e)
 
 # Track generation stats and cancellation
 generation_count = 0
@@ -179,7 +397,11 @@ def save_generated_content(model: str = Query(...), content: str = Query(...)):
     Save selected generated content as a pending post and return its ID.
     """
     db = SessionLocal()
-    db_post = GeneratedPost(file=model, content=content, status="pending")
+    duplicate_id = existing_duplicate(db, content)
+    if duplicate_id is not None:
+        db.close()
+        return {"message": f"Duplicate of Post ID {duplicate_id}; not saved.", "id": duplicate_id, "duplicate": True}
+    db_post = GeneratedPost(file=model, content=content, status="pending", trace_id=tracing.current_trace_id())
     db.add(db_post)
     db.commit()
     db.refresh(db_post)
@@ -213,47 +435,223 @@ def review_content(request: ReviewRequest):
     if request.status not in ["approved", "rejected"]:
         db.close()
         return {"error": "Invalid status. Use 'approved' or 'rejected'."}
-    post.status = request.status
-    db.commit()
+    with tracing.span("post.review", trace_id=post.trace_id, post_id=post.id, status=request.status):
+        post.status = request.status
+        db.commit()
     db.refresh(post)
     db.close()
     return {"message": f"Post {request.post_id} marked as {request.status}.", "status": request.status}
 
+def _bulk_conditions(selection: BulkSelection) -> list:
+    conditions = []
+    if selection.ids is not None:
+        conditions.append(GeneratedPost.id.in_(selection.ids))
+    if selection.session_id is not None:
+        conditions.append(GeneratedPost.session_id == selection.session_id)
+    if selection.current_status:
+        conditions.append(GeneratedPost.status == selection.current_status)
+    return conditions
+
+@app.post("/bulk/review-content/")
+def bulk_review_content(request: BulkReviewRequest):
+    """
+    Approve or reject every matching post with a single UPDATE. Posts already posted are left alone.
+    """
+    if request.status not in ["approved", "rejected"]:
+        return JSONResponse({"error": "Invalid status. Use 'approved' or 'rejected'."}, status_code=400)
+    conditions = _bulk_conditions(request)
+    if not conditions:
+        return JSONResponse({"error": "Select posts by ids, session_id and/or current_status."}, status_code=400)
+    db = SessionLocal()
+    try:
+        # Core UPDATE: status is neither offloaded, indexed nor signed, so no per-row ORM work is needed.
+        updated = list(
+            db.execute(
+                GeneratedPost.__table__.update()
+                .where(*conditions, GeneratedPost.status.in_(("pending", "approved", "rejected")))
+                .values(status=request.status)
+                .returning(GeneratedPost.id)
+            ).scalars()
+        )
+        db.commit()
+    finally:
+        db.close()
+    result = {"status": request.status, "updated": len(updated), "ids": sorted(updated)}
+    if request.ids is not None:
+        result["skipped"] = sorted(set(request.ids) - set(updated))
+    return result
+
+@app.post("/bulk/edit-generated-content/")
+def bulk_edit_generated_content(request: BulkEditRequest):
+    """
+    Replace the content of several posts in one transaction.
+    The posts are written with one executemany UPDATE, which skips the ORM flush listeners, so blob
+    storage, duplicate signatures and the search index are maintained here, in batches. Looking up
+    duplicates still takes a few queries per post.
+    """
+    edits = {e.post_id: e.new_content for e in request.edits}
+    db = SessionLocal()
+    try:
+        found = db.execute(select(GeneratedPost.id, GeneratedPost.file).where(GeneratedPost.id.in_(list(edits)))).all()
+        updated = sorted(r.id for r in found)
+        if found:
+            conn = db.connection()
+            rows = [{"id": r.id, "content": edits[r.id]} for r in found]
+            signed = sign_rows(conn, rows)
+            offload_rows(conn, GeneratedPost, rows)
+            db.execute(update(GeneratedPost), rows)
+            if signed:
+                write_signatures(conn, rows)
+            index_rows(conn, "post", [{"id": r.id, "file": r.file, "content": edits[r.id]} for r in found])
+            db.commit()
+    finally:
+        db.close()
+    return {"updated": len(updated), "ids": updated, "missing": sorted(set(edits) - set(updated))}
+
+@app.post("/bulk/post-content/")
+def bulk_post_content(request: BulkPublishRequest):
+    """
+    Queue every matching approved (or already posted) post for publishing. Returns job counts.
+    """
+    conditions = _bulk_conditions(request)
+    if not conditions:
+        return JSONResponse({"error": "Select posts by ids, session_id and/or current_status."}, status_code=400)
+    platforms = request.platform if isinstance(request.platform, list) else [request.platform]
+    unsupported = [p for p in platforms if p not in PUBLISHERS]
+    platforms = [p for p in dict.fromkeys(platforms) if p in PUBLISHERS]
+    if not platforms:
+        return JSONResponse({"error": "No supported platform.", "unsupported": unsupported}, status_code=400)
+    scheduled_at = request.scheduled_at
+    if scheduled_at is not None and scheduled_at.tzinfo is not None:
+        scheduled_at = scheduled_at.astimezone().replace(tzinfo=None)
+    db = SessionLocal()
+    try:
+        post_ids = list(
+            db.execute(
+                select(GeneratedPost.id).where(*conditions, GeneratedPost.status.in_(PUBLISHABLE_STATUSES))
+            ).scalars()
+        )
+        # scheduled_at is only moved on posts that get a new or rescheduled job.
+        jobs = enqueue_publish_many(db, post_ids, platforms, urn_type=request.urn_type, scheduled_at=scheduled_at)
+    finally:
+        db.close()
+    result = {"posts": len(post_ids), "ids": sorted(post_ids), "jobs": jobs}
+    if unsupported:
+        result["unsupported"] = unsupported
+    if request.ids is not None:
+        result["skipped"] = sorted(set(request.ids) - set(post_ids))
+    return JSONResponse(result, status_code=202)
+
 @app.get("/trending-topics/")
-def get_trending_topics() -> Dict[str, List[str]]:
-    x_topics = fetch_x_trending_topics()
+def get_trending_topics(woeid: Optional[int] = Query(default=None, ge=1, description="Location WOEID; 1 = Worldwide")):
+    """
+    Trending topics, served from the shared trends cache (see trends.py).
+    """
+    x_trends = trends_cache.get("x", woeid or get_settings().trends_default_woeid)
     linkedin_topics = fetch_linkedin_trending_topics()
     return {
-        "x_trending_topics": x_topics,
-        "linkedin_trending_topics": linkedin_topics
+        "x_trending_topics": x_trends["topics"],
+        "linkedin_trending_topics": linkedin_topics,
+        "x_trends": {k: v for k, v in x_trends.items() if k != "topics"},
     }
 
+@app.get("/search")
+def search_content(
+    q: str = Query(..., min_length=1),
+    types: Optional[str] = Query(default=None, description="Comma-separated: " + ",".join(SEARCH_DOC_TYPES)),
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+):
+    """
+    Ranked full-text search over generated posts, file change diffs and session summaries. Snippets mark
+    matched terms with the control characters \\x02 (start) and \\x03 (end).
+    """
+    doc_types = [t.strip() for t in types.split(",") if t.strip()] if types else None
+    try:
+        return search_documents(q, doc_types, limit=limit, offset=offset)
+    except RuntimeError as e:
+        return JSONResponse({"error": str(e)}, status_code=503)
+
 @app.post("/post-content/")
 def post_content(request: PostRequest):
+    """
+    Queue the post for publishing on each platform and return the publish job IDs immediately.
+    With scheduled_at the jobs wait until that time; timestamps without a timezone are server-local.
+    The post is marked "posted" by the worker once a platform accepts it; poll /publish-jobs/ for progress.
+    """
+    scheduled_at = request.scheduled_at
+    if scheduled_at is not None and scheduled_at.tzinfo is not None:
+        scheduled_at = scheduled_at.astimezone().replace(tzinfo=None)
     db = SessionLocal()
     post = db.query(GeneratedPost).filter(GeneratedPost.id == request.post_id).first()
     if not post:
         db.close()
         return {"error": "Post not found."}
-    if post.status != "approved":
+    if post.status not in PUBLISHABLE_STATUSES:
         db.close()
         return {"error": "Post must be approved before publishing."}
-    post.status = "posted"
     # Support posting to multiple platforms
     platforms = request.platform if isinstance(request.platform, list) else [request.platform]
-    results = {}
-    for platform in platforms:
-        post.platform = platform
+    unsupported = {p: {"error": "Unsupported platform"} for p in platforms if p not in PUBLISHERS}
+    platforms = [p for p in dict.fromkeys(platforms) if p in PUBLISHERS]
+    if platforms:
+        post.scheduled_at = scheduled_at
         db.commit()
-        db.refresh(post)
-        if platform == "twitter":
-            results["twitter"] = post_to_x(post.content)
-        elif platform == "linkedin":
-            results["linkedin"] = post_to_linkedin(post.content, urn_type=request.urn_type)
-        else:
-            results[platform] = {"error": "Unsupported platform"}
+    jobs = enqueue_publish(db, post.id, platforms, urn_type=request.urn_type, scheduled_at=scheduled_at)
+    result = [job_to_dict(job) for job in jobs]
+    db.close()
+    when = f" at {scheduled_at.isoformat(timespec='minutes')}" if scheduled_at else ""
+    return JSONResponse(
+        {
+            "message": f"Post {request.post_id} queued for {', '.join(platforms) or 'no platforms'}{when}.",
+            "job_ids": [job["id"] for job in result],
+            "jobs": result,
+            "result": unsupported,
+        },
+        status_code=202 if result else 400,
+    )
+
+@app.get("/publish-jobs/")
+def list_publish_jobs(post_id: Optional[int] = None, limit: int = Query(default=50, ge=1, le=500)):
+    db = SessionLocal()
+    query = db.query(PublishJob)
+    if post_id is not None:
+        query = query.filter(PublishJob.post_id == post_id)
+    jobs = [job_to_dict(job) for job in query.order_by(PublishJob.id.desc()).limit(limit).all()]
+    db.close()
+    return jobs
+
+@app.get("/rate-limits/")
+def list_rate_limits():
+    """
+    Remaining publishing budget per account and bucket (learned from platform headers or configured).
+    """
+    return rate_limiter.budgets()
+
+@app.get("/publish-jobs/{job_id}")
+def get_publish_job(job_id: int):
+    db = SessionLocal()
+    job = db.get(PublishJob, job_id)
     db.close()
-    return {"message": f"Post published to {', '.join(platforms)}: {post.content}", "result": results}
+    if job is None:
+        return JSONResponse({"error": "Publish job not found."}, status_code=404)
+    return job_to_dict(job)
+
+@app.post("/publish-jobs/{job_id}/resolve")
+def resolve_publish_job(job_id: int, request: ResolvePublishJobRequest):
+    """
+    Settle a job in status "unknown" (the platform may or may not have published it) after checking the
+    platform: posted=true marks it succeeded, posted=false queues it to be sent again.
+    """
+    db = SessionLocal()
+    try:
+        job = resolve_unknown(db, job_id, request.posted)
+        result = job_to_dict(job) if job is not None else None
+    finally:
+        db.close()
+    if result is None:
+        return JSONResponse({"error": "Publish job not found or its outcome is not unknown."}, status_code=409)
+    return result
 
 @app.post("/submit-custom-content/")
 def submit_custom_content(request: CustomContentRequest):
@@ -261,7 +659,13 @@ def submit_custom_content(request: CustomContentRequest):
     Save custom content as a pending post and return its ID.
     """
     db = SessionLocal()
-    db_post = GeneratedPost(file=request.file, content=request.content, status="pending")
+    duplicate_id = existing_duplicate(db, request.content)
+    if duplicate_id is not None:
+        db.close()
+        return {"message": f"Duplicate of Post ID {duplicate_id}; not submitted.", "id": duplicate_id, "duplicate": True}
+    db_post = GeneratedPost(
+        file=request.file, content=request.content, status="pending", trace_id=tracing.current_trace_id()
+    )
     db.add(db_post)
     db.commit()
     db.refresh(db_post)
@@ -349,7 +753,7 @@ def test_api_keys(request: ApiKeysTestRequest, _: None = Depends(require_setting
         else:
             try:
                 r = requests.get(
-                    "https://api.openai.com/v1/models",
+                    f"{get_settings().openai_base_url}/models",
                     headers={"Authorization": f"Bearer {key}"},
                     timeout=10,
                 )
@@ -365,7 +769,7 @@ def test_api_keys(request: ApiKeysTestRequest, _: None = Depends(require_setting
         else:
             try:
                 r = requests.get(
-                    "https://api.groq.com/openai/v1/models",
+                    f"{get_settings().groq_base_url}/models",
                     headers={"Authorization": f"Bearer {key}"},
                     timeout=10,
                 )
@@ -380,7 +784,7 @@ def test_api_keys(request: ApiKeysTestRequest, _: None = Depends(require_setting
             results["gemini"] = {"ok": False, "error": "missing key"}
         else:
             try:
-                url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+                url = f"{get_settings().gemini_base_url}/models/gemini-2.0-flash:generateContent"
                 payload = {"contents": [{"parts": [{"text": "ping"}]}]}
                 r = requests.post(url, json=payload, headers={"x-goog-api-key": key}, timeout=10)
                 results["gemini"] = {"ok": r.status_code < 400, "status_code": r.status_code}
@@ -395,7 +799,7 @@ def test_api_keys(request: ApiKeysTestRequest, _: None = Depends(require_setting
         else:
             try:
                 r = requests.get(
-                    "https://api.twitter.com/2/users/me",
+                    f"{get_settings().x_api_base_url}/2/users/me",
                     headers={"Authorization": f"Bearer {bearer}"},
                     timeout=10,
                 )
@@ -411,7 +815,7 @@ def test_api_keys(request: ApiKeysTestRequest, _: None = Depends(require_setting
         else:
             try:
                 r = requests.get(
-                    "https://api.linkedin.com/v2/userinfo",
+                    f"{get_settings().linkedin_api_base_url}/v2/userinfo",
                     headers={"Authorization": f"Bearer {token}"},
                     timeout=10,
                 )
@@ -467,37 +871,71 @@ def is_ignored(watched_root: str, path: str, patterns):
             return True
     return False
 
+def _record_session_change(path: str) -> None:
+    """
+    Add a file to the active session's changes; its first change is pushed to event subscribers.
+    """
+    if path not in watch_session["changed_files"]:
+        watch_session["changed_files"].add(path)
+        watch_checkpoint.record_change(watch_session["session_id"], path)
+        watch_broker.publish("file_changed", path=path)
+    # Finalize continues the trace of the first event seen for each file.
+    watch_session["event_spans"].setdefault(path, tracing.current())
+
 def start_watcher(path, stop_event):
     global watcher_observer
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
     watched_root = path if os.path.isdir(path) else os.path.dirname(path)
     GITIGNORE_PATH = os.path.join(path, ".gitignore") if os.path.isdir(path) else os.path.join(os.path.dirname(path), ".gitignore")
     GITIGNORE_PATTERNS = load_gitignore_patterns(GITIGNORE_PATH)
 
     class ChangeHandler(FileSystemEventHandler):
         def on_any_event(self, event):
+            # Each event starts a trace that follows it through generation and into the stored post.
+            with tracing.span("watch.event", watcher="watcher", event_type=event.event_type, path=event.src_path):
+                self._handle(event)
+
+        def _handle(self, event):
+            metrics.WATCH_EVENTS.labels("watcher").inc()
             if event.is_directory:
+                metrics.WATCH_IGNORED_EVENTS.labels("watcher", "directory").inc()
                 return
-            if is_ignored(watched_root, event.src_path, GITIGNORE_PATTERNS):
+            with tracing.span("watch.is_ignored"):
+                ignored = is_ignored(watched_root, event.src_path, GITIGNORE_PATTERNS)
+            if ignored:
+                metrics.WATCH_IGNORED_EVENTS.labels("watcher", "gitignore").inc()
                 return
             # --- FIX: Only generate content if not in a watch session ---
             if watch_session.get("active"):
                 # Only record the file as changed, do not generate content here
-                watch_session["changed_files"].add(os.path.abspath(event.src_path))
+                _record_session_change(os.path.abspath(event.src_path))
                 return
             msg = f"Change detected in {event.src_path}, generating content..."
             print(msg)
             try:
                 prompt = f"Change detected in {event.src_path}"
-                gen_resp = requests.post("http://127.0.0.1:8000/generate-content/", json={"prompt": prompt})
+                with tracing.span("generate.request", kind=tracing.CLIENT):
+                    gen_resp = requests.post(
+                        f"{get_settings().app_base_url}/generate-content/", json={"prompt": prompt}, headers=tracing.inject()
+                    )
                 resp_json = gen_resp.json()
                 content = resp_json.get("model_responses") or resp_json.get("responses", "")
                 db = SessionLocal()
-                db_post = GeneratedPost(file=event.src_path, content=str(content), status="pending")
-                db.add(db_post)
-                db.commit()
-                db.refresh(db_post)
-                print(f"Generated content stored for approval (id={db_post.id})")
+                duplicate_id = existing_duplicate(db, str(content))
                 db.close()
+                if duplicate_id is not None:
+                    print(f"Generated content duplicates post {duplicate_id}; skipped")
+                    return
+                db_post = GeneratedPost(
+                    file=event.src_path, content=str(content), status="pending", trace_id=tracing.current_trace_id()
+                )
+                # Batched by the writer thread; don't hold up the observer waiting for the commit.
+                write_queue.submit(db_post).add_done_callback(
+                    lambda f: print(f"Generated content stored for approval (id={f.result()})")
+                    if not f.exception() else print(f"Error storing generated content: {f.exception()}")
+                )
             except Exception as e:
                 err_msg = f"Error generating content: {e}"
                 print(err_msg)
@@ -524,60 +962,25 @@ def start_watcher(path, stop_event):
         print("Watcher stopping...")
         # Do not call observer.join() here, let the thread exit
 
-@app.post("/start-watch-session/")
-async def start_watch_session(request: Request, background_tasks: BackgroundTasks):
-    global watch_session, previous_file_contents
+def _watch_max_file_bytes() -> int:
+    return int(os.getenv("WATCH_SCAN_MAX_BYTES", str(256 * 1024)))  # 256KB/file
+
+def _use_git_baseline(resolved: str) -> bool:
+    mode = get_settings().watch_git_mode.strip().lower()
+    return mode != "off" and git_baseline.is_work_tree(resolved)
+
+def _scan_watch_path(resolved: str):
     """
-    Start a watch session for a given folder and duration.
-    Accepts duration and duration_unit ('minutes' or 'hours').
+    Yield (path, content) for the files a session diffs against: regular, non-ignored UTF-8 files of
+    at most WATCH_SCAN_MAX_BYTES, up to WATCH_SCAN_MAX_FILES of them.
     """
-    data = await request.json()
-    path = data.get("path")
-    duration = data.get("duration")  # numeric value
-    duration_unit = data.get("duration_unit", "minutes")  # default to minutes if not provided
+    import stat as _stat
 
-    resolved = _resolve_watch_path(path)
-    if not resolved:
-        hint = (
-            "Invalid path. If running in Docker, mount the host filesystem "
-            "and set HOST_FS_ROOT (e.g. mount '/:/host:ro' and set HOST_FS_ROOT=/host), "
-            "or use a path that exists inside the container (e.g. /watched)."
-        )
-        return JSONResponse({"error": hint}, status_code=400)
-    try:
-        duration = int(duration)
-        if duration <= 0:
-            raise ValueError()
-    except Exception:
-        return JSONResponse({"error": "Invalid duration"}, status_code=400)
-    if duration_unit not in ("minutes", "hours"):
-        return JSONResponse({"error": "Invalid duration_unit. Use 'minutes' or 'hours'."}, status_code=400)
-    if watch_session["active"]:
-        return JSONResponse({"error": "A session is already active."}, status_code=400)
-    stop_event = threading.Event()
-    # Calculate end_time based on unit
-    if duration_unit == "hours":
-        end_time = datetime.now() + timedelta(hours=duration)
-        duration_minutes = duration * 60
-    else:
-        end_time = datetime.now() + timedelta(minutes=duration)
-        duration_minutes = duration
-    watch_session.update({
-        "active": True,
-        "changed_files": set(),
-        "thread": None,
-        "stop_event": stop_event,
-        "path": resolved,
-        "end_time": end_time,
-        "results": None
-    })
-    # At session start, store current content of all files in the watched path
-    previous_file_contents = {}
     watch_log = logging.getLogger("autosocial.watch")
     gitignore_path = os.path.join(resolved, ".gitignore")
     gitignore_patterns = load_gitignore_patterns(gitignore_path)
     max_files = int(os.getenv("WATCH_SCAN_MAX_FILES", "2000"))
-    max_bytes = int(os.getenv("WATCH_SCAN_MAX_BYTES", str(256 * 1024)))  # 256KB/file
+    max_bytes = _watch_max_file_bytes()
     scanned = 0
 
     for root, dirs, files in os.walk(resolved):
@@ -611,8 +1014,6 @@ async def start_watch_session(request: Request, background_tasks: BackgroundTask
             try:
                 st = os.stat(fpath, follow_symlinks=False)
                 # Only regular files
-                import stat as _stat
-
                 if not _stat.S_ISREG(st.st_mode):
                     watch_log.debug("Skipping non-regular file: %s", fpath)
                     continue
@@ -621,93 +1022,379 @@ async def start_watch_session(request: Request, background_tasks: BackgroundTask
                     continue
 
                 with open(fpath, "r", encoding="utf-8") as f:
-                    previous_file_contents[fpath] = f.read()
+                    content = f.read()
                 scanned += 1
             except (OSError, UnicodeDecodeError) as e:
                 watch_log.debug("Skipping unreadable file %s: %s", fpath, e)
                 continue
+            yield fpath, content
 
         if scanned >= max_files:
             break
 
+@app.post("/start-watch-session/")
+async def start_watch_session(request: Request, background_tasks: BackgroundTasks):
+    global watch_session
+    """
+    Start a watch session for a given folder and duration.
+    Accepts duration and duration_unit ('minutes' or 'hours').
+    """
+    data = await request.json()
+    path = data.get("path")
+    duration = data.get("duration")  # numeric value
+    duration_unit = data.get("duration_unit", "minutes")  # default to minutes if not provided
+
+    resolved = _resolve_watch_path(path)
+    if not resolved:
+        hint = (
+            "Invalid path. If running in Docker, mount the host filesystem "
+            "and set HOST_FS_ROOT (e.g. mount '/:/host:ro' and set HOST_FS_ROOT=/host), "
+            "or use a path that exists inside the container (e.g. /watched)."
+        )
+        return JSONResponse({"error": hint}, status_code=400)
+    try:
+        duration = int(duration)
+        if duration <= 0:
+            raise ValueError()
+    except Exception:
+        return JSONResponse({"error": "Invalid duration"}, status_code=400)
+    if duration_unit not in ("minutes", "hours"):
+        return JSONResponse({"error": "Invalid duration_unit. Use 'minutes' or 'hours'."}, status_code=400)
+    if watch_session["active"]:
+        return JSONResponse({"error": "A session is already active."}, status_code=400)
+    # Calculate end_time based on unit
+    if duration_unit == "hours":
+        end_time = datetime.now() + timedelta(hours=duration)
+        duration_minutes = duration * 60
+    else:
+        end_time = datetime.now() + timedelta(minutes=duration)
+        duration_minutes = duration
+    # At session start, record the state of the watched path to diff against at the end. On a git work
+    # tree that is the HEAD commit plus whatever was staged or dirty; otherwise the content of all files.
+    # Either way it is checkpointed with the session (see watch_checkpoint.py) rather than kept in memory.
+    git_head, git_objects = None, None
+    snapshot = None
+    if _use_git_baseline(resolved):
+        try:
+            snapshot = git_baseline.snapshot(resolved, _watch_max_file_bytes())
+        except git_baseline.GitError as e:
+            logging.getLogger("autosocial.watch").warning("Git baseline for %s failed (%s); scanning files", resolved, e)
+    if snapshot is not None:
+        git_head, git_objects, baseline = snapshot.head, snapshot.staged, snapshot.dirty
+    else:
+        baseline = dict(_scan_watch_path(resolved))
+
     # --- FIX: create session_log and pass session_log_id into the thread ---
     session_log = add_watch_session_log(resolved, duration_minutes)
     session_log_id = session_log.id
+    watch_checkpoint.create(session_log_id, resolved, end_time, baseline, git_head=git_head, git_objects=git_objects)
+    del baseline
 
-    def session_watcher(session_log_id=session_log_id):
-        class SessionHandler(FileSystemEventHandler):
-            def on_any_event(self, event):
-                if event.is_directory:
-                    return
-                rel_path = os.path.relpath(event.src_path, path)
-                watch_session["changed_files"].add(os.path.abspath(event.src_path))
-        observer = Observer()
-        handler = SessionHandler()
-        observer.schedule(handler, resolved, recursive=True)
-        observer.start()
+    _launch_watch_session(session_log_id, resolved, end_time, git_head=git_head)
+    watch_broker.publish("session_started", path=resolved, end_time=end_time.isoformat())
+    return {"message": f"Started watching {path} for {duration} {duration_unit}."}
+
+def _launch_watch_session(
+    session_log_id: int, path: str, end_time: datetime, changed_files=(), git_head: Optional[str] = None
+) -> None:
+    stop_event = threading.Event()
+    watch_session.update({
+        "active": True,
+        "session_id": session_log_id,
+        "draining": False,
+        "suspended": None,
+        "renewal": None,
+        "renewal_sent_at": time.monotonic(),
+        "lease_confirmed_at": time.monotonic(),
+        "git_head": git_head,
+        "changed_files": set(changed_files),
+        "thread": None,
+        "stop_event": stop_event,
+        "path": path,
+        "end_time": end_time,
+        "results": None,
+        "event_spans": {},
+    })
+    t = threading.Thread(target=_run_watch_session, args=(session_log_id, path, stop_event), daemon=True)
+    watch_session["thread"] = t
+    t.start()
+
+def _keep_watch_lease(session_log_id: int) -> bool:
+    """
+    Renew the lease every third of its length, without waiting on the write queue. Returns False once
+    the session may belong to another worker: a renewal found a new owner, or none was confirmed for a
+    whole lease (e.g. stuck behind a write backlog), so the lease may have expired and been claimed.
+    """
+    lease = max(1, get_settings().watch_session_lease_seconds)
+    now = time.monotonic()
+    renewal = watch_session["renewal"]
+    if renewal is not None and renewal.done():
+        watch_session["renewal"] = None
         try:
-            while not stop_event.is_set():
-                # --- FIX: check time and stop session if over ---
-                if datetime.now() >= watch_session["end_time"]:
-                    stop_event.set()
-                    break
-                time.sleep(1)
-        finally:
+            owned = renewal.result()
+        except Exception as e:
+            logging.getLogger("autosocial.watch").warning("Renewing the lease of session %s failed: %s", session_log_id, e)
+            owned = None
+        if owned is False:
+            return False
+        if owned:
+            # The new expiry was computed when the renewal was queued.
+            watch_session["lease_confirmed_at"] = watch_session["renewal_sent_at"]
+    if now - watch_session["lease_confirmed_at"] >= lease:
+        return False
+    if watch_session["renewal"] is None and now - watch_session["renewal_sent_at"] >= lease / 3:
+        watch_session["renewal_sent_at"] = now
+        watch_session["renewal"] = watch_checkpoint.renew(session_log_id)
+    return True
+
+def _lose_watch_session(session_log_id: int) -> None:
+    # Another worker may be running the session now; stop here and leave the checkpoint to it.
+    logging.getLogger("autosocial.watch").warning("Lost the lease of watch session %s; stopping here", session_log_id)
+    _suspend_watch_session(session_log_id, release=False)
+
+def _suspend_watch_session(session_log_id: int, release: bool) -> None:
+    """
+    Stop running the session here and leave its checkpoint to be resumed.
+    With release, another worker may claim it right away; otherwise once the lease expires.
+    """
+    write_queue.flush()
+    if release:
+        watch_checkpoint.release(session_log_id)
+    watch_session["active"] = False
+    watch_session["suspended"] = session_log_id
+
+def _run_watch_session(session_log_id: int, path: str, stop_event: threading.Event) -> None:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
+    class SessionHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            metrics.WATCH_EVENTS.labels("session").inc()
+            if event.is_directory:
+                metrics.WATCH_IGNORED_EVENTS.labels("session", "directory").inc()
+                return
+            abs_path = os.path.abspath(event.src_path)
+            with tracing.span("watch.event", watcher="session", event_type=event.event_type, path=event.src_path):
+                _record_session_change(abs_path)
+    observer = Observer()
+    try:
+        observer.schedule(SessionHandler(), path, recursive=True)
+        observer.start()
+    except OSError as e:
+        # e.g. a resumed session whose directory is gone; finalize with what was recorded.
+        logging.getLogger("autosocial.watch").warning("Cannot watch %s for session %s: %s", path, session_log_id, e)
+        observer = None
+    try:
+        while observer is not None and not stop_event.is_set():
+            # --- FIX: check time and stop session if over ---
+            if datetime.now() >= watch_session["end_time"]:
+                stop_event.set()
+                break
+            if not _keep_watch_lease(session_log_id):
+                break
+            time.sleep(1)
+    finally:
+        if observer is not None:
             observer.stop()
             observer.join()
-            changed_files = list(watch_session["changed_files"])
-            results = {}
-            diff_summaries = {}
-            db = SessionLocal()
-            for file_path in changed_files:
-                try:
-                    old_content = previous_file_contents.get(file_path, "")
+    if watch_session["draining"]:
+        _suspend_watch_session(session_log_id, release=True)
+        return
+    if not _keep_watch_lease(session_log_id):
+        _lose_watch_session(session_log_id)
+        return
+    # Watching is over: a session resumed from here on goes straight to finalize.
+    renewal, watch_session["renewal"] = watch_session["renewal"], None
+    if renewal is not None:
+        renewal.exception()  # settled before the end-time update, whatever it returned
+    if not watch_checkpoint.renew(session_log_id, end_time=min(datetime.now(), watch_session["end_time"])).result():
+        _lose_watch_session(session_log_id)
+        return
+    watch_session["renewal_sent_at"] = watch_session["lease_confirmed_at"] = time.monotonic()
+    _finalize_watch_session(session_log_id)
+
+def _finalize_watch_session(session_log_id: int) -> None:
+    finalize_started = time.perf_counter()
+    git_head = watch_session["git_head"]
+    changed_files = list(watch_session["changed_files"])
+    if git_head:
+        # Git knows what differs from the start commit, including changes no watch event reported
+        # (and without the .git internals and ignored files that events include).
+        try:
+            changed_files = watch_checkpoint.changed_since_start(session_log_id, _watch_max_file_bytes())
+        except git_baseline.GitError as e:
+            logging.getLogger("autosocial.watch").warning("Git diff for session %s failed (%s); using watch events", session_log_id, e)
+    results = {}
+    diff_summaries = {}
+    # Files generated before a restart keep their stored results.
+    for file_path, (diff_summary, responses) in watch_checkpoint.completed_files(session_log_id).items():
+        diff_summaries[file_path] = diff_summary
+        results[file_path] = responses
+    previous_file_contents = watch_checkpoint.baseline_texts(session_log_id, (p for p in changed_files if p not in results))
+    pending_writes = []
+    db = SessionLocal()
+    event_spans = watch_session["event_spans"]
+    for file_path in changed_files:
+        if file_path in results:
+            continue
+        if watch_session["draining"]:
+            # Shutting down: whoever resumes the session generates the files left.
+            db.close()
+            _suspend_watch_session(session_log_id, release=True)
+            return
+        if not _keep_watch_lease(session_log_id):
+            db.close()
+            _lose_watch_session(session_log_id)
+            return
+        # Continue the trace of the file's first event; files without one start a new trace.
+        with tracing.span("watch.session.file", parent=event_spans.get(file_path), path=file_path) as file_span:
+            try:
+                old_content = previous_file_contents.get(file_path, "")
+                if git_head and not os.path.lexists(file_path):
+                    new_content = ""  # deleted since the start
+                else:
                     with open(file_path, "r", encoding="utf-8") as f:
                         new_content = f.read()
-                    diff_summary = summarize_file_change(file_path, old_content, new_content)
-                    diff_summaries[file_path] = diff_summary
-                    # Use SUMMARY_PROMPT_TEMPLATE for AI
-                    from prompt_templates import SUMMARY_PROMPT_TEMPLATE
-                    prompt = SUMMARY_PROMPT_TEMPLATE.format(diff_summary=diff_summary)
-                    gen_resp = requests.post("http://127.0.0.1:8000/generate-content/", json={"prompt": prompt})
-                    # --- FIX: use model_responses for new API, fallback to responses ---
-                    resp_json = gen_resp.json()
-                    responses = resp_json.get("model_responses") or resp_json.get("responses", {})
-                    results[file_path] = responses
-                    # Save each model's content as a separate DB row
-                    for model_name, content in responses.items():
-                        db_post = GeneratedPost(
-                            file=f"{file_path} [{model_name}]",
-                            content=str(content),
-                            status="pending"
-                        )
-                        db.add(db_post)
-                    # Save file change log
-                    file_log = FileChangeLog(
-                        session_id=session_log_id,
-                        file_path=file_path,
-                        diff_summary=diff_summary,
-                        ai_results=str(responses)
+                if git_head and new_content == old_content:
+                    continue  # dirty at the start, untouched since
+                diff_summary = summarize_file_change(file_path, old_content, new_content)
+                diff_summaries[file_path] = diff_summary
+                watch_broker.publish("diff_ready", path=file_path)
+                # Use SUMMARY_PROMPT_TEMPLATE for AI
+                from prompt_templates import SUMMARY_PROMPT_TEMPLATE
+                prompt = SUMMARY_PROMPT_TEMPLATE.format(diff_summary=diff_summary)
+                with tracing.span("generate.request", kind=tracing.CLIENT):
+                    gen_resp = requests.post(
+                        f"{get_settings().app_base_url}/generate-content/",
+                        json={"prompt": prompt},
+                        headers=tracing.inject(),
                     )
-                    db.add(file_log)
-                    db.commit()
-                except Exception as e:
-                    results[file_path] = f"Error: {e}"
-            # --- Session-level summary ---
-            session_summary = generate_session_summary(diff_summaries)
-            # Update session log with summary and end time
-            session_log = db.query(WatchSessionLog).filter(WatchSessionLog.id == session_log_id).first()
-            session_log.ended_at = datetime.now()
-            session_log.result_summary = str(session_summary)
-            db.commit()
-            db.close()
-            watch_session["results"] = {"file_summaries": results, "session_summary": session_summary}
-            watch_session["active"] = False
+                # --- FIX: use model_responses for new API, fallback to responses ---
+                resp_json = gen_resp.json()
+                responses = resp_json.get("model_responses") or resp_json.get("responses", {})
+                results[file_path] = responses
+                watch_broker.publish("generation_done", path=file_path, error=None)
+                # Save each model's content as a separate DB row
+                rows = []
+                for model_name, content in responses.items():
+                    if existing_duplicate(db, str(content)) is not None:
+                        continue
+                    rows.append(GeneratedPost(
+                        file=f"{file_path} [{model_name}]",
+                        content=str(content),
+                        status="pending",
+                        session_id=session_log_id,
+                        trace_id=file_span.trace_id,
+                    ))
+                # Save file change log; it also marks the file as done for a resumed session
+                rows.append(FileChangeLog(
+                    session_id=session_log_id,
+                    file_path=file_path,
+                    diff_summary=diff_summary,
+                    ai_results=str(responses),
+                    trace_id=file_span.trace_id,
+                ))
+                # Queued for the batching writer instead of one commit per file.
+                pending_writes.extend((file_path, f) for f in write_queue.submit_many(rows))
+            except requests.ConnectionError as e:
+                # The API stopped accepting connections, normally because this worker is shutting down.
+                # Leave the remaining files to be resumed instead of recording them all as failed.
+                logging.getLogger("autosocial.watch").warning(
+                    "Generation unavailable during session %s (%s); leaving it to be resumed", session_log_id, e
+                )
+                db.close()
+                _suspend_watch_session(session_log_id, release=False)
+                return
+            except Exception as e:
+                results[file_path] = f"Error: {e}"
+                watch_broker.publish("generation_done", path=file_path, error=str(e))
+    db.close()
+    # --- Session-level summary ---
+    try:
+        session_summary = generate_session_summary(diff_summaries)
+    except Exception as e:
+        # Recorded like a failed file, so the session still finishes instead of being resumed again.
+        session_summary = f"Error: {e}"
+
+    # Update session log with summary and end time, after the file rows queued above
+    def _finish_session_log(session):
+        if not watch_checkpoint.discard(session, session_log_id):
+            return False  # taken over by another worker, which finishes it
+        session_log = session.query(WatchSessionLog).filter(WatchSessionLog.id == session_log_id).first()
+        session_log.ended_at = datetime.now()
+        session_log.result_summary = str(session_summary)
+        return True
+
+    if not write_queue.call(_finish_session_log).result():
+        _lose_watch_session(session_log_id)
+        return
+    for file_path, future in pending_writes:
+        if future.exception() is not None:
+            results[file_path] = f"Error: {future.exception()}"
+    watch_session["results"] = {"file_summaries": results, "session_summary": session_summary}
+    watch_session["active"] = False
+    watch_session["suspended"] = None
+    metrics.SESSION_FINALIZE_SECONDS.observe(time.perf_counter() - finalize_started)
+    watch_broker.publish(
+        "session_finished",
+        files=len(results),
+        errors=sum(1 for r in results.values() if isinstance(r, str) and r.startswith("Error:")),
+    )
 
-    t = threading.Thread(target=session_watcher, daemon=True)
-    watch_session["thread"] = t
-    t.start()
-    return {"message": f"Started watching {path} for {duration} {duration_unit}."}
+def repeat_every(seconds: float):
+    """
+    fastapi_utils' repeat_every, imported when the app starts rather than when main is imported.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def start() -> None:
+            from fastapi_utils.tasks import repeat_every as _repeat_every
+
+            await _repeat_every(seconds=seconds)(func)()
+        return start
+    return decorator
+
+@app.on_event("startup")
+@repeat_every(seconds=60)
+def resume_watch_session_task() -> None:
+    # Take over a session that a stopped or crashed worker left unfinished (see watch_checkpoint.py).
+    if not get_settings().watch_session_resume or watch_session["active"]:
+        return
+    watch_log = logging.getLogger("autosocial.watch")
+    try:
+        checkpoint = watch_checkpoint.claim()
+        if checkpoint is None:
+            return
+        changed = set(watch_checkpoint.changed_paths(checkpoint.session_id))
+        # Git-mode sessions ask git at finalize; others compare a rescan with the baseline to catch up.
+        if not checkpoint.git_head and os.path.isdir(checkpoint.path):
+            changed.update(watch_checkpoint.mark_changed_since_baseline(checkpoint.session_id, _scan_watch_path(checkpoint.path)))
+    except Exception as e:
+        watch_log.warning("Resuming a watch session failed: %s", e)
+        return
+    if watch_session["active"]:
+        # A session was started here meanwhile
+        watch_checkpoint.release(checkpoint.session_id)
+        return
+    watch_log.info("Resuming watch session %s on %s (%s changed files)", checkpoint.session_id, checkpoint.path, len(changed))
+    _launch_watch_session(checkpoint.session_id, checkpoint.path, checkpoint.end_time, changed, git_head=checkpoint.git_head)
+    watch_broker.publish("session_started", path=checkpoint.path, end_time=checkpoint.end_time.isoformat(), resumed=True)
+
+def _drain_watch_session() -> None:
+    """
+    On shutdown, hand the running session over: stop watching, let the file being generated be stored,
+    and release the session for the next worker. A session past its grace period is left to its lease.
+    """
+    if watch_session["active"]:
+        watch_session["draining"] = True
+        watch_session["stop_event"].set()
+        thread = watch_session["thread"]
+        if thread is not None:
+            thread.join(get_settings().watch_shutdown_grace_seconds)
+            if thread.is_alive():
+                logging.getLogger("autosocial.watch").warning("Watch session did not stop within the shutdown grace period")
+    elif watch_session.get("suspended") is not None:
+        watch_checkpoint.release(watch_session["suspended"])
 
 @app.post("/stop-watch-session/")
 def stop_watch_session():
@@ -738,6 +1425,46 @@ def watch_session_status():
         "changed_files": list(watch_session["changed_files"])
     }
 
+def _watch_session_snapshot() -> dict:
+    if not watch_session["active"]:
+        return {"active": False, "has_results": bool(watch_session.get("results"))}
+    return {
+        "active": True,
+        "path": watch_session["path"],
+        "end_time": watch_session["end_time"].isoformat(),
+        "changed_files": list(watch_session["changed_files"]),
+    }
+
+# Comment lines keep idle streams from being closed by proxies.
+_SSE_KEEPALIVE_SECONDS = 15
+
+@app.get("/watch-session-events/")
+async def watch_session_events():
+    """
+    Server-Sent Events stream of the watch session: a "snapshot" of the current state, then incremental
+    events (see watch_events.py). /watch-session-status/ stays available for polling clients.
+    """
+    subscription = watch_broker.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            yield format_sse({"id": 0, "type": "snapshot", "data": _watch_session_snapshot()})
+            while True:
+                event = await subscription.next(_SSE_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event)
+                if event["type"] == "resync":
+                    return
+        finally:
+            watch_broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/watch-session-results/")
 def watch_session_results():
     """
@@ -745,18 +1472,25 @@ def watch_session_results():
     """
     global watch_session
     if watch_session.get("results"):
-        return watch_session["results"]
+        # Full diffs and model outputs: encode directly, without a jsonable_encoder pass
+        return FastJSONResponse(watch_session["results"])
     return {"error": "No session results available."}
 
 @app.get("/generated-posts/")
-def list_generated_posts(include_all: bool = False):
+def list_generated_posts(request: Request, include_all: bool = False, hide_duplicates: bool = False):
     """
     List generated posts.
     By default, returns all posts. If include_all=false, returns only approved/posted.
     You can pass ?include_all=true to get all posts including pending/rejected.
+    Pass ?hide_duplicates=true to skip drafts linked to an earlier duplicate.
+    Carries an ETag; unchanged refreshes get a 304 or a cached body (see list_cache.py).
     """
+    return cached_list(request, "generated_posts", lambda: _generated_posts(include_all, hide_duplicates))
+
+def _generated_posts(include_all: bool, hide_duplicates: bool) -> list:
     db = SessionLocal()
-    posts = db.query(GeneratedPost).all()
+    with batched_hydration(db):
+        posts = db.query(GeneratedPost).all()
     result = [
         {
             "id": p.id,
@@ -764,10 +1498,15 @@ def list_generated_posts(include_all: bool = False):
             "content": str(p.content),
             "status": p.status,
             "platform": p.platform,
-            "type": "custom" if p.file == "custom" else "ai"
+            "type": "custom" if p.file == "custom" else "ai",
+            "duplicate_of": p.duplicate_of,
+            "scheduled_at": p.scheduled_at.isoformat() if p.scheduled_at else None,
+            "session_id": p.session_id,
+            "trace_id": p.trace_id,
         }
         for p in posts
-        if include_all or p.status in ("approved", "posted")
+        if (include_all or p.status in ("approved", "posted"))
+        and not (hide_duplicates and p.duplicate_of is not None)
     ]
     db.close()
     return result
@@ -792,37 +1531,55 @@ def list_session_summary_posts():
     return result
 
 @app.get("/watch-session-logs/")
-def list_watch_session_logs():
+def list_watch_session_logs(request: Request, format: str = Query("json", pattern="^(json|ndjson)$")):
+    """
+    Pass ?format=ndjson to stream one log per line instead of building a single JSON array.
+    """
+    if format == "ndjson":
+        return stream_ndjson(WatchSessionLog, _watch_session_log_dict)
+    return cached_list(request, "watch_session_logs", _watch_session_logs)
+
+def _watch_session_log_dict(l: WatchSessionLog) -> dict:
+    return {
+        "id": l.id,
+        "started_at": l.started_at.isoformat() if l.started_at else None,
+        "ended_at": l.ended_at.isoformat() if l.ended_at else None,
+        "path": l.path,
+        "duration_minutes": l.duration_minutes,
+        "result_summary": l.result_summary
+    }
+
+def _watch_session_logs() -> list:
     db = SessionLocal()
     logs = db.query(WatchSessionLog).all()
-    result = [
-        {
-            "id": l.id,
-            "started_at": l.started_at.isoformat() if l.started_at else None,
-            "ended_at": l.ended_at.isoformat() if l.ended_at else None,
-            "path": l.path,
-            "duration_minutes": l.duration_minutes,
-            "result_summary": l.result_summary
-        }
-        for l in logs
-    ]
+    result = [_watch_session_log_dict(l) for l in logs]
     db.close()
     return result
 
 @app.get("/file-change-logs/")
-def list_file_change_logs():
+def list_file_change_logs(request: Request, format: str = Query("json", pattern="^(json|ndjson)$")):
+    """
+    Pass ?format=ndjson to stream one log per line instead of building a single JSON array.
+    """
+    if format == "ndjson":
+        return stream_ndjson(FileChangeLog, _file_change_log_dict)
+    return cached_list(request, "file_change_logs", _file_change_logs)
+
+def _file_change_log_dict(l: FileChangeLog) -> dict:
+    return {
+        "id": l.id,
+        "session_id": l.session_id,
+        "file_path": l.file_path,
+        "diff_summary": l.diff_summary,
+        "ai_results": l.ai_results,
+        "trace_id": l.trace_id,
+    }
+
+def _file_change_logs() -> list:
     db = SessionLocal()
-    logs = db.query(FileChangeLog).all()
-    result = [
-        {
-            "id": l.id,
-            "session_id": l.session_id,
-            "file_path": l.file_path,
-            "diff_summary": l.diff_summary,
-            "ai_results": l.ai_results
-        }
-        for l in logs
-    ]
+    with batched_hydration(db):
+        logs = db.query(FileChangeLog).all()
+    result = [_file_change_log_dict(l) for l in logs]
     db.close()
     return result
 
@@ -844,45 +1601,71 @@ def generate_session_summary(changes):
     # Use only one model or all, as you prefer
     return query_all_models(prompt)
 
-@app.on_event("startup")
-@repeat_every(seconds=60*60)  # Check every hour
 def monthly_post_task() -> None:
-    from prompt_templates import SUMMARY_PROMPT_TEMPLATE
-    now = datetime.now()
+    """
+    Draft the start-of-month summary post. Runs at midnight on the 1st via the scheduler (see _startup_scheduler).
+    """
+    prompt = (
+        "It's the start of a new month! Write a professional, engaging summary post for our project's "
+        "progress and plans for this month, suitable for both Twitter and LinkedIn."
+    )
+    summary = query_all_models(prompt)
+    db = SessionLocal()
+    try:
+        post = SessionSummaryPost(summary=str(summary), status="approved", platform="both")
+        db.add(post)
+        db.commit()
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def _startup_scheduler() -> None:
     # Disabled by default to avoid unexpected posting/duplication.
     # Opt-in via RUN_MONTHLY_POSTS=true
     run_flag = os.getenv("RUN_MONTHLY_POSTS", "").strip().lower() in {"1", "true", "yes", "on"}
     if not run_flag:
         return
+    # Sleeps until the next 1st of the month; each worker wakes then, and only one claims the month.
+    scheduler.register("monthly_summary_post", first_of_next_month, month_period, monthly_post_task)
+    scheduler.start()
 
-    # Only run at midnight on the 1st
-    if not (now.day == 1 and now.hour == 0):
+@app.on_event("startup")
+@repeat_every(seconds=max(1, get_settings().retention_interval_minutes) * 60)
+def retention_task() -> None:
+    # Opt-in via RUN_RETENTION=true
+    if not get_settings().run_retention:
         return
+    # Only one worker applies the policy per interval.
+    with advisory_lock(9042002) as taken:
+        if not taken:
+            return
+        try:
+            with querystats.track("retention"):
+                run_retention()
+        except Exception as e:
+            logging.getLogger("autosocial.retention").warning("Retention run failed: %s", e)
 
-    db = SessionLocal()
-    lock_taken = True
-    try:
-        # Avoid duplicates when multiple gunicorn workers start.
-        # Use a Postgres advisory lock when available.
-        if engine.dialect.name.startswith("postgres"):
-            lock_taken = bool(db.execute(text("SELECT pg_try_advisory_lock(9042001)")).scalar())
-            if not lock_taken:
-                return
 
-        prompt = (
-            "It's the start of a new month! Write a professional, engaging summary post for our project's "
-            "progress and plans for this month, suitable for both Twitter and LinkedIn."
-        )
-        summary = query_all_models(prompt)
-        post = SessionSummaryPost(summary=str(summary), status="approved", platform="both")
-        db.add(post)
-        db.commit()
-        db.refresh(post)
-    finally:
+@app.post("/maintenance/retention")
+def run_retention_now(_: None = Depends(require_settings_auth)):
+    """
+    Apply the retention policy immediately. Returns rows removed per table.
+    """
+    with advisory_lock(9042002) as taken:
+        if not taken:
+            return JSONResponse({"error": "Retention is already running."}, status_code=409)
         try:
-            if lock_taken and engine.dialect.name.startswith("postgres"):
-                db.execute(text("SELECT pg_advisory_unlock(9042001)"))
-                db.commit()
-        except Exception:
-            pass
-        db.close()
\ No newline at end of file
+            return {"removed": run_retention()}
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+
+
+
+@app.post("/maintenance/search-reindex")
+def reindex_search(_: None = Depends(require_settings_auth)):
+    """
+    Rebuild the full-text search index from the source tables.
+    """
+    if not ensure_search_index():
+        return JSONResponse({"error": "Full-text search index is not available."}, status_code=503)
+    return {"indexed": rebuild_index()}
\ No newline at end of file
@@ -0,0 +1,195 @@
+"""
+Prometheus metrics for the hot paths (served at /metrics).
+
+With several gunicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty, writable directory before the
+workers start (gunicorn.conf.py does this); every worker then writes its samples there and /metrics
+aggregates all of them. Without prometheus_client installed every metric is a no-op.
+"""
+from __future__ import annotations
+
+import os
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+    from prometheus_client import multiprocess
+except ImportError:  # pragma: no cover - depends on environment
+    CollectorRegistry = Counter = Gauge = Histogram = None
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, amount):
+        pass
+
+
+def _metric(kind, name, documentation, labelnames=(), **kwargs):
+    if kind is None:
+        return _NoopMetric()
+    return kind(name, documentation, labelnames, **kwargs)
+
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+HTTP_REQUEST_SECONDS = _metric(
+    Histogram,
+    "autosocial_http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ("method", "route", "status"),
+    buckets=_LATENCY_BUCKETS,
+)
+PROVIDER_REQUEST_SECONDS = _metric(
+    Histogram,
+    "autosocial_provider_request_duration_seconds",
+    "AI provider call latency, including retries.",
+    ("provider", "outcome"),
+    buckets=_LATENCY_BUCKETS,
+)
+DB_QUERY_SECONDS = _metric(
+    Histogram,
+    "autosocial_db_query_duration_seconds",
+    "Time spent executing SQL statements by verb.",
+    ("operation",),
+    buckets=_DB_BUCKETS,
+)
+SESSION_FINALIZE_SECONDS = _metric(
+    Histogram,
+    "autosocial_watch_session_finalize_duration_seconds",
+    "Time from a watch session ending to its results being stored.",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+RETRIES = _metric(
+    Counter,
+    "autosocial_retries_total",
+    "Retried operations by component.",
+    ("component",),
+)
+RATE_LIMITED = _metric(
+    Counter,
+    "autosocial_rate_limited_total",
+    "HTTP 429 responses (or locally exhausted budgets) by upstream.",
+    ("upstream", "source"),
+)
+CACHE_REQUESTS = _metric(
+    Counter,
+    "autosocial_cache_requests_total",
+    "Cache lookups by cache and result.",
+    ("cache", "result"),
+)
+PUBLISH_ATTEMPTS = _metric(
+    Counter,
+    "autosocial_publish_attempts_total",
+    "Publish job outcomes by platform.",
+    ("platform", "outcome"),
+)
+WATCH_EVENTS = _metric(
+    Counter,
+    "autosocial_watch_events_total",
+    "File system events seen by the watchers.",
+    ("watcher",),
+)
+WATCH_IGNORED_EVENTS = _metric(
+    Counter,
+    "autosocial_watch_ignored_events_total",
+    "File system events dropped (directories, ignore rules).",
+    ("watcher", "reason"),
+)
+DB_POOL_CONNECTIONS = _metric(
+    Gauge,
+    "autosocial_db_pool_connections",
+    "Database pool connections by state, summed over live workers.",
+    ("state",),
+    multiprocess_mode="livesum",
+)
+
+
+@contextmanager
+def timed(histogram, *labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(*labels).observe(time.perf_counter() - start)
+
+
+def _update_pool_size(pool) -> None:
+    # Only QueuePool (Postgres) has a fixed size and overflow; SQLite pools report checked_out only.
+    size = getattr(pool, "size", None)
+    if callable(size):
+        DB_POOL_CONNECTIONS.labels("size").set(size())
+    overflow = getattr(pool, "overflow", None)
+    if callable(overflow):
+        DB_POOL_CONNECTIONS.labels("overflow").set(max(0, overflow()))
+
+
+def instrument_engine(engine) -> None:
+    """
+    Time every statement and keep the pool gauges current.
+    """
+    if CollectorRegistry is None:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_query_start")
+        if starts:
+            operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+            DB_QUERY_SECONDS.labels(operation).observe(time.perf_counter() - starts.pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _drop_timer(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("metrics_query_start"):
+            conn.info["metrics_query_start"].pop()
+
+    # checkin fires before the pool updates its own counters, so track checked-out connections here.
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CONNECTIONS.labels("checked_out").inc()
+        _update_pool_size(engine.pool)
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        DB_POOL_CONNECTIONS.labels("checked_out").dec()
+        _update_pool_size(engine.pool)
+
+
+def render() -> tuple[bytes, str]:
+    """
+    Exposition text for this process, or for all workers when PROMETHEUS_MULTIPROC_DIR is set.
+    """
+    if CollectorRegistry is None:
+        return b"# prometheus_client is not installed\n", CONTENT_TYPE_LATEST
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """
+    Drop a dead worker's live gauges (called from gunicorn's child_exit hook).
+    """
+    if CollectorRegistry is not None and os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,44 @@
+"""
+One-time schema setup: create missing tables and columns, then the full-text search index.
+
+Run it once per deploy before the workers start, instead of in every worker:
+    python -m migrate
+gunicorn.conf.py does this from the master process; plain uvicorn keeps AUTO_MIGRATE=true.
+"""
+import logging
+import sys
+
+from db import create_all_tables
+
+# Modules that register their tables on db.Base when imported.
+_MODEL_MODULES = ("blob_store", "dedupe", "outbox", "ratelimit", "scheduler", "secrets_store", "trends", "watch_checkpoint")
+
+
+def migrate() -> bool:
+    """
+    Bring the schema up to date. Returns whether the search index is available.
+    """
+    import importlib
+
+    for name in _MODEL_MODULES:
+        importlib.import_module(name)
+    create_all_tables()
+
+    from search import ensure_search_index
+
+    return ensure_search_index()
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    try:
+        search_ready = migrate()
+    except Exception as e:
+        logging.getLogger("autosocial.migrate").error("Migration failed: %s", e)
+        return 1
+    logging.getLogger("autosocial.migrate").info("Schema up to date (search index %s)", "ready" if search_ready else "unavailable")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
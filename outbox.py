@@ -0,0 +1,528 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text, UniqueConstraint, and_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import func
+
+from db import Base, GeneratedPost, SessionLocal
+import querystats
+import tracing
+from metrics import PUBLISH_ATTEMPTS, RETRIES
+from settings import get_settings
+
+logger = logging.getLogger("autosocial.outbox")
+
+# queued -> running -> succeeded | failed | unknown (or back to queued with a backoff after a failed attempt).
+# "unknown": the platform may have published the post (a timeout or dropped connection after sending, a 5xx,
+# or a worker that died mid-send). Sending again could post twice, so the job waits for resolve_unknown().
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "unknown")
+# Posts in these states may get new publish jobs; "posted" allows adding a platform or retrying a failed one.
+PUBLISHABLE_STATUSES = ("approved", "posted")
+# Platform API calls in flight per process, across all workers.
+_MAX_CONCURRENT_CALLS = 8
+_ABANDONED = "The worker stopped while publishing; check the platform and resolve the job."
+
+
+class PublishJob(Base):
+    """
+    Outbox row: one post to publish on one platform.
+    (post_id, platform) is unique, so asking to publish the same post twice reuses the existing job.
+    """
+
+    __tablename__ = "publish_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    post_id = Column(Integer, nullable=False, index=True)
+    platform = Column(String, nullable=False)
+    urn_type = Column(String, nullable=True)  # LinkedIn: author|organization|None
+    status = Column(String, nullable=False, default="queued", index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Python-side clock: claims compare against datetime.now().
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.now)
+    lease_until = Column(DateTime, nullable=True)  # a running job whose lease expired is claimable again
+    worker = Column(String, nullable=True)
+    last_error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)  # platform response (JSON) once succeeded
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    completed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("post_id", "platform", name="uq_publish_jobs_post_platform"),
+        # Due-time index: claims and the workers' "sleep until next due" lookup both scan it in order.
+        Index("ix_publish_jobs_due", "status", "next_attempt_at"),
+    )
+
+
+def _post_to_x(content: str, job: PublishJob, timeout: float) -> dict:
+    from social import post_to_x
+
+    return post_to_x(content, timeout=timeout)
+
+
+def _post_to_linkedin(content: str, job: PublishJob, timeout: float) -> dict:
+    from social import post_to_linkedin
+
+    return post_to_linkedin(content, urn_type=job.urn_type, timeout=timeout)
+
+
+# platform -> fn(content, job, timeout) returning the platform response; a dict with "error" is a failed attempt,
+# and one that also has "outcome_unknown" may have been published anyway (see social.py).
+# timeout is what remains of the shared publish deadline, in seconds.
+PUBLISHERS: Dict[str, Callable[[str, PublishJob, float], dict]] = {
+    "twitter": _post_to_x,
+    "linkedin": _post_to_linkedin,
+}
+
+
+def job_to_dict(job: PublishJob) -> dict:
+    return {
+        "id": job.id,
+        "post_id": job.post_id,
+        "platform": job.platform,
+        "status": job.status,
+        "attempts": job.attempts,
+        "next_attempt_at": job.next_attempt_at.isoformat() if job.next_attempt_at else None,
+        "last_error": job.last_error,
+        "result": json.loads(job.result) if job.result else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "completed_at": job.completed_at.isoformat() if job.completed_at else None,
+    }
+
+
+def enqueue_publish(
+    db, post_id: int, platforms: List[str], urn_type: Optional[str] = None, scheduled_at: Optional[datetime] = None
+) -> List[PublishJob]:
+    """
+    Create (or reuse) one publish job per platform and return them in order.
+    Jobs become due at scheduled_at (local time), or immediately when it is None.
+    Running and succeeded jobs are returned unchanged; failed jobs are queued again, and queued jobs
+    that were never attempted take the new schedule.
+    """
+    due = scheduled_at or datetime.now()
+    jobs = []
+    for platform in platforms:
+        job = db.query(PublishJob).filter(PublishJob.post_id == post_id, PublishJob.platform == platform).first()
+        if job is None:
+            job = PublishJob(
+                post_id=post_id, platform=platform, urn_type=urn_type, status="queued", attempts=0, next_attempt_at=due
+            )
+            db.add(job)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another request created it first.
+                db.rollback()
+                job = db.query(PublishJob).filter(PublishJob.post_id == post_id, PublishJob.platform == platform).one()
+        elif job.status == "failed":
+            job.status = "queued"
+            job.attempts = 0
+            job.urn_type = urn_type
+            job.next_attempt_at = due
+            job.last_error = None
+            db.commit()
+        elif job.status == "queued" and job.attempts == 0 and job.next_attempt_at != due:
+            job.next_attempt_at = due
+            db.commit()
+        jobs.append(job)
+    for job in jobs:
+        db.refresh(job)
+    publish_workers.wake()
+    return jobs
+
+
+def enqueue_publish_many(
+    db,
+    post_ids: List[int],
+    platforms: List[str],
+    urn_type: Optional[str] = None,
+    scheduled_at: Optional[datetime] = None,
+    _retried: bool = False,
+) -> Dict[str, int]:
+    """
+    enqueue_publish() for many posts with a fixed number of statements: one lookup of existing jobs,
+    one bulk insert, one UPDATE for failed jobs, one for never-attempted queued jobs and one setting
+    scheduled_at on the posts that got a new or rescheduled job. Returns counts of jobs {"queued", "requeued", "rescheduled", "unchanged"}.
+    """
+    due = scheduled_at or datetime.now()
+    post_ids = list(dict.fromkeys(post_ids))
+    counts = {"queued": 0, "requeued": 0, "rescheduled": 0, "unchanged": 0}
+    if not post_ids or not platforms:
+        return counts
+    jobs = PublishJob.__table__
+    existing = db.execute(
+        select(jobs.c.id, jobs.c.post_id, jobs.c.platform, jobs.c.status, jobs.c.attempts).where(
+            jobs.c.post_id.in_(post_ids), jobs.c.platform.in_(platforms)
+        )
+    ).all()
+    seen = {(row.post_id, row.platform) for row in existing}
+    failed = [row.id for row in existing if row.status == "failed"]
+    unattempted = [row.id for row in existing if row.status == "queued" and row.attempts == 0]
+    new_rows = [
+        {"post_id": post_id, "platform": platform, "urn_type": urn_type, "status": "queued", "attempts": 0, "next_attempt_at": due}
+        for post_id in post_ids
+        for platform in platforms
+        if (post_id, platform) not in seen
+    ]
+    try:
+        if new_rows:
+            db.execute(jobs.insert(), new_rows)
+        if failed:
+            db.execute(
+                jobs.update()
+                .where(jobs.c.id.in_(failed))
+                .values(status="queued", attempts=0, urn_type=urn_type, next_attempt_at=due, last_error=None)
+            )
+        if unattempted:
+            db.execute(jobs.update().where(jobs.c.id.in_(unattempted)).values(next_attempt_at=due))
+        # Posts whose jobs all stay as they were (running, succeeded, already attempted) keep their schedule.
+        changed = set(failed) | set(unattempted)
+        scheduled = {row["post_id"] for row in new_rows} | {row.post_id for row in existing if row.id in changed}
+        if scheduled:
+            db.execute(
+                GeneratedPost.__table__.update()
+                .where(GeneratedPost.id.in_(scheduled))
+                .values(scheduled_at=scheduled_at)
+            )
+        db.commit()
+    except IntegrityError:
+        # A concurrent request queued some of the same jobs; they exist now, so run again once.
+        db.rollback()
+        if _retried:
+            raise
+        return enqueue_publish_many(db, post_ids, platforms, urn_type=urn_type, scheduled_at=scheduled_at, _retried=True)
+    counts.update(
+        queued=len(new_rows),
+        requeued=len(failed),
+        rescheduled=len(unattempted),
+        unchanged=len(existing) - len(failed) - len(unattempted),
+    )
+    publish_workers.wake()
+    return counts
+
+
+class PublishWorkerPool:
+    """
+    Threads that drain publish_jobs.
+
+    Jobs are claimed with a compare-and-set UPDATE, so any number of threads and processes can share the table.
+    A claimed job holds a lease for PUBLISH_LEASE_SECONDS, which settings.py requires to outlast any send;
+    a job whose lease expired belongs to a worker that died mid-send and is
+    marked unknown rather than sent again. Failed attempts back off exponentially until PUBLISH_MAX_ATTEMPTS;
+    rate-limited ones (see ratelimit.py) wait for the budget to reset and do not count as attempts.
+    No DB connection is held while a platform API call is in flight.
+    """
+
+    def __init__(self, session_factory=SessionLocal, publishers: Optional[Dict[str, Callable]] = None):
+        self._session_factory = session_factory
+        self._publishers = publishers if publishers is not None else PUBLISHERS
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._calls: Optional[ThreadPoolExecutor] = None
+
+    # --- Public API ---
+
+    def start(self, workers: Optional[int] = None) -> None:
+        count = get_settings().publish_workers if workers is None else workers
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for i in range(max(0, count)):
+                thread = threading.Thread(target=self._run, name=f"autosocial-publisher-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = 10.0) -> None:
+        with self._lock:
+            threads, self._threads = self._threads, []
+        self._stop.set()
+        self._wake.set()
+        for thread in threads:
+            thread.join(timeout)
+        with self._lock:
+            calls, self._calls = self._calls, None
+        if calls is not None:
+            # Let in-flight API calls record their outcome; an unrecorded success would be re-sent after the lease.
+            calls.shutdown(wait=True)
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def run_once(self, worker: Optional[str] = None) -> bool:
+        """
+        Claim one due job, plus any other due jobs for the same post, and publish them concurrently.
+        Returns False when nothing was due.
+        """
+        worker = worker or f"{os.getpid()}-{threading.current_thread().name}"
+        jobs = self._claim(worker)
+        if not jobs:
+            return False
+        self._process(jobs, worker)
+        return True
+
+    # --- Internals ---
+
+    def _run(self) -> None:
+        worker = f"{os.getpid()}-{threading.current_thread().name}"
+        while not self._stop.is_set():
+            try:
+                if self.run_once(worker):
+                    continue
+                sleep_for = self.seconds_until_due()
+            except Exception as e:
+                logger.warning("Publish worker error: %s", e)
+                sleep_for = get_settings().publish_max_sleep_seconds
+            # Sleep until the next job is due; enqueue_publish() wakes workers in this process early.
+            self._wake.wait(sleep_for)
+            self._wake.clear()
+
+    def seconds_until_due(self) -> float:
+        """
+        Seconds until the earliest queued job is due or running lease expires, capped at
+        PUBLISH_MAX_SLEEP_SECONDS so jobs queued by other processes are picked up too.
+        """
+        cap = max(0.1, get_settings().publish_max_sleep_seconds)
+        db = self._session_factory()
+        try:
+            due = [
+                db.scalar(select(func.min(PublishJob.next_attempt_at)).where(PublishJob.status == "queued")),
+                db.scalar(select(func.min(PublishJob.lease_until)).where(PublishJob.status == "running")),
+            ]
+        finally:
+            db.close()
+        due = [d for d in due if d is not None]
+        if not due:
+            return cap
+        return min(cap, max(0.05, (min(due) - datetime.now()).total_seconds()))
+
+    @staticmethod
+    def _claimable(now: datetime):
+        return and_(PublishJob.status == "queued", PublishJob.next_attempt_at <= now)
+
+    def _claim(self, worker: str) -> List[PublishJob]:
+        db = self._session_factory(expire_on_commit=False)
+        try:
+            now = datetime.now()
+            lease = timedelta(seconds=get_settings().publish_lease_seconds)
+            # A send outlives nothing longer than its lease, so an expired one was cut short by a dead worker.
+            expired = and_(PublishJob.status == "running", PublishJob.lease_until < now)
+            for job_id, platform in db.execute(select(PublishJob.id, PublishJob.platform).where(expired)).all():
+                res = db.execute(
+                    update(PublishJob)
+                    .where(PublishJob.id == job_id, expired)
+                    .values(status="unknown", last_error=_ABANDONED, lease_until=None, completed_at=now)
+                )
+                if res.rowcount == 1:
+                    PUBLISH_ATTEMPTS.labels(platform, "unknown").inc()
+                    logger.warning("Publish job %s (%s) was abandoned mid-send; marked unknown", job_id, platform)
+            # SKIP LOCKED lets Postgres workers claim different jobs without waiting on each other;
+            # SQLite ignores it and the conditional UPDATE below still makes each claim exclusive.
+            candidates = list(
+                db.execute(
+                    select(PublishJob.id, PublishJob.post_id)
+                    .where(self._claimable(now))
+                    .order_by(PublishJob.next_attempt_at, PublishJob.id)
+                    .limit(10)
+                    .with_for_update(skip_locked=True)
+                )
+            )
+            claimed = []
+            for job_id, post_id in candidates:
+                if claimed and post_id != claimed[0][1]:
+                    continue
+                res = db.execute(
+                    update(PublishJob)
+                    .where(PublishJob.id == job_id, self._claimable(now))
+                    .values(status="running", worker=worker, lease_until=now + lease, attempts=PublishJob.attempts + 1)
+                )
+                if res.rowcount == 1:
+                    claimed.append((job_id, post_id))
+            db.commit()
+            return [db.get(PublishJob, job_id) for job_id, _ in claimed]
+        finally:
+            db.close()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._calls is None:
+                self._calls = ThreadPoolExecutor(max_workers=_MAX_CONCURRENT_CALLS, thread_name_prefix="autosocial-publish-call")
+            return self._calls
+
+    def _process(self, jobs: List[PublishJob], worker: str) -> None:
+        with querystats.track(f"publish post {jobs[0].post_id}"):
+            self._process_jobs(jobs, worker)
+
+    def _process_jobs(self, jobs: List[PublishJob], worker: str) -> None:
+        db = self._session_factory()
+        try:
+            post = db.get(GeneratedPost, jobs[0].post_id)
+            content = str(post.content) if post is not None else None
+            trace_id = post.trace_id if post is not None else None
+        finally:
+            db.close()
+
+        # Platforms share one deadline and run side by side, so the slowest API bounds the wait
+        # instead of the sum. Each call records its own outcome; a call still running at the deadline
+        # keeps its lease and finishes in the background without holding up this worker.
+        deadline = time.monotonic() + max(1.0, get_settings().publish_deadline_seconds)
+        calls = [self._executor().submit(self._publish_one, job, worker, content, deadline, trace_id) for job in jobs]
+        _, late = wait(calls, timeout=max(0.0, deadline - time.monotonic()))
+        for job, call in zip(jobs, calls):
+            if call in late:
+                logger.warning("Publish job %s (%s) is still running at the deadline", job.id, job.platform)
+
+    def _publish_one(
+        self, job: PublishJob, worker: str, content: Optional[str], deadline: float, trace_id: Optional[str] = None
+    ) -> None:
+        # The publish span joins the trace the post was generated in (a new trace for posts without one).
+        with tracing.span(f"publish.{job.platform}", trace_id=trace_id, kind=tracing.CLIENT, job_id=job.id, attempt=job.attempts) as span:
+            self._publish_traced(job, worker, content, deadline, span)
+
+    def _publish_traced(self, job: PublishJob, worker: str, content: Optional[str], deadline: float, span) -> None:
+        publisher = self._publishers.get(job.platform)
+        if content is None:
+            self._finish(job, worker, error="Post not found.", final=True)
+            return
+        if publisher is None:
+            self._finish(job, worker, error="Unsupported platform", final=True)
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            # Queued behind other calls past the deadline: nothing was sent, so try again later.
+            self._finish(job, worker, error="Publish deadline passed before sending", deferred_until=datetime.now())
+            return
+        try:
+            result = publisher(content, job, max(1.0, remaining))
+        except Exception as e:
+            # Publishers report platform errors as results; an exception may have come after sending.
+            result = {"error": f"{type(e).__name__}: {e}", "outcome_unknown": True}
+        if isinstance(result, dict) and result.get("error"):
+            span.error = str(result["error"])
+        if isinstance(result, dict) and result.get("outcome_unknown"):
+            self._finish(job, worker, error=str(result["error"]), unknown=True)
+        elif isinstance(result, dict) and result.get("rate_limited"):
+            # Nothing was sent: wait for the budget to reset without using up an attempt.
+            self._finish(job, worker, error=str(result["error"]), deferred_until=datetime.fromisoformat(result["retry_at"]))
+        elif isinstance(result, dict) and result.get("error"):
+            self._finish(job, worker, error=str(result["error"]))
+        else:
+            self._finish(job, worker, result=result)
+
+    def _finish(
+        self,
+        job: PublishJob,
+        worker: str,
+        result=None,
+        error: Optional[str] = None,
+        final: bool = False,
+        deferred_until: Optional[datetime] = None,
+        unknown: bool = False,
+    ) -> None:
+        settings = get_settings()
+        now = datetime.now()
+        owned = and_(PublishJob.id == job.id, PublishJob.status == "running", PublishJob.worker == worker)
+        if error is None:
+            # A send that outlived its lease was marked unknown; its own success settles it.
+            owned = and_(PublishJob.id == job.id, PublishJob.status.in_(("running", "unknown")), PublishJob.worker == worker)
+        if unknown:
+            values = {"status": "unknown", "last_error": error, "completed_at": now}
+            PUBLISH_ATTEMPTS.labels(job.platform, "unknown").inc()
+        elif deferred_until is not None:
+            values = {
+                "status": "queued",
+                "last_error": error,
+                "next_attempt_at": max(deferred_until, now),
+                "attempts": PublishJob.attempts - 1,
+            }
+            PUBLISH_ATTEMPTS.labels(job.platform, "deferred").inc()
+        elif error is None:
+            values = {"status": "succeeded", "result": json.dumps(result, default=str), "last_error": None, "completed_at": now}
+            PUBLISH_ATTEMPTS.labels(job.platform, "succeeded").inc()
+        elif final or job.attempts >= settings.publish_max_attempts:
+            values = {"status": "failed", "last_error": error, "completed_at": now}
+            PUBLISH_ATTEMPTS.labels(job.platform, "failed").inc()
+        else:
+            delay = settings.publish_retry_base_seconds * (2 ** (job.attempts - 1))
+            delay *= random.uniform(0.8, 1.2)
+            values = {"status": "queued", "last_error": error, "next_attempt_at": now + timedelta(seconds=delay)}
+            PUBLISH_ATTEMPTS.labels(job.platform, "retry").inc()
+            RETRIES.labels("publish").inc()
+        values["lease_until"] = None
+
+        db = self._session_factory()
+        try:
+            # Lock the post first: sibling platforms finish concurrently and each rewrites post.platform.
+            post = None
+            if error is None:
+                post = db.query(GeneratedPost).filter(GeneratedPost.id == job.post_id).with_for_update().first()
+            res = db.execute(update(PublishJob).where(owned).values(**values))
+            if res.rowcount != 1:
+                # Lease expired and another worker took the job over; its outcome wins.
+                db.rollback()
+                logger.warning("Publish job %s was reclaimed before worker %s finished", job.id, worker)
+                return
+            if post is not None:
+                _mark_posted(db, post)
+            db.commit()
+        finally:
+            db.close()
+        if unknown:
+            logger.warning("Publish job %s (%s) outcome unknown, not retrying: %s", job.id, job.platform, error)
+        elif deferred_until is not None:
+            logger.info("Publish job %s (%s) deferred until %s: %s", job.id, job.platform, deferred_until, error)
+        elif error is not None:
+            logger.warning("Publish job %s (%s) attempt %s failed: %s", job.id, job.platform, job.attempts, error)
+
+
+def _mark_posted(db, post: GeneratedPost) -> None:
+    published = db.scalars(
+        select(PublishJob.platform)
+        .where(PublishJob.post_id == post.id, PublishJob.status == "succeeded")
+        .order_by(PublishJob.completed_at, PublishJob.id)
+    )
+    post.status = "posted"
+    post.platform = ",".join(published)
+
+
+def resolve_unknown(db, job_id: int, posted: bool) -> Optional[PublishJob]:
+    """
+    Settle a job whose outcome is unknown once someone has checked the platform: mark it succeeded
+    (and the post posted) when the post went out, or queue it to be sent again when it did not.
+    Returns None when the job does not exist or is not unknown.
+    """
+    job = db.get(PublishJob, job_id)
+    if job is None or job.status != "unknown":
+        return None
+    now = datetime.now()
+    post = db.query(GeneratedPost).filter(GeneratedPost.id == job.post_id).with_for_update().first()
+    if posted:
+        values = {"status": "succeeded", "last_error": None, "completed_at": now, "result": json.dumps({"confirmed": True})}
+    else:
+        values = {"status": "queued", "attempts": 0, "last_error": None, "completed_at": None, "next_attempt_at": now}
+    res = db.execute(update(PublishJob).where(PublishJob.id == job_id, PublishJob.status == "unknown").values(**values))
+    if res.rowcount != 1:
+        db.rollback()
+        return None
+    if posted and post is not None:
+        _mark_posted(db, post)
+    db.commit()
+    db.refresh(job)
+    if not posted:
+        publish_workers.wake()
+    return job
+
+
+publish_workers = PublishWorkerPool()
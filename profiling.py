@@ -0,0 +1,200 @@
+"""
+Opt-in sampling profiler for single requests.
+
+With PROFILING_ENABLED=true, a request carrying X-Profile: 1 and a valid X-SECRET-KEY is profiled: a
+sampler thread records the stack of every thread currently inside the request's endpoint function
+every PROFILE_SAMPLE_INTERVAL_MS. That covers async endpoints on the event loop and sync endpoints in
+the threadpool alike, and, being wall-clock, includes provider and DB waits. The last
+PROFILE_BUFFER_SIZE profiles are kept in memory per worker process and can be downloaded as pstats
+(snakeviz, python -m pstats) or collapsed stacks (flamegraph.pl, speedscope).
+
+Samples are matched by code object only: a thread running the same endpoint for another, concurrent
+request can't be told apart (sync endpoints run on any threadpool thread, async ones share the event
+loop), so its stacks are merged into the profile. Each profile reports how many such other calls it
+saw as merged_calls; profile a route while it is otherwise idle for a clean picture.
+"""
+from __future__ import annotations
+
+import io
+import marshal
+import sys
+import threading
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import count
+from typing import Deque, Dict, List, Optional, Tuple
+
+from settings import get_settings
+
+_FrameKey = Tuple[str, int, str]  # (filename, first line, function) as used by pstats
+
+
+@dataclass
+class RequestProfile:
+    id: int
+    method: str
+    path: str
+    started_at: datetime
+    interval: float
+    route: Optional[str] = None
+    status: Optional[int] = None
+    duration_ms: Optional[float] = None
+    # Sampled stacks (root first) -> number of samples
+    stacks: Counter = field(default_factory=Counter)
+    # ids of the endpoint frames sampled; more than one means concurrent calls were merged in
+    endpoint_frames: set = field(default_factory=set, repr=False)
+
+    @property
+    def merged_calls(self) -> int:
+        return max(0, len(self.endpoint_frames) - 1)
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": self.duration_ms,
+            "samples": self.samples,
+            "merged_calls": self.merged_calls,
+            "interval_ms": round(self.interval * 1000, 3),
+        }
+
+    def collapsed(self) -> str:
+        """
+        One "frame;frame;frame count" line per distinct stack (Brendan Gregg's folded format).
+        """
+        lines = []
+        for stack, n in self.stacks.most_common():
+            lines.append(";".join(f"{func} ({filename.rsplit('/', 1)[-1]}:{line})" for filename, line, func in stack) + f" {n}")
+        return "\n".join(lines) + "\n"
+
+    def pstats(self) -> bytes:
+        """
+        Samples converted to the marshalled dict pstats.Stats loads: call counts are sample counts and
+        times are samples * interval.
+        """
+        stats: Dict[_FrameKey, list] = {}
+        for stack, n in self.stacks.items():
+            seconds = n * self.interval
+            seen = set()
+            for depth, frame in enumerate(stack):
+                entry = stats.setdefault(frame, [0, 0, 0.0, 0.0, {}])
+                if frame in seen:
+                    continue  # recursion: count cumulative time once per sample
+                seen.add(frame)
+                entry[0] += n
+                entry[1] += n
+                entry[3] += seconds
+                if depth == len(stack) - 1:
+                    entry[2] += seconds
+                if depth:
+                    caller = stack[depth - 1]
+                    nc, cc, tt, ct = entry[4].get(caller, (0, 0, 0.0, 0.0))
+                    entry[4][caller] = (nc + n, cc + n, tt + (seconds if depth == len(stack) - 1 else 0.0), ct + seconds)
+        buf = io.BytesIO()
+        marshal.dump({k: (v[0], v[1], v[2], v[3], v[4]) for k, v in stats.items()}, buf)
+        return buf.getvalue()
+
+
+class _Sampler:
+    def __init__(self, profile: RequestProfile, scope: dict):
+        self._profile = profile
+        self._scope = scope
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profile-{profile.id}", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self._profile.interval):
+            endpoint = self._scope.get("endpoint")
+            code = getattr(endpoint, "__code__", None)
+            if code is None:
+                continue  # not routed yet
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                found = self._stack_in(frame, code)
+                if found:
+                    stack, endpoint_frame = found
+                    self._profile.stacks[stack] += 1
+                    self._profile.endpoint_frames.add(id(endpoint_frame))
+
+    @staticmethod
+    def _stack_in(frame, code) -> Optional[Tuple[Tuple[_FrameKey, ...], object]]:
+        """
+        The part of the stack from the endpoint function down and the endpoint's frame, or None when the
+        thread is not inside it.
+        """
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            if frame.f_code is code:
+                return tuple(
+                    (f.f_code.co_filename, f.f_code.co_firstlineno, f.f_code.co_name) for f in reversed(frames)
+                ), frame
+            frame = frame.f_back
+        return None
+
+
+class Profiler:
+    """
+    Starts samplers for opted-in requests and keeps the most recent profiles.
+    """
+
+    def __init__(self, maxlen: Optional[int] = None):
+        self._profiles: Deque[RequestProfile] = deque(maxlen=maxlen or get_settings().profile_buffer_size)
+        self._ids = count(1)
+        self._lock = threading.Lock()
+
+    def start(self, method: str, path: str, scope: dict) -> Tuple[RequestProfile, _Sampler]:
+        interval = max(0.001, get_settings().profile_sample_interval_ms / 1000.0)
+        profile = RequestProfile(next(self._ids), method, path, datetime.now(), interval)
+        sampler = _Sampler(profile, scope)
+        sampler.start()
+        return profile, sampler
+
+    def finish(self, profile: RequestProfile, sampler: _Sampler, status: int, elapsed: float, route: Optional[str]) -> None:
+        sampler.stop()
+        profile.status = status
+        profile.duration_ms = round(elapsed * 1000, 1)
+        profile.route = route
+        with self._lock:
+            self._profiles.append(profile)
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            return [p.summary() for p in reversed(self._profiles)]
+
+    def get(self, profile_id: int) -> Optional[RequestProfile]:
+        with self._lock:
+            return next((p for p in self._profiles if p.id == profile_id), None)
+
+
+def wants_profile(headers) -> bool:
+    """
+    True when profiling is enabled and the request opted in with X-Profile and the settings secret.
+    """
+    settings = get_settings()
+    if not settings.profiling_enabled or not settings.secret_key:
+        return False
+    if headers.get("x-profile", "").lower() not in ("1", "true", "yes"):
+        return False
+    return headers.get("x-secret-key") == settings.secret_key
+
+
+profiler = Profiler()
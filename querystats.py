@@ -0,0 +1,118 @@
+"""
+Per-request and per-job SQL accounting.
+
+instrument_engine() hooks the engine's cursor events; while a track() block is active, every statement
+it runs (in the same context, including the threadpool that runs sync endpoints) is counted and timed
+against it. On exit a warning is logged when the block ran more than QUERY_BUDGET statements or
+repeated one statement shape QUERY_REPEAT_THRESHOLD times or more, which is usually an N+1 loop.
+Statements run on other threads (the write queue's writer, publish calls) are not attributed.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+
+from settings import get_settings
+
+logger = logging.getLogger("autosocial.querystats")
+
+_SHAPE_MAX_CHARS = 200
+
+_IN_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))+\s*\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """
+    The statement with literals and expanded IN lists collapsed, so repeats with different values match.
+    """
+    shape = _SPACE.sub(" ", statement).strip()
+    shape = _LITERAL.sub("?", shape)
+    return _IN_LIST.sub("(?)", shape)
+
+
+@dataclass
+class QueryStats:
+    label: str
+    count: int = 0
+    seconds: float = 0.0
+    shapes: Counter = field(default_factory=Counter)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, statement: str, seconds: float) -> None:
+        shape = statement_shape(statement)
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+            self.shapes[shape] += 1
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        with self._lock:
+            return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+    def headers(self) -> dict:
+        return {"X-DB-Queries": str(self.count), "X-DB-Time-Ms": f"{self.seconds * 1000:.1f}"}
+
+
+_active: ContextVar[Optional[QueryStats]] = ContextVar("autosocial_query_stats", default=None)
+
+
+def current() -> Optional[QueryStats]:
+    return _active.get()
+
+
+@contextmanager
+def track(label: str) -> Iterator[QueryStats]:
+    """
+    Attribute statements run inside the block to a new QueryStats and check it against the budgets.
+    Nested blocks count towards the innermost one only.
+    """
+    stats = QueryStats(label)
+    token = _active.set(stats)
+    try:
+        yield stats
+    finally:
+        _active.reset(token)
+        check(stats)
+
+
+def check(stats: QueryStats) -> None:
+    settings = get_settings()
+    if settings.query_budget and stats.count > settings.query_budget:
+        logger.warning(
+            "%s ran %s SQL statements (budget %s, %.1f ms)",
+            stats.label, stats.count, settings.query_budget, stats.seconds * 1000,
+        )
+    if settings.query_repeat_threshold:
+        for shape, n in stats.repeated(settings.query_repeat_threshold):
+            logger.warning("%s repeated a statement %s times (possible N+1): %s", stats.label, n, shape[:_SHAPE_MAX_CHARS])
+
+
+def instrument_engine(engine) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        if _active.get() is not None:
+            conn.info.setdefault("querystats_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        stats = _active.get()
+        starts = conn.info.get("querystats_start")
+        if stats is not None and starts:
+            stats.add(statement, time.perf_counter() - starts.pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _drop(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("querystats_start"):
+            conn.info["querystats_start"].pop()
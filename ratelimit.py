@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Column, DateTime, Float, Integer, String, UniqueConstraint
+from sqlalchemy.exc import IntegrityError
+
+from db import Base, SessionLocal
+from metrics import RATE_LIMITED
+
+logger = logging.getLogger("autosocial.ratelimit")
+
+# Used when a 429 carries no reset information.
+_DEFAULT_BACKOFF_SECONDS = 15 * 60
+
+
+class RateLimitBudget(Base):
+    """
+    Token bucket per (account, bucket), shared by all workers.
+
+    Buckets learned from response headers hold the platform's own numbers (capacity = limit,
+    tokens = remaining) and refill completely at reset_at. Configured buckets refill continuously at
+    refill_per_second. A 429 empties a bucket until the platform's retry time.
+    """
+
+    __tablename__ = "rate_limit_budgets"
+
+    id = Column(Integer, primary_key=True)
+    account = Column(String, nullable=False, index=True)  # e.g. "x:3f2a..." (hashed credentials) or "linkedin:urn:..."
+    bucket = Column(String, nullable=False)  # e.g. "window", "24h", "daily", "throttle"
+    capacity = Column(Float, nullable=False)
+    tokens = Column(Float, nullable=False)
+    refill_per_second = Column(Float, nullable=False, default=0.0)
+    reset_at = Column(DateTime, nullable=True)  # local time the bucket refills to capacity
+    updated_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (UniqueConstraint("account", "bucket", name="uq_rate_limit_budgets_account_bucket"),)
+
+
+def account_key(platform: str, identity: str) -> str:
+    """
+    Stable, non-secret key for an account; credentials are hashed rather than stored.
+    """
+    if identity.startswith("urn:"):
+        return f"{platform}:{identity}"
+    return f"{platform}:{hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _refill(row: RateLimitBudget, now: datetime) -> None:
+    if row.reset_at is not None and now >= row.reset_at:
+        row.tokens = row.capacity
+        row.reset_at = None
+    elif row.refill_per_second:
+        elapsed = max(0.0, (now - row.updated_at).total_seconds())
+        row.tokens = min(row.capacity, row.tokens + elapsed * row.refill_per_second)
+    row.updated_at = now
+
+
+def _expired_throttle(db, row: RateLimitBudget, now: datetime) -> bool:
+    # A 429 backoff only lasts until its retry time; afterwards the other buckets decide again.
+    if row.bucket == "throttle" and (row.reset_at is None or now >= row.reset_at):
+        db.delete(row)
+        return True
+    return False
+
+
+def _retry_at(row: RateLimitBudget, now: datetime) -> datetime:
+    if row.reset_at is not None:
+        return row.reset_at
+    if row.refill_per_second:
+        return now + timedelta(seconds=(1 - row.tokens) / row.refill_per_second)
+    return now + timedelta(seconds=_DEFAULT_BACKOFF_SECONDS)
+
+
+def _upsert(db, account: str, bucket: str, **values) -> RateLimitBudget:
+    row = (
+        db.query(RateLimitBudget)
+        .filter(RateLimitBudget.account == account, RateLimitBudget.bucket == bucket)
+        .with_for_update()
+        .first()
+    )
+    if row is None:
+        row = RateLimitBudget(account=account, bucket=bucket, **values)
+        db.add(row)
+    else:
+        for name, value in values.items():
+            setattr(row, name, value)
+    return row
+
+
+class RateLimiter:
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+
+    def configure(self, account: str, bucket: str, per_period: int, period_seconds: float) -> None:
+        """
+        Ensure account has a configured token bucket of per_period tokens per period_seconds (no-op when per_period <= 0).
+        """
+        if per_period <= 0:
+            return
+        refill = per_period / period_seconds
+        db = self._session_factory()
+        try:
+            row = (
+                db.query(RateLimitBudget)
+                .filter(RateLimitBudget.account == account, RateLimitBudget.bucket == bucket)
+                .first()
+            )
+            if row is not None and (row.capacity != per_period or row.refill_per_second != refill):
+                # The configured budget changed; keep the tokens already spent.
+                row.tokens = min(float(per_period), row.tokens)
+                row.capacity = float(per_period)
+                row.refill_per_second = refill
+                db.commit()
+            elif row is None:
+                db.add(
+                    RateLimitBudget(
+                        account=account,
+                        bucket=bucket,
+                        capacity=float(per_period),
+                        tokens=float(per_period),
+                        refill_per_second=refill,
+                        updated_at=datetime.now(),
+                    )
+                )
+                db.commit()
+        except IntegrityError:
+            db.rollback()
+        finally:
+            db.close()
+
+    def acquire(self, account: str) -> Tuple[bool, Optional[datetime]]:
+        """
+        Take one token from every bucket of account. Returns (True, None), or (False, retry_at) without
+        consuming anything when any bucket is empty.
+        """
+        now = datetime.now()
+        db = self._session_factory()
+        try:
+            rows = (
+                db.query(RateLimitBudget)
+                .filter(RateLimitBudget.account == account)
+                .order_by(RateLimitBudget.id)
+                .with_for_update()
+                .all()
+            )
+            rows = [row for row in rows if not _expired_throttle(db, row, now)]
+            for row in rows:
+                _refill(row, now)
+            empty = [row for row in rows if row.tokens < 1]
+            if empty:
+                db.commit()
+                RATE_LIMITED.labels(account.split(":", 1)[0], "budget").inc()
+                return False, max(_retry_at(row, now) for row in empty)
+            for row in rows:
+                row.tokens -= 1
+            db.commit()
+            return True, None
+        finally:
+            db.close()
+
+    def learn(self, account: str, buckets: Dict[str, Tuple[float, float, Optional[datetime]]]) -> None:
+        """
+        Record {bucket: (limit, remaining, reset_at)} as reported by the platform.
+        """
+        if not buckets:
+            return
+        now = datetime.now()
+        db = self._session_factory()
+        try:
+            for bucket, (limit, remaining, reset_at) in buckets.items():
+                if reset_at is None and remaining < 1:
+                    # An empty bucket with no (parseable) reset would never refill: nothing is sent, so no
+                    # new headers arrive to correct it.
+                    reset_at = now + timedelta(seconds=_DEFAULT_BACKOFF_SECONDS)
+                _upsert(
+                    db,
+                    account,
+                    bucket,
+                    capacity=float(max(limit, remaining, 1)),
+                    tokens=float(remaining),
+                    refill_per_second=0.0,
+                    reset_at=reset_at,
+                    updated_at=now,
+                )
+            db.commit()
+        except IntegrityError:
+            # Another worker inserted the same bucket first; its numbers are just as current.
+            db.rollback()
+        finally:
+            db.close()
+
+    def throttled(self, account: str, retry_at: Optional[datetime]) -> datetime:
+        """
+        Record a 429: the account is out of budget until retry_at. Returns the effective retry time.
+        """
+        now = datetime.now()
+        retry_at = retry_at or now + timedelta(seconds=_DEFAULT_BACKOFF_SECONDS)
+        RATE_LIMITED.labels(account.split(":", 1)[0], "response").inc()
+        self.learn(account, {"throttle": (1, 0, retry_at)})
+        return retry_at
+
+    def budgets(self) -> List[dict]:
+        now = datetime.now()
+        db = self._session_factory()
+        try:
+            rows = db.query(RateLimitBudget).order_by(RateLimitBudget.account, RateLimitBudget.bucket).all()
+            result = []
+            for row in rows:
+                if row.bucket == "throttle" and (row.reset_at is None or now >= row.reset_at):
+                    continue
+                _refill(row, now)
+                result.append(
+                    {
+                        "account": row.account,
+                        "bucket": row.bucket,
+                        "limit": row.capacity,
+                        "remaining": int(row.tokens),
+                        "reset_at": row.reset_at.isoformat() if row.reset_at else None,
+                        "refill_per_second": row.refill_per_second or None,
+                        "next_available_at": None if row.tokens >= 1 else _retry_at(row, now).isoformat(),
+                    }
+                )
+            # Read-only view: the refill above is not persisted.
+            db.rollback()
+            return result
+        finally:
+            db.close()
+
+
+def _epoch(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromtimestamp(int(value)) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(headers) -> Optional[datetime]:
+    """
+    Parse a Retry-After header (seconds or HTTP date) into local time.
+    """
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return datetime.now() + timedelta(seconds=float(value))
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).astimezone().replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return None
+
+
+def x_buckets(headers) -> Dict[str, Tuple[float, float, Optional[datetime]]]:
+    """
+    X reports the endpoint window as x-rate-limit-* and the daily posting cap as x-user-limit-24hour-*
+    (or x-app-limit-24hour-*).
+    """
+    buckets = {}
+    for bucket, prefix in (
+        ("window", "x-rate-limit"),
+        ("24h", "x-user-limit-24hour"),
+        ("app-24h", "x-app-limit-24hour"),
+    ):
+        limit, remaining = headers.get(f"{prefix}-limit"), headers.get(f"{prefix}-remaining")
+        if limit is None or remaining is None:
+            continue
+        try:
+            buckets[bucket] = (float(limit), float(remaining), _epoch(headers.get(f"{prefix}-reset")))
+        except ValueError:
+            continue
+    return buckets
+
+
+def rate_limited_result(platform: str, retry_at: datetime) -> dict:
+    """
+    Publisher result for a send that was not attempted (or was rejected with 429) because of rate limits.
+    """
+    return {
+        "error": f"{platform} rate limit reached; retry after {retry_at.isoformat(timespec='seconds')}",
+        "rate_limited": True,
+        "retry_at": retry_at.isoformat(),
+    }
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import Column, DateTime, MetaData, Table, delete, exists, func, inspect, or_, select, update
+
+from blob_store import ContentBlob, referenced_hashes, resolve_rows
+from db import FileChangeLog, GeneratedPost, WatchSessionLog, get_engine
+from dedupe import remove_signatures
+from outbox import PublishJob
+from search import remove_documents
+from settings import get_settings
+from watch_checkpoint import WatchSessionFile
+
+logger = logging.getLogger("autosocial.retention")
+
+# Per table: a list of rules. A row is removed when it matches a rule and is either older than
+# max_age_days or outside the newest max_rows rows matching that rule. Omit a limit to disable it.
+DEFAULT_POLICY: Dict[str, List[dict]] = {
+    "watch_session_logs": [{"max_age_days": 180, "max_rows": 5000}],
+    "file_change_logs": [{"max_age_days": 90, "max_rows": 50000}],
+    "generated_posts": [
+        {"status": "rejected", "max_age_days": 30, "max_rows": 2000},
+        {"status": "posted", "max_age_days": 180, "max_rows": 10000},
+    ],
+}
+
+_MODELS = {
+    "watch_session_logs": WatchSessionLog,
+    "file_change_logs": FileChangeLog,
+    "generated_posts": GeneratedPost,
+}
+_SEARCH_DOC_TYPES = {
+    "file_change_logs": "file_change",
+    "generated_posts": "post",
+}
+_AGE_COLUMNS = {
+    "watch_session_logs": "started_at",
+    "file_change_logs": "created_at",
+    "generated_posts": "created_at",
+}
+# Drafts still awaiting review or publishing are never removed.
+_PROTECTED_STATUSES = ("pending", "approved")
+# Nor are posts with a publish job that may still run or awaits resolve_unknown().
+_ACTIVE_JOB_STATUSES = ("queued", "running", "unknown")
+_MODES = ("delete", "table", "ndjson")
+_BATCH_PAUSE_SECONDS = 0.05
+
+_archive_metadata = MetaData()
+
+
+def load_policy() -> Dict[str, List[dict]]:
+    """
+    Default policy, with tables overridden by RETENTION_POLICY (JSON) when set.
+    """
+    policy = dict(DEFAULT_POLICY)
+    raw = get_settings().retention_policy
+    if raw:
+        overrides = json.loads(raw)
+        for table, rules in overrides.items():
+            if table not in _MODELS:
+                raise ValueError(f"Unknown retention table: {table}")
+            if not isinstance(rules, list):
+                raise ValueError(f"Retention rules for {table} must be a list.")
+            policy[table] = rules
+    for rule in policy.get("generated_posts", []):
+        if rule.get("status") in _PROTECTED_STATUSES:
+            raise ValueError(f"Retention cannot remove {rule['status']} posts.")
+    return policy
+
+
+def _rule_conditions(table: Table, rule: dict) -> list:
+    conditions = []
+    if table.name == "generated_posts":
+        if rule.get("status"):
+            conditions.append(table.c.status == rule["status"])
+        else:
+            conditions.append(table.c.status.notin_(_PROTECTED_STATUSES))
+        conditions.append(~exists().where(
+            PublishJob.post_id == table.c.id, PublishJob.status.in_(_ACTIVE_JOB_STATUSES)
+        ))
+    if table.name == "watch_session_logs":
+        # A session without ended_at may still be running.
+        conditions.append(table.c.ended_at.isnot(None))
+    return conditions
+
+
+def _expired_clause(conn, table: Table, rule: dict, conditions: list):
+    clauses = []
+    if rule.get("max_age_days") is not None:
+        age_col = table.c[_AGE_COLUMNS[table.name]]
+        cutoff = datetime.now() - timedelta(days=float(rule["max_age_days"]))
+        # A row without a timestamp has no known age; only max_rows can remove it.
+        clauses.append(age_col < cutoff)
+    if rule.get("max_rows") is not None:
+        boundary = conn.execute(
+            select(table.c.id).where(*conditions).order_by(table.c.id.desc()).offset(int(rule["max_rows"])).limit(1)
+        ).scalar()
+        if boundary is not None:
+            clauses.append(table.c.id <= boundary)
+    return or_(*clauses) if clauses else None
+
+
+def _archive_table(table: Table) -> Table:
+    name = f"{table.name}_archive"
+    if name in _archive_metadata.tables:
+        return _archive_metadata.tables[name]
+    columns = [Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False) for c in table.columns]
+    archive = Table(name, _archive_metadata, *columns, Column("archived_at", DateTime))
+    archive.create(bind=get_engine(), checkfirst=True)
+    return archive
+
+
+def _archive(conn, table: Table, ids: list, mode: str, key: str = "id") -> None:
+    rows = conn.execute(select(table).where(table.c[key].in_(ids))).mappings().all()
+    if not rows:
+        return
+    if mode == "table":
+        # Raw rows keep their blob references; compaction treats archive tables as live references.
+        now = datetime.now()
+        conn.execute(_archive_table(table).insert(), [{**row, "archived_at": now} for row in rows])
+    elif mode == "ndjson":
+        archive_dir = get_settings().retention_archive_dir
+        os.makedirs(archive_dir, exist_ok=True)
+        out_path = os.path.join(archive_dir, f"{table.name}-{datetime.now():%Y%m%d}.ndjson")
+        with open(out_path, "a", encoding="utf-8") as f:
+            for row in resolve_rows(conn, _MODELS.get(table.name), rows):
+                f.write(json.dumps(row, default=str) + "\n")
+
+
+def _purge(table: Table, rule: dict, mode: str, batch_size: int) -> int:
+    engine = get_engine()
+    removed = 0
+    with engine.connect() as conn:
+        conditions = _rule_conditions(table, rule)
+        expired = _expired_clause(conn, table, rule, conditions)
+    if expired is None:
+        return 0
+    if mode == "table":
+        # Created up front: on SQLite, DDL on another connection would wait for the batch's write lock.
+        _archive_table(table)
+        if table.name == "generated_posts":
+            _archive_table(PublishJob.__table__)
+    while True:
+        # One short transaction per batch so writers are never blocked for long.
+        with engine.begin() as conn:
+            ids = list(
+                conn.execute(
+                    select(table.c.id).where(*conditions, expired).order_by(table.c.id).limit(batch_size)
+                ).scalars()
+            )
+            if not ids:
+                break
+            if mode != "delete":
+                _archive(conn, table, ids, mode)
+            conn.execute(delete(table).where(table.c.id.in_(ids)))
+            if table.name in _SEARCH_DOC_TYPES:
+                remove_documents(conn, _SEARCH_DOC_TYPES[table.name], ids)
+            if table.name == "generated_posts":
+                remove_signatures(conn, ids)
+                # Their publish jobs are all finished (see _rule_conditions) and go with them.
+                jobs = PublishJob.__table__
+                if mode != "delete":
+                    _archive(conn, jobs, ids, mode, key="post_id")
+                conn.execute(delete(jobs).where(jobs.c.post_id.in_(ids)))
+                conn.execute(update(table).where(table.c.duplicate_of.in_(ids)).values(duplicate_of=None))
+        removed += len(ids)
+        if len(ids) < batch_size:
+            break
+        time.sleep(_BATCH_PAUSE_SECONDS)
+    return removed
+
+
+def _reference_tables(existing_tables: set):
+    # (model, table) for every live or archive table that can point at blobs
+    for model in (GeneratedPost, FileChangeLog):
+        for name in (model.__tablename__, f"{model.__tablename__}_archive"):
+            if name in existing_tables:
+                yield model, model.__table__ if name == model.__tablename__ else _archive_table(model.__table__)
+
+
+def _still_referenced(conn, existing_tables: set, hashes: List[str], since: Dict[str, int]) -> set:
+    """
+    Which of hashes are referenced now. Hash columns are checked directly; ai_results_refs (JSON) only on
+    rows newer than the scan, since file change logs are never updated after insert.
+    """
+    found = set()
+    for model, table in _reference_tables(existing_tables):
+        for col in ("content_hash", "diff_hash"):
+            if col in table.c:
+                found.update(conn.execute(select(table.c[col]).where(table.c[col].in_(hashes))).scalars())
+        if "ai_results_refs" in table.c:
+            rows = conn.execute(
+                select(table.c.ai_results_refs).where(
+                    table.c.id > since.get(table.name, 0), table.c.ai_results_refs.isnot(None)
+                )
+            )
+            for refs in rows.scalars():
+                found |= referenced_hashes(model, {"ai_results_refs": refs})
+    if WatchSessionFile.__tablename__ in existing_tables:
+        found.update(conn.execute(
+            select(WatchSessionFile.baseline_hash).where(WatchSessionFile.baseline_hash.in_(hashes))
+        ).scalars())
+    return found & set(hashes)
+
+
+def _delete_unreferenced(conn, existing_tables: set, hashes: List[str], since: Dict[str, int]) -> int:
+    # Lock the candidates first: writers insert or share-lock every blob they reference
+    # (blob_store.store_texts), so once this holds, every row that may point at one is
+    # committed and visible to the re-check below.
+    conn.execute(update(ContentBlob).where(ContentBlob.hash.in_(hashes)).values(hash=ContentBlob.hash))
+    orphans = [h for h in hashes if h not in _still_referenced(conn, existing_tables, hashes, since)]
+    if not orphans:
+        return 0
+    return int(conn.execute(delete(ContentBlob).where(ContentBlob.hash.in_(orphans))).rowcount or 0)
+
+
+def release_blobs(conn, hashes: List[str]) -> int:
+    """
+    Delete those of hashes that no row references any more, in the caller's transaction. Returns the
+    number of blobs deleted.
+    """
+    hashes = list(dict.fromkeys(h for h in hashes if h))
+    if not hashes:
+        return 0
+    existing_tables = set(inspect(conn).get_table_names())
+    return _delete_unreferenced(conn, existing_tables, hashes, {})
+
+
+def compact_blobs(batch_size: int) -> int:
+    """
+    Delete content blobs no longer referenced by any live or archived row.
+    """
+    engine = get_engine()
+    existing_tables = set(inspect(engine).get_table_names())
+    referenced = set()
+    since: Dict[str, int] = {}
+    with engine.connect() as conn:
+        for model, table in _reference_tables(existing_tables):
+            since[table.name] = conn.execute(select(func.max(table.c.id))).scalar() or 0
+            ref_cols = [c for c in ("content_hash", "diff_hash", "ai_results_refs") if c in table.c]
+            rows = conn.execution_options(yield_per=1000).execute(
+                select(*[table.c[c] for c in ref_cols]).where(table.c.id <= since[table.name])
+            )
+            for row in rows.mappings():
+                referenced |= referenced_hashes(model, row)
+        # Baselines of watch sessions that can still be resumed
+        if WatchSessionFile.__tablename__ in existing_tables:
+            rows = conn.execution_options(yield_per=1000).execute(
+                select(WatchSessionFile.baseline_hash).where(WatchSessionFile.baseline_hash.isnot(None))
+            )
+            referenced.update(rows.scalars())
+
+    removed = 0
+    last = ""
+    while True:
+        with engine.begin() as conn:
+            hashes = list(
+                conn.execute(
+                    select(ContentBlob.hash).where(ContentBlob.hash > last).order_by(ContentBlob.hash).limit(batch_size)
+                ).scalars()
+            )
+            if not hashes:
+                break
+            last = hashes[-1]
+            orphans = [h for h in hashes if h not in referenced]
+            if orphans:
+                removed += _delete_unreferenced(conn, existing_tables, orphans, since)
+        if len(hashes) < batch_size:
+            break
+        time.sleep(_BATCH_PAUSE_SECONDS)
+    return removed
+
+
+def run_retention() -> Dict[str, int]:
+    """
+    Apply the retention policy once and return the number of rows removed per table.
+    """
+    settings = get_settings()
+    mode = (settings.retention_mode or "delete").strip().lower()
+    if mode not in _MODES:
+        raise ValueError(f"Invalid RETENTION_MODE: {mode}. Use one of {', '.join(_MODES)}.")
+    batch_size = max(1, settings.retention_batch_size)
+
+    stats: Dict[str, int] = {}
+    for table_name, rules in load_policy().items():
+        table = _MODELS[table_name].__table__
+        stats[table_name] = sum(_purge(table, rule, mode, batch_size) for rule in rules)
+    stats["content_blobs"] = compact_blobs(batch_size)
+    logger.info("Retention run complete (mode=%s): %s", mode, stats)
+    return stats
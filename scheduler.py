@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from sqlalchemy import Column, DateTime, Integer, String, UniqueConstraint
+from sqlalchemy.exc import IntegrityError
+
+from db import Base, SessionLocal
+import querystats
+
+logger = logging.getLogger("autosocial.scheduler")
+
+# Upper bound on a single sleep, so clock changes and long waits are re-evaluated now and then.
+_MAX_SLEEP_SECONDS = 6 * 60 * 60
+
+
+class ScheduledRun(Base):
+    """
+    One row per (task, period) that has been started. The unique constraint is the claim: every
+    worker process wakes at the due time, but only the one whose insert succeeds runs the task.
+    """
+
+    __tablename__ = "scheduled_runs"
+
+    id = Column(Integer, primary_key=True)
+    task = Column(String, nullable=False)
+    period = Column(String, nullable=False)  # e.g. "2026-11" for a monthly task
+    started_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (UniqueConstraint("task", "period", name="uq_scheduled_runs_task_period"),)
+
+
+def first_of_next_month(now: datetime) -> datetime:
+    if now.month == 12:
+        return datetime(now.year + 1, 1, 1)
+    return datetime(now.year, now.month + 1, 1)
+
+
+def month_period(due: datetime) -> str:
+    return f"{due:%Y-%m}"
+
+
+@dataclass
+class _Task:
+    name: str
+    next_due: Callable[[datetime], datetime]  # now -> next due time (local)
+    period: Callable[[datetime], str]  # due time -> claim key
+    fn: Callable[[], None]
+    due: Optional[datetime] = None
+
+
+class Scheduler:
+    """
+    Runs registered tasks at their due times from one thread per process.
+
+    The thread sleeps until the earliest due task instead of waking up on a fixed interval, and a
+    task runs once per period across workers (see ScheduledRun).
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+        self._tasks: List[_Task] = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def register(self, name: str, next_due: Callable[[datetime], datetime], period: Callable[[datetime], str], fn) -> None:
+        with self._lock:
+            self._tasks.append(_Task(name, next_due, period, fn))
+        self._wake.set()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="autosocial-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def claim(self, task: str, period: str) -> bool:
+        db = self._session_factory()
+        try:
+            db.add(ScheduledRun(task=task, period=period))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def run_due(self, now: Optional[datetime] = None) -> None:
+        """
+        Run every task whose due time has passed (claiming it first), then compute its next due time.
+        """
+        now = now or datetime.now()
+        with self._lock:
+            tasks = list(self._tasks)
+        for task in tasks:
+            if task.due is None:
+                task.due = task.next_due(now)
+            if task.due > now:
+                continue
+            due, task.due = task.due, task.next_due(now)
+            try:
+                if self.claim(task.name, task.period(due)):
+                    with querystats.track(f"scheduled task {task.name}"):
+                        task.fn()
+            except Exception as e:
+                logger.warning("Scheduled task %s failed: %s", task.name, e)
+
+    def seconds_until_due(self, now: Optional[datetime] = None) -> float:
+        now = now or datetime.now()
+        with self._lock:
+            due = [t.due for t in self._tasks if t.due is not None]
+        if not due:
+            return _MAX_SLEEP_SECONDS
+        return min(_MAX_SLEEP_SECONDS, max(0.0, (min(due) - now).total_seconds()))
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.run_due()
+            self._wake.wait(self.seconds_until_due())
+            self._wake.clear()
+
+
+scheduler = Scheduler()
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import logging
+import re
+from typing import Dict, List, Optional
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, Text, event, func, select, text
+from sqlalchemy import inspect as sa_inspect
+
+from blob_store import batched_hydration, offloaded_in_flush
+from db import FileChangeLog, GeneratedPost, SessionSummaryPost, SessionLocal, get_engine
+
+logger = logging.getLogger("autosocial.search")
+
+# doc_type -> (model, rowid prefix used by the SQLite index, indexed attributes)
+DOC_TYPES = {
+    "post": (GeneratedPost, 1, ("file", "content")),
+    "file_change": (FileChangeLog, 2, ("file_path", "diff_summary")),
+    "session_summary": (SessionSummaryPost, 3, ("summary",)),
+}
+_MODEL_DOC_TYPES = {model: name for name, (model, _, _) in DOC_TYPES.items()}
+_ROWID_SHIFT = 40
+# Around matched terms in snippets; control characters, so brackets in code can't be mistaken for them.
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+# Postgres (and other non-SQLite databases) keep documents in a regular table; SQLite uses FTS5.
+# Both hold their own copy of every indexed text. Source columns may be offloaded to content_blobs
+# (compressed, see blob_store.py), which neither an external-content FTS5 table nor a generated tsvector
+# column can read, and a contentless FTS5 table has no text for snippet(). The copy is what snippets and
+# ranking are served from; it is plain text, so an index costs roughly the uncompressed size of the
+# documents on top of the source tables.
+_search_metadata = MetaData()
+search_documents = Table(
+    "search_documents",
+    _search_metadata,
+    Column("doc_type", String(20), primary_key=True),
+    Column("doc_id", Integer, primary_key=True),
+    Column("body", Text, nullable=False),
+)
+
+_ready = set()  # engine URLs whose index exists
+
+
+def _dialect(bind) -> str:
+    name = bind.dialect.name
+    return "postgres" if name.startswith("postgres") else name
+
+
+def ensure_search_index(bind=None) -> bool:
+    """
+    Create the full-text index structures if missing. Returns False if the database can't host them.
+    """
+    bind = bind if bind is not None else get_engine()
+    kind = _dialect(bind)
+    try:
+        with bind.begin() as conn:
+            if kind == "sqlite":
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index "
+                    "USING fts5(body, tokenize='porter unicode61')"
+                ))
+            else:
+                search_documents.create(bind=conn, checkfirst=True)
+                if kind == "postgres":
+                    conn.execute(text(
+                        "ALTER TABLE search_documents ADD COLUMN IF NOT EXISTS tsv tsvector "
+                        "GENERATED ALWAYS AS (to_tsvector('english', body)) STORED"
+                    ))
+                    conn.execute(text(
+                        "CREATE INDEX IF NOT EXISTS ix_search_documents_tsv ON search_documents USING GIN (tsv)"
+                    ))
+    except Exception as e:
+        logger.warning("Full-text search is unavailable: %s", e)
+        return False
+    _ready.add(str(bind.url))
+    return True
+
+
+def _rowid(doc_type: str, doc_id: int) -> int:
+    return (DOC_TYPES[doc_type][1] << _ROWID_SHIFT) | int(doc_id)
+
+
+def _index_many(connection, doc_type: str, bodies: Dict[int, str]) -> None:
+    # doc id -> body, written with one executemany per statement
+    kind = _dialect(connection)
+    if kind == "sqlite":
+        params = [{"rowid": _rowid(doc_type, doc_id), "body": body} for doc_id, body in bodies.items()]
+        connection.execute(text("DELETE FROM search_index WHERE rowid = :rowid"), params)
+        connection.execute(text("INSERT INTO search_index (rowid, body) VALUES (:rowid, :body)"), params)
+    elif kind == "postgres":
+        from sqlalchemy.dialects.postgresql import insert
+
+        stmt = insert(search_documents)
+        connection.execute(
+            stmt.on_conflict_do_update(index_elements=["doc_type", "doc_id"], set_={"body": stmt.excluded.body}),
+            [{"doc_type": doc_type, "doc_id": doc_id, "body": body} for doc_id, body in bodies.items()],
+        )
+    else:
+        connection.execute(
+            search_documents.delete().where(
+                search_documents.c.doc_type == doc_type, search_documents.c.doc_id.in_(list(bodies))
+            )
+        )
+        connection.execute(
+            search_documents.insert(),
+            [{"doc_type": doc_type, "doc_id": doc_id, "body": body} for doc_id, body in bodies.items()],
+        )
+
+
+def index_document(connection, doc_type: str, doc_id: int, body: str) -> None:
+    _index_many(connection, doc_type, {doc_id: body})
+
+
+def index_rows(connection, doc_type: str, rows: List[dict]) -> None:
+    """
+    For bulk statements, which skip the flush listeners: (re)index raw row dicts holding "id" and the
+    plain text of the type's indexed attributes.
+    """
+    if not rows or str(connection.engine.url) not in _ready:
+        return
+    attrs = DOC_TYPES[doc_type][2]
+    _index_many(connection, doc_type, {row["id"]: "\n".join(str(row[a]) for a in attrs if row.get(a)) for row in rows})
+
+
+def remove_documents(connection, doc_type: str, doc_ids: List[int]) -> None:
+    if not doc_ids or str(connection.engine.url) not in _ready:
+        return
+    if _dialect(connection) == "sqlite":
+        rowids = [_rowid(doc_type, i) for i in doc_ids]
+        connection.execute(
+            text("DELETE FROM search_index WHERE rowid IN (%s)" % ", ".join(str(r) for r in rowids))
+        )
+    else:
+        connection.execute(
+            search_documents.delete().where(search_documents.c.doc_type == doc_type, search_documents.c.doc_id.in_(doc_ids))
+        )
+
+
+def _body(target, attrs, plain: Dict[str, str]) -> str:
+    parts = []
+    for attr in attrs:
+        value = plain.get(attr, getattr(target, attr))
+        if value:
+            parts.append(str(value))
+    return "\n".join(parts)
+
+
+def _on_insert(mapper, connection, target):
+    if str(connection.engine.url) not in _ready:
+        return
+    doc_type = _MODEL_DOC_TYPES[type(target)]
+    index_document(connection, doc_type, target.id, _body(target, DOC_TYPES[doc_type][2], offloaded_in_flush(target)))
+
+
+def _on_update(mapper, connection, target):
+    if str(connection.engine.url) not in _ready:
+        return
+    doc_type = _MODEL_DOC_TYPES[type(target)]
+    attrs = DOC_TYPES[doc_type][2]
+    plain = offloaded_in_flush(target)
+    state = sa_inspect(target)
+    # Status changes are the common update; only re-index when indexed text changed.
+    if not any(attr in plain or state.attrs[attr].history.has_changes() for attr in attrs):
+        return
+    index_document(connection, doc_type, target.id, _body(target, attrs, plain))
+
+
+def _on_delete(mapper, connection, target):
+    remove_documents(connection, _MODEL_DOC_TYPES[type(target)], [target.id])
+
+
+for _model in _MODEL_DOC_TYPES:
+    event.listen(_model, "after_insert", _on_insert)
+    event.listen(_model, "after_update", _on_update)
+    event.listen(_model, "after_delete", _on_delete)
+
+
+def index_is_empty(bind=None) -> bool:
+    bind = bind if bind is not None else get_engine()
+    with bind.connect() as conn:
+        if _dialect(bind) == "sqlite":
+            return conn.execute(text("SELECT rowid FROM search_index LIMIT 1")).first() is None
+        return conn.execute(select(search_documents.c.doc_id).limit(1)).first() is None
+
+
+def rebuild_index(batch_size: int = 500) -> int:
+    """
+    (Re)index every document in id order, one short transaction per batch. Returns documents indexed.
+    """
+    indexed = 0
+    for doc_type, (model, _, attrs) in DOC_TYPES.items():
+        last_id = 0
+        while True:
+            db = SessionLocal()
+            try:
+                with batched_hydration(db):
+                    rows = db.query(model).filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+                if not rows:
+                    break
+                conn = db.connection()
+                for row in rows:
+                    index_document(conn, doc_type, row.id, _body(row, attrs, {}))
+                db.commit()
+                last_id = rows[-1].id
+                indexed += len(rows)
+            finally:
+                db.close()
+            if len(rows) < batch_size:
+                break
+    logger.info("Search index rebuilt: %s documents", indexed)
+    return indexed
+
+
+def _fts5_query(q: str) -> Optional[str]:
+    # Quote every term so user input can't be parsed as FTS5 syntax; the last term matches as a prefix.
+    terms = re.findall(r"\w+", q)
+    if not terms:
+        return None
+    quoted = ['"%s"' % t for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _search_sqlite(conn, q: str, doc_types: List[str], limit: int, offset: int):
+    match = _fts5_query(q)
+    if match is None:
+        return 0, []
+    ranges = " OR ".join(
+        f"(rowid BETWEEN {DOC_TYPES[t][1] << _ROWID_SHIFT} AND {((DOC_TYPES[t][1] + 1) << _ROWID_SHIFT) - 1})"
+        for t in doc_types
+    )
+    where = f"search_index MATCH :match AND ({ranges})"
+    total = conn.execute(text(f"SELECT count(*) FROM search_index WHERE {where}"), {"match": match}).scalar()
+    rows = conn.execute(
+        text(
+            "SELECT rowid, -bm25(search_index) AS score, "
+            "snippet(search_index, 0, :start, :stop, '...', 24) AS snippet "
+            f"FROM search_index WHERE {where} ORDER BY bm25(search_index) LIMIT :limit OFFSET :offset"
+        ),
+        {"match": match, "limit": limit, "offset": offset, "start": HIGHLIGHT_START, "stop": HIGHLIGHT_END},
+    )
+    prefixes = {code: name for name, (_, code, _) in DOC_TYPES.items()}
+    mask = (1 << _ROWID_SHIFT) - 1
+    hits = [
+        {"type": prefixes[r.rowid >> _ROWID_SHIFT], "id": r.rowid & mask, "score": round(r.score, 4), "snippet": r.snippet}
+        for r in rows
+    ]
+    return total, hits
+
+
+def _search_postgres(conn, q: str, doc_types: List[str], limit: int, offset: int):
+    where = "tsv @@ query AND doc_type = ANY(:types)"
+    params = {
+        "q": q,
+        "types": list(doc_types),
+        "limit": limit,
+        "offset": offset,
+        "options": f"MaxFragments=1, MaxWords=24, MinWords=8, StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}",
+    }
+    total = conn.execute(
+        text(f"SELECT count(*) FROM search_documents, websearch_to_tsquery('english', :q) query WHERE {where}"), params
+    ).scalar()
+    rows = conn.execute(
+        text(
+            "SELECT doc_type, doc_id, ts_rank_cd(tsv, query) AS score, "
+            "ts_headline('english', body, query, :options) AS snippet "
+            "FROM search_documents, websearch_to_tsquery('english', :q) query "
+            f"WHERE {where} ORDER BY score DESC, doc_id DESC LIMIT :limit OFFSET :offset"
+        ),
+        params,
+    )
+    hits = [{"type": r.doc_type, "id": r.doc_id, "score": round(float(r.score), 4), "snippet": r.snippet} for r in rows]
+    return total, hits
+
+
+def _search_like(conn, q: str, doc_types: List[str], limit: int, offset: int):
+    cond = [search_documents.c.doc_type.in_(doc_types), search_documents.c.body.ilike(f"%{q}%")]
+    total = conn.execute(select(func.count()).select_from(search_documents).where(*cond)).scalar()
+    rows = conn.execute(
+        select(search_documents.c.doc_type, search_documents.c.doc_id, search_documents.c.body)
+        .where(*cond).order_by(search_documents.c.doc_id.desc()).limit(limit).offset(offset)
+    )
+    hits = [{"type": r.doc_type, "id": r.doc_id, "score": 0.0, "snippet": r.body[:200]} for r in rows]
+    return total, hits
+
+
+def _attach_details(db, hits) -> None:
+    # Small per-type lookups for display fields; the snippet already carries the matched text.
+    columns = {
+        "post": (GeneratedPost.id, GeneratedPost.file, GeneratedPost.status, GeneratedPost.platform),
+        "file_change": (FileChangeLog.id, FileChangeLog.session_id, FileChangeLog.file_path),
+        "session_summary": (SessionSummaryPost.id, SessionSummaryPost.status, SessionSummaryPost.platform, SessionSummaryPost.created_at),
+    }
+    for doc_type, cols in columns.items():
+        ids = [h["id"] for h in hits if h["type"] == doc_type]
+        if not ids:
+            continue
+        rows = {r.id: r._asdict() for r in db.query(*cols).filter(cols[0].in_(ids))}
+        for h in hits:
+            if h["type"] == doc_type and h["id"] in rows:
+                details = dict(rows[h["id"]])
+                details.pop("id")
+                h.update(details)
+
+
+def search(q: str, doc_types: Optional[List[str]] = None, limit: int = 20, offset: int = 0) -> dict:
+    """
+    Ranked full-text search over generated posts, file change diffs and session summaries. Matched terms
+    in snippets are wrapped in HIGHLIGHT_START/HIGHLIGHT_END.
+    """
+    doc_types = [t for t in (doc_types or DOC_TYPES) if t in DOC_TYPES]
+    engine = get_engine()
+    if str(engine.url) not in _ready:
+        raise RuntimeError("Full-text search index is not available.")
+    db = SessionLocal()
+    try:
+        conn = db.connection()
+        kind = _dialect(engine)
+        if not doc_types or not q.strip():
+            total, hits = 0, []
+        elif kind == "sqlite":
+            total, hits = _search_sqlite(conn, q, doc_types, limit, offset)
+        elif kind == "postgres":
+            total, hits = _search_postgres(conn, q, doc_types, limit, offset)
+        else:
+            total, hits = _search_like(conn, q, doc_types, limit, offset)
+        _attach_details(db, hits)
+    finally:
+        db.close()
+    return {"query": q, "total": int(total or 0), "limit": limit, "offset": offset, "results": hits}
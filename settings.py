@@ -4,7 +4,7 @@ from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
-from pydantic import Field
+from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -26,8 +26,28 @@ class Settings(BaseSettings):
     log_level: str = Field(default="INFO", alias="LOG_LEVEL")
     secret_key: Optional[str] = Field(default=None, alias="SECRET_KEY")
 
+    # Base URL the watchers use to call back into this API (/generate-content/)
+    app_base_url: str = Field(default="http://127.0.0.1:8000", alias="APP_BASE_URL")
+
+    # HTTP delivery: Cache-Control max-age for /static assets (index.html always revalidates), and
+    # gzip for other responses of at least GZIP_MINIMUM_SIZE bytes (0 disables it)
+    static_max_age_seconds: int = Field(default=3600, alias="STATIC_MAX_AGE_SECONDS")
+    gzip_minimum_size: int = Field(default=1024, alias="GZIP_MINIMUM_SIZE")
+    gzip_level: int = Field(default=6, alias="GZIP_LEVEL")
+    # List endpoints answer If-None-Match with 304 and keep this many serialized bodies (0: ETags only)
+    list_cache_size: int = Field(default=64, alias="LIST_CACHE_SIZE")
+
     # Watcher
     watch_path: Optional[Path] = Field(default=None, alias="WATCH_PATH")
+    # Watch sessions are checkpointed (see watch_checkpoint.py): a worker that stops or dies mid-session
+    # leaves it to be resumed by the next worker that starts, once the owner's lease has lapsed.
+    watch_session_resume: bool = Field(default=True, alias="WATCH_SESSION_RESUME")
+    watch_session_lease_seconds: int = Field(default=300, alias="WATCH_SESSION_LEASE_SECONDS")
+    # How long shutdown waits for the file being generated to be stored (keep below the graceful timeout)
+    watch_shutdown_grace_seconds: float = Field(default=20.0, alias="WATCH_SHUTDOWN_GRACE_SECONDS")
+    # auto: sessions on a git work tree diff against the start commit instead of a full file scan
+    # (see git_baseline.py); off: always scan
+    watch_git_mode: str = Field(default="auto", alias="WATCH_GIT_MODE")
 
     # Database
     database_url: Optional[str] = Field(default=None, alias="DATABASE_URL")
@@ -35,11 +55,85 @@ class Settings(BaseSettings):
     db_sslmode: Optional[str] = Field(default=None, alias="DB_SSLMODE")  # e.g. require|disable
     db_pool_size: int = Field(default=5, alias="DB_POOL_SIZE")
     db_max_overflow: int = Field(default=10, alias="DB_MAX_OVERFLOW")
+    # Create missing tables/columns in every worker at startup. Under gunicorn the master runs
+    # `python -m migrate` once and turns this off for its workers (see gunicorn.conf.py).
+    auto_migrate: bool = Field(default=True, alias="AUTO_MIGRATE")
+
+    # SQLite profile (only used when DATABASE_URL is unset or points at SQLite)
+    sqlite_tuned: bool = Field(default=True, alias="SQLITE_TUNED")  # WAL + pragmas below
+    sqlite_busy_timeout_ms: int = Field(default=15000, alias="SQLITE_BUSY_TIMEOUT_MS")
+    sqlite_mmap_bytes: int = Field(default=256 * 1024 * 1024, alias="SQLITE_MMAP_BYTES")
+    sqlite_cache_kb: int = Field(default=65536, alias="SQLITE_CACHE_KB")
+    sqlite_single_writer: bool = Field(default=False, alias="SQLITE_SINGLE_WRITER")
+
+    # Prometheus metrics at /metrics. For gunicorn, PROMETHEUS_MULTIPROC_DIR (read by prometheus_client
+    # itself) must point at an empty directory shared by the workers; gunicorn.conf.py sets it up.
+    metrics_enabled: bool = Field(default=True, alias="METRICS_ENABLED")
+
+    # SQL accounting per request/background job (see querystats.py); counts are returned as
+    # X-DB-Queries/X-DB-Time-Ms headers when APP_ENV=dev. 0 disables a check.
+    query_stats_enabled: bool = Field(default=True, alias="QUERY_STATS_ENABLED")
+    query_budget: int = Field(default=50, alias="QUERY_BUDGET")  # statements per request/job before warning
+    query_repeat_threshold: int = Field(default=10, alias="QUERY_REPEAT_THRESHOLD")  # same statement shape
+
+    # Opt-in request profiling: requests with X-Profile: 1 and X-SECRET-KEY are sampled (see profiling.py)
+    profiling_enabled: bool = Field(default=False, alias="PROFILING_ENABLED")
+    profile_sample_interval_ms: float = Field(default=5.0, alias="PROFILE_SAMPLE_INTERVAL_MS")
+    profile_buffer_size: int = Field(default=20, alias="PROFILE_BUFFER_SIZE")  # recent profiles kept per worker
+
+    # Tracing (see tracing.py): trace ids are always stored on generated rows; spans are exported when
+    # TRACING_EXPORTER is file (JSON lines) or otlp (OTLP/HTTP JSON).
+    tracing_exporter: str = Field(default="none", alias="TRACING_EXPORTER")  # none|file|otlp
+    tracing_file: Path = Field(default=Path("./traces.jsonl"), alias="TRACING_FILE")
+    tracing_otlp_endpoint: Optional[str] = Field(default=None, alias="TRACING_OTLP_ENDPOINT")
+    tracing_service_name: str = Field(default="autosocial", alias="TRACING_SERVICE_NAME")
+
+    # Write-behind queue: one writer thread commits watcher/generation inserts in batches
+    write_queue: bool = Field(default=True, alias="WRITE_QUEUE")
+    write_queue_max_batch: int = Field(default=200, alias="WRITE_QUEUE_MAX_BATCH")
+    write_queue_max_delay_ms: int = Field(default=50, alias="WRITE_QUEUE_MAX_DELAY_MS")
+
+    # Publishing outbox: worker threads per process that drain publish_jobs
+    publish_workers: int = Field(default=2, alias="PUBLISH_WORKERS")
+    publish_max_sleep_seconds: float = Field(default=60.0, alias="PUBLISH_MAX_SLEEP_SECONDS")  # idle cap; see outbox.py
+    publish_max_attempts: int = Field(default=5, alias="PUBLISH_MAX_ATTEMPTS")
+    publish_retry_base_seconds: float = Field(default=30.0, alias="PUBLISH_RETRY_BASE_SECONDS")
+    publish_lease_seconds: int = Field(default=300, alias="PUBLISH_LEASE_SECONDS")
+    publish_deadline_seconds: float = Field(default=15.0, alias="PUBLISH_DEADLINE_SECONDS")  # shared by a post's platforms
+
+    # Trending topics cache (shared through the trends_cache table)
+    trends_ttl_seconds: int = Field(default=300, alias="TRENDS_TTL_SECONDS")
+    trends_max_stale_seconds: int = Field(default=3600, alias="TRENDS_MAX_STALE_SECONDS")  # served while refreshing
+    trends_refresh_lease_seconds: int = Field(default=15, alias="TRENDS_REFRESH_LEASE_SECONDS")
+    trends_error_backoff_seconds: int = Field(default=60, alias="TRENDS_ERROR_BACKOFF_SECONDS")
+    trends_default_woeid: int = Field(default=1, alias="TRENDS_DEFAULT_WOEID")  # 1 = Worldwide
+
+    # Content blobs (compressed, de-duplicated storage for diffs and model outputs)
+    blob_storage: bool = Field(default=True, alias="BLOB_STORAGE")
+    blob_min_bytes: int = Field(default=256, alias="BLOB_MIN_BYTES")
+    blob_codec: str = Field(default="auto", alias="BLOB_CODEC")  # auto|zstd|zlib|raw
+    blob_cache_entries: int = Field(default=1024, alias="BLOB_CACHE_ENTRIES")
+
+    # Duplicate detection for generated posts
+    dedupe_mode: str = Field(default="link", alias="DEDUPE_MODE")  # off|link|suppress
+    dedupe_max_distance: int = Field(default=4, alias="DEDUPE_MAX_DISTANCE")  # SimHash bits, 0-5
+
+    # Retention (opt-in cleanup of log tables)
+    run_retention: bool = Field(default=False, alias="RUN_RETENTION")
+    retention_interval_minutes: int = Field(default=60, alias="RETENTION_INTERVAL_MINUTES")
+    retention_mode: str = Field(default="delete", alias="RETENTION_MODE")  # delete|table|ndjson
+    retention_archive_dir: Path = Field(default=Path("./archive"), alias="RETENTION_ARCHIVE_DIR")
+    retention_batch_size: int = Field(default=500, alias="RETENTION_BATCH_SIZE")
+    retention_policy: Optional[str] = Field(default=None, alias="RETENTION_POLICY")  # JSON, see retention.py
 
     # AI providers
     openai_api_key: Optional[str] = Field(default=None, alias="OPENAI_API_KEY")
     gemini_api_key: Optional[str] = Field(default=None, alias="GEMINI_API_KEY")
     groq_api_key: Optional[str] = Field(default=None, alias="GROQ_API_KEY")
+    # API roots; overridden to point at local stubs (see bench/stubs.py).
+    openai_base_url: str = Field(default="https://api.openai.com/v1", alias="OPENAI_BASE_URL")
+    gemini_base_url: str = Field(default="https://generativelanguage.googleapis.com/v1beta", alias="GEMINI_BASE_URL")
+    groq_base_url: str = Field(default="https://api.groq.com/openai/v1", alias="GROQ_BASE_URL")
 
     # Social
     x_bearer_token: Optional[str] = Field(default=None, alias="X_BEARER_TOKEN")
@@ -51,6 +145,25 @@ class Settings(BaseSettings):
     linkedin_access_token: Optional[str] = Field(default=None, alias="LINKEDIN_ACCESS_TOKEN")
     linkedin_organization_urn: Optional[str] = Field(default=None, alias="LINKEDIN_ORGANIZATION_URN")
     linkedin_author_urn: Optional[str] = Field(default=None, alias="LINKEDIN_AUTHOR_URN")
+    x_api_base_url: str = Field(default="https://api.twitter.com", alias="X_API_BASE_URL")
+    linkedin_api_base_url: str = Field(default="https://api.linkedin.com", alias="LINKEDIN_API_BASE_URL")
+
+    # Publishing budgets per account (token buckets in rate_limit_budgets; 0 disables the local cap).
+    # X budgets are also learned from its rate-limit headers.
+    x_posts_per_day: int = Field(default=0, alias="X_POSTS_PER_DAY")
+    linkedin_posts_per_day: int = Field(default=150, alias="LINKEDIN_POSTS_PER_DAY")
+
+    @model_validator(mode="after")
+    def _publish_lease_outlasts_sends(self):
+        # A send starts before the deadline and gets what is left of it as its HTTP timeout, so it ends
+        # within deadline + timeout <= 2 x deadline. A shorter lease could expire while the post is in flight.
+        longest_send = self.publish_deadline_seconds + max(1.0, self.publish_deadline_seconds)
+        if self.publish_lease_seconds <= longest_send:
+            raise ValueError(
+                f"PUBLISH_LEASE_SECONDS ({self.publish_lease_seconds}) must be greater than "
+                f"{longest_send:g}: the publish deadline plus the longest HTTP timeout."
+            )
+        return self
 
 
 @lru_cache(maxsize=1)
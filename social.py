@@ -2,37 +2,81 @@ import logging
 import os
 
 import requests
-from requests_oauthlib import OAuth1
+from urllib3.exceptions import NewConnectionError
 
 logger = logging.getLogger("autosocial.social")
 from secrets_store import get_credential
+from ratelimit import account_key, rate_limited_result, rate_limiter, retry_after, x_buckets
+from settings import get_settings
+
+def _outcome_unknown(error, resp=None):
+    """
+    Whether a failed POST may have been published anyway: the request went out but no usable answer
+    came back (read timeout, connection dropped after sending, a 5xx, or an unreadable 2xx body).
+    """
+    if resp is not None:
+        return resp.ok or resp.status_code >= 500
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return False
+    if isinstance(error, requests.exceptions.Timeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        # Could not connect at all (refused, DNS) vs. dropped once connected
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return not isinstance(reason, NewConnectionError)
+    return False
+
+def _post_failed(message, error, resp=None):
+    result = {"error": message}
+    if _outcome_unknown(error, resp):
+        # Retrying could post twice; the outbox holds the job until someone checks the platform.
+        result["outcome_unknown"] = True
+    return result
 
 # --- X (Twitter) Integration ---
 
-def fetch_x_trending_topics():
+class TrendsUnavailable(Exception):
     """
-    Fetch trending topics from X (Twitter).
-    Requires Bearer Token and Twitter API v1.1 or v2.
+    Raised by fetch_x_trends when trends cannot be fetched; the message is safe to show to users.
+    """
+
+
+def fetch_x_trends(woeid=1, timeout=10):
+    """
+    Fetch the top trending topics for a location from X (Twitter).
+    woeid: Yahoo! Where On Earth ID of the location (1 = Worldwide).
+    Raises TrendsUnavailable instead of returning placeholder topics, so callers can tell data from errors.
     """
     BEARER_TOKEN = os.getenv("X_BEARER_TOKEN") or get_credential("X_BEARER_TOKEN")
     if not BEARER_TOKEN:
-        return ["Set X_BEARER_TOKEN in .env"]
-    url = "https://api.twitter.com/1.1/trends/place.json?id=1"  # 1 = Worldwide
+        raise TrendsUnavailable("Set X_BEARER_TOKEN in .env")
+    url = f"{get_settings().x_api_base_url}/1.1/trends/place.json?id={int(woeid)}"
     headers = {"Authorization": f"Bearer {BEARER_TOKEN}"}
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
+        resp = requests.get(url, headers=headers, timeout=timeout)
         resp.raise_for_status()
         data = resp.json()
-        if data and isinstance(data, list) and "trends" in data[0]:
-            return [trend["name"] for trend in data[0]["trends"][:10]]
-        return ["No trending topics found"]
     except Exception as e:
         logger.warning("Error fetching X trends: %s", e)
-        return ["Error fetching X trends"]
+        raise TrendsUnavailable("Error fetching X trends") from e
+    if data and isinstance(data, list) and "trends" in data[0]:
+        return [trend["name"] for trend in data[0]["trends"][:10]]
+    return ["No trending topics found"]
+
+def fetch_x_trending_topics(woeid=1):
+    """
+    Fetch trending topics from X (Twitter).
+    Requires Bearer Token and Twitter API v1.1 or v2.
+    """
+    try:
+        return fetch_x_trends(woeid)
+    except TrendsUnavailable as e:
+        return [str(e)]
 
-def post_to_x(content):
+def post_to_x(content, timeout=10):
     """
     Post content to X (Twitter) using OAuth 1.0a (user context).
+    timeout: seconds for the HTTP request (the publisher passes what is left of its deadline).
     """
     CONSUMER_KEY = os.getenv("X_CONSUMER_KEY") or get_credential("X_CONSUMER_KEY")
     CONSUMER_SECRET = os.getenv("X_CONSUMER_SECRET") or get_credential("X_CONSUMER_SECRET")
@@ -40,16 +84,31 @@ def post_to_x(content):
     ACCESS_TOKEN_SECRET = os.getenv("X_ACCESS_TOKEN_SECRET") or get_credential("X_ACCESS_TOKEN_SECRET")
     if not all([CONSUMER_KEY, CONSUMER_SECRET, ACCESS_TOKEN, ACCESS_TOKEN_SECRET]):
         return {"error": "Set all X OAuth 1.0a credentials in .env"}
-    url = "https://api.twitter.com/2/tweets"
+    # Budgets are learned from X's rate-limit headers; X_POSTS_PER_DAY adds a local daily cap.
+    account = account_key("x", ACCESS_TOKEN)
+    rate_limiter.configure(account, "daily", get_settings().x_posts_per_day, 24 * 60 * 60)
+    allowed, retry_at = rate_limiter.acquire(account)
+    if not allowed:
+        return rate_limited_result("X", retry_at)
+    url = f"{get_settings().x_api_base_url}/2/tweets"
+    from requests_oauthlib import OAuth1  # only needed when posting to X
+
     auth = OAuth1(CONSUMER_KEY, CONSUMER_SECRET, ACCESS_TOKEN, ACCESS_TOKEN_SECRET)
     data = {"text": content}
+    resp = None
     try:
-        resp = requests.post(url, auth=auth, json=data, timeout=10)
+        resp = requests.post(url, auth=auth, json=data, timeout=timeout)
+        buckets = x_buckets(resp.headers)
+        rate_limiter.learn(account, buckets)
+        if resp.status_code == 429:
+            exhausted = [reset for _, remaining, reset in buckets.values() if remaining < 1 and reset]
+            retry_at = retry_after(resp.headers) or (max(exhausted) if exhausted else None)
+            return rate_limited_result("X", rate_limiter.throttled(account, retry_at))
         resp.raise_for_status()
         return resp.json()
     except Exception as e:
         logger.warning("Error posting to X: %s", e)
-        return {"error": "Error posting to X"}
+        return _post_failed("Error posting to X", e, resp)
 
 # --- LinkedIn Integration ---
 
@@ -61,11 +120,12 @@ def fetch_linkedin_trending_topics():
     # TODO: Implement using third-party service or scraping if needed
     return ["LinkedIn trending topics API not available"]
 
-def post_to_linkedin(content, urn_type=None):
+def post_to_linkedin(content, urn_type=None, timeout=10):
     """
     Post content to LinkedIn using the new /rest/posts endpoint.
     Requires LINKEDIN_ACCESS_TOKEN and either LINKEDIN_ORGANIZATION_URN or LINKEDIN_AUTHOR_URN in .env.
     urn_type: "author", "organization", or None (auto)
+    timeout: seconds for the HTTP request.
     """
     ACCESS_TOKEN = os.getenv("LINKEDIN_ACCESS_TOKEN") or get_credential("LINKEDIN_ACCESS_TOKEN")
     ORGANIZATION_URN = os.getenv("LINKEDIN_ORGANIZATION_URN") or get_credential("LINKEDIN_ORGANIZATION_URN")
@@ -79,7 +139,7 @@ def post_to_linkedin(content, urn_type=None):
         author = AUTHOR_URN if AUTHOR_URN else ORGANIZATION_URN
     if not ACCESS_TOKEN or not author:
         return {"error": "Set LINKEDIN_ACCESS_TOKEN and the appropriate URN in .env"}
-    url = "https://api.linkedin.com/v2/ugcPosts"  # <-- classic endpoint
+    url = f"{get_settings().linkedin_api_base_url}/v2/ugcPosts"  # <-- classic endpoint
     headers = {
         "Authorization": f"Bearer {ACCESS_TOKEN}",
         "Content-Type": "application/json",
@@ -96,8 +156,18 @@ def post_to_linkedin(content, urn_type=None):
         },
         "visibility": {"com.linkedin.ugc.MemberNetworkVisibility": "PUBLIC"}
     }
+    # LinkedIn does not report remaining quota; LINKEDIN_POSTS_PER_DAY is a local token bucket and
+    # 429 responses pause the account until Retry-After.
+    account = account_key("linkedin", author)
+    rate_limiter.configure(account, "daily", get_settings().linkedin_posts_per_day, 24 * 60 * 60)
+    allowed, retry_at = rate_limiter.acquire(account)
+    if not allowed:
+        return rate_limited_result("LinkedIn", retry_at)
+    resp = None
     try:
-        resp = requests.post(url, headers=headers, json=data, timeout=10)
+        resp = requests.post(url, headers=headers, json=data, timeout=timeout)
+        if resp.status_code == 429:
+            return rate_limited_result("LinkedIn", rate_limiter.throttled(account, retry_after(resp.headers)))
         if resp.status_code >= 400:
             # Do not leak response bodies or tokens into logs.
             logger.warning("LinkedIn post failed with status=%s", resp.status_code)
@@ -105,4 +175,4 @@ def post_to_linkedin(content, urn_type=None):
         return resp.json()
     except Exception as e:
         logger.warning("Error posting to LinkedIn: %s", e)
-        return {"error": "Error posting to LinkedIn"}
+        return _post_failed("Error posting to LinkedIn", e, resp)
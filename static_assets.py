@@ -0,0 +1,207 @@
+"""
+Static frontend delivery with precompressed variants and cache validators.
+
+Compressible assets (HTML, CSS, JS, JSON, SVG, text) get gzip and, when a brotli module is installed,
+brotli variants. `python -m static_assets` writes them next to the files as .gz/.br at build time (the
+Dockerfile does); anything without an up-to-date sidecar is compressed once on first request and kept
+in memory. Responses carry a strong ETag per representation, Vary: Accept-Encoding and Cache-Control,
+and If-None-Match answers 304.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import sys
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+
+from settings import get_settings
+
+try:  # optional: brotli or brotlicffi
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+_MIN_COMPRESS_BYTES = 512
+_COMPRESSIBLE_TYPES = ("application/javascript", "application/json", "image/svg+xml", "application/xml")
+# Preferred first when the client accepts both
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _compressible(path: str, size: int) -> bool:
+    media_type = mimetypes.guess_type(path)[0] or ""
+    return size >= _MIN_COMPRESS_BYTES and (media_type.startswith("text/") or media_type in _COMPRESSIBLE_TYPES)
+
+
+def _compress(encoding: str, data: bytes) -> Optional[bytes]:
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=11)
+    return None
+
+
+@dataclass
+class Asset:
+    path: str
+    mtime_ns: int
+    size: int
+    etag: str  # strong validator of the identity representation, quoted
+    body: bytes
+    media_type: str
+    variants: Dict[str, bytes] = field(default_factory=dict)  # content-coding -> body
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        return self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+
+
+def _load(path: str, st: os.stat_result) -> Asset:
+    with open(path, "rb") as f:
+        body = f.read()
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if media_type.startswith("text/"):
+        media_type += "; charset=utf-8"
+    asset = Asset(path, st.st_mtime_ns, st.st_size, f'"{hashlib.sha256(body).hexdigest()[:32]}"', body, media_type)
+    if _compressible(path, len(body)):
+        for encoding, suffix in _ENCODINGS:
+            sidecar = path + suffix
+            try:
+                fresh = os.stat(sidecar).st_mtime_ns >= st.st_mtime_ns
+            except OSError:
+                fresh = False
+            if fresh:
+                with open(sidecar, "rb") as f:
+                    data = f.read()
+            else:
+                data = _compress(encoding, body)
+            # Only worth sending when it is actually smaller.
+            if data is not None and len(data) < len(body):
+                asset.variants[encoding] = data
+    return asset
+
+
+class AssetCache:
+    """
+    Loaded assets keyed by path, reloaded when the file's mtime or size changes.
+    """
+
+    def __init__(self):
+        self._assets: Dict[str, Asset] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Asset:
+        st = os.stat(path)
+        asset = self._assets.get(path)
+        if asset is None or asset.mtime_ns != st.st_mtime_ns or asset.size != st.st_size:
+            asset = _load(path, st)
+            with self._lock:
+                self._assets[path] = asset
+        return asset
+
+
+assets = AssetCache()
+
+
+def _accepted(accept_encoding: str) -> Dict[str, float]:
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    return accepted
+
+
+def _choose_encoding(asset: Asset, accept_encoding: str) -> Optional[str]:
+    accepted = _accepted(accept_encoding)
+    for encoding, _ in _ENCODINGS:
+        if encoding in asset.variants and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _not_modified(if_none_match: str, asset: Asset) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return any(asset.etag_for(encoding) in tags for encoding in (None, *asset.variants))
+
+
+def respond(path: str, headers: Headers, method: str = "GET", cache_control: Optional[str] = None) -> Response:
+    """
+    Serve a file with the best encoding the client accepts, or 304 when its cached copy is current.
+    """
+    asset = assets.get(path)
+    encoding = _choose_encoding(asset, headers.get("accept-encoding", ""))
+    response_headers = {
+        "ETag": asset.etag_for(encoding),
+        "Cache-Control": cache_control or f"public, max-age={get_settings().static_max_age_seconds}",
+    }
+    if asset.variants:
+        response_headers["Vary"] = "Accept-Encoding"
+    if _not_modified(headers.get("if-none-match", ""), asset):
+        return Response(status_code=304, headers=response_headers)
+    body = asset.variants[encoding] if encoding else asset.body
+    if encoding:
+        response_headers["Content-Encoding"] = encoding
+    response_headers["Content-Length"] = str(len(body))
+    return Response(b"" if method == "HEAD" else body, media_type=asset.media_type, headers=response_headers)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that keeps its path handling and 404s but serves files through respond().
+    """
+
+    async def get_response(self, path: str, scope) -> Response:
+        response = await super().get_response(path, scope)
+        if not isinstance(response, FileResponse) or response.status_code != 200:
+            return response
+        return await run_in_threadpool(respond, response.path, Headers(scope=scope), scope["method"])
+
+
+def precompress(directory: str) -> Tuple[int, int]:
+    """
+    Write .gz/.br sidecars for every compressible file under directory. Returns (files, bytes saved).
+    """
+    files = saved = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            if name.endswith((".gz", ".br")) or not _compressible(path, os.path.getsize(path)):
+                continue
+            with open(path, "rb") as f:
+                body = f.read()
+            for encoding, suffix in _ENCODINGS:
+                data = _compress(encoding, body)
+                if data is None or len(data) >= len(body):
+                    continue
+                with open(path + suffix, "wb") as f:
+                    f.write(data)
+                saved += len(body) - len(data)
+            files += 1
+    return files, saved
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+    count, saved_bytes = precompress(target)
+    print(f"Precompressed {count} files under {target} ({saved_bytes} bytes smaller in total)")
@@ -0,0 +1,34 @@
+import ai
+from bench.offline import compare, percentiles
+from bench.stubs import StubConfig, StubServer, StubState
+
+
+def _point_at(monkeypatch, stubs):
+    settings = ai.get_settings()
+    for name, url in stubs.base_urls().items():
+        monkeypatch.setattr(settings, name.lower(), url)
+    monkeypatch.setattr(settings, "gemini_api_key", "stub")
+    monkeypatch.setattr(settings, "groq_api_key", "stub")
+
+
+def test_providers_answer_from_local_stubs(monkeypatch):
+    with StubServer() as stubs:
+        _point_at(monkeypatch, stubs)
+        assert ai.askgroq("hello") == "[groq] hello"
+        assert ai.askgemini("hello") == "[gemini] hello"
+        assert stubs.state.requests["groq"] == stubs.state.requests["gemini"] == 1
+
+
+def test_stub_error_rate(monkeypatch):
+    with StubServer(StubState(default=StubConfig(error_rate=1.0))) as stubs:
+        _point_at(monkeypatch, stubs)
+        assert ai.askgroq("hello").startswith("Error:")
+        assert stubs.state.requests["groq:500"] == 1
+
+
+def test_percentiles_and_regressions():
+    stats = percentiles([i / 1000 for i in range(1, 101)])
+    assert (stats["p50_ms"], stats["p95_ms"], stats["p99_ms"]) == (50.0, 95.0, 99.0)
+    baseline = {"scenarios": {"publish": {"p95_ms": 100.0, "throughput_per_second": 50.0}}}
+    current = {"scenarios": {"publish": {"p95_ms": 110.0, "throughput_per_second": 30.0}}}
+    assert compare(current, baseline, 0.2) == ["publish.throughput_per_second: 50.0 -> 30.0 (-40%)"]
@@ -0,0 +1,51 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from blob_store import ContentBlob, batched_hydration
+from db import Base, FileChangeLog, GeneratedPost
+
+
+def _session():
+    engine = create_engine("sqlite://", future=True)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_large_text_is_offloaded_and_deduplicated():
+    db = _session()
+    text = "A generated post about the refactor. " * 40
+    diff = "\n".join(f"+line {i}" for i in range(200))
+    responses = {"ChatGPT": text, "Gemini": "short"}
+    db.add(GeneratedPost(file="a.py [ChatGPT]", content=text))
+    db.add(FileChangeLog(session_id=1, file_path="a.py", diff_summary=diff, ai_results=str(responses)))
+    db.add(FileChangeLog(session_id=2, file_path="a.py", diff_summary=diff, ai_results=str(responses)))
+    db.commit()
+
+    # The post and the ChatGPT output share a blob, as do the repeated diffs.
+    assert db.query(ContentBlob).count() == 3
+    raw = db.execute(GeneratedPost.__table__.select()).first()
+    assert raw.content == "" and raw.content_hash
+    db.close()
+
+
+def test_offloaded_rows_read_back_transparently():
+    db = _session()
+    text = "x" * 1000
+    responses = {"ChatGPT": text, "Llama-4": "y" * 600}
+    db.add(GeneratedPost(file="custom", content=text))
+    db.add(FileChangeLog(session_id=1, file_path="b.py", diff_summary="-a\n+b" * 100, ai_results=str(responses)))
+    db.commit()
+    db.expunge_all()
+
+    with batched_hydration(db):
+        post = db.query(GeneratedPost).one()
+        log = db.query(FileChangeLog).one()
+    assert post.content == text
+    assert log.diff_summary == "-a\n+b" * 100
+    assert log.ai_results == str(responses)
+
+    post.content = "edited " * 100
+    db.commit()
+    db.expunge_all()
+    assert db.query(GeneratedPost).one().content == "edited " * 100
+    db.close()
@@ -0,0 +1,41 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import dedupe
+from db import Base, GeneratedPost
+
+POST = (
+    "We shipped a faster watcher that skips ignored directories "
+    "and cuts scan time in half for large repositories."
+)
+
+
+def _session():
+    engine = create_engine("sqlite://", future=True)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_near_duplicates_share_a_band():
+    a = dedupe.simhash(POST)
+    b = dedupe.simhash(POST.replace("the", "a", 1))
+    assert bin(a ^ b).count("1") <= 5
+    assert set(dedupe._bands(a)) & set(dedupe._bands(b))
+
+
+def test_duplicates_are_linked_to_the_earliest_post():
+    db = _session()
+    first = GeneratedPost(file="custom", content=POST)
+    db.add(first)
+    db.commit()
+    exact = GeneratedPost(file="custom", content=POST.upper())
+    near = GeneratedPost(file="custom", content=POST + " #devtools")
+    other = GeneratedPost(file="custom", content="A completely different note about our new logo and colors.")
+    for post in (exact, near, other):
+        db.add(post)
+        db.commit()
+
+    assert exact.duplicate_of == first.id
+    assert near.duplicate_of == first.id
+    assert other.duplicate_of is None
+    db.close()
@@ -0,0 +1,26 @@
+import json
+from datetime import datetime
+
+import pytest
+from pydantic import BaseModel
+
+import fastjson
+from fastjson import FastJSONResponse, dumps, ndjson_lines
+
+
+class Item(BaseModel):
+    name: str
+
+
+@pytest.mark.parametrize("backend", ["orjson", "json"])
+def test_dumps_encodes_api_payloads_compactly(backend, monkeypatch):
+    if backend == "json":
+        monkeypatch.setattr(fastjson, "orjson", None)
+    elif fastjson.orjson is None:
+        pytest.skip("orjson is not installed")
+    payload = {"diff": "+ é\n- ü", "at": datetime(2026, 1, 2, 3, 4, 5), "n": {1: [1.5, None, True]}, "item": Item(name="x")}
+    body = dumps(payload)
+    assert json.loads(body) == {"diff": "+ é\n- ü", "at": "2026-01-02T03:04:05", "n": {"1": [1.5, None, True]}, "item": {"name": "x"}}
+    assert b": " not in body and "é".encode() in body
+    assert FastJSONResponse({"a": [1, 2]}).body == b'{"a":[1,2]}'
+    assert ndjson_lines([{"id": 1}, {"id": 2}]) == b'{"id":1}\n{"id":2}\n'
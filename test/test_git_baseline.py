@@ -0,0 +1,107 @@
+import os
+import shutil
+import subprocess
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import git_baseline
+import watch_checkpoint
+from db import Base
+from watch_checkpoint import WatchSessionFile
+from write_queue import WriteQueue
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+
+def _git(repo, *args):
+    subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@example.com", *args], cwd=repo, check=True, capture_output=True)
+
+
+def _write(repo, name, content):
+    path = repo / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content) if isinstance(content, bytes) else path.write_text(content)
+
+
+def test_session_diffs_against_recorded_commit(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    _git(repo, "init", "-q")
+    for name in ("src/a.py", "src/b.py", "src/c.py", "src/gone.py", "other.py"):
+        _write(repo, name, f"{name} v1\n")
+    _write(repo, ".gitignore", "*.log\n")
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", "start")
+    src = str(repo / "src")
+
+    # State at the start: b.py modified, c.py staged, new.py untracked
+    _write(repo, "src/b.py", "b dirty\n")
+    _write(repo, "src/c.py", "c staged\n")
+    _git(repo, "add", "src/c.py")
+    _write(repo, "src/new.py", "new at start\n")
+    assert git_baseline.is_work_tree(src) and not git_baseline.is_work_tree(str(tmp_path))
+    snap = git_baseline.snapshot(src, 1024)
+    assert set(snap.staged) == {f"{src}/c.py"}
+    assert snap.dirty == {f"{src}/b.py": "b dirty\n", f"{src}/new.py": "new at start\n"}
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'git.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(watch_checkpoint, "SessionLocal", factory)
+    monkeypatch.setattr(watch_checkpoint, "write_queue", WriteQueue(session_factory=factory))
+    watch_checkpoint.create(1, src, datetime.now() + timedelta(hours=1), snap.dirty, git_head=snap.head, git_objects=snap.staged)
+    db = factory()
+    assert db.query(WatchSessionFile).count() == 3  # no rows for unchanged files
+    db.close()
+
+    # During the session: a committed change, a deletion, a new file, a binary and an ignored file
+    _write(repo, "src/a.py", "a committed\n")
+    _git(repo, "commit", "-q", "-am", "during")
+    os.remove(repo / "src" / "gone.py")
+    _write(repo, "src/added.py", "added\n")
+    _write(repo, "src/image.png", b"\x89PNG\0\0")
+    _write(repo, "src/debug.log", "ignored\n")
+    _write(repo, "other.py", "outside the watched directory\n")
+
+    changed = watch_checkpoint.changed_since_start(1, 1024)
+    assert sorted(os.path.relpath(p, src) for p in changed) == ["a.py", "added.py", "b.py", "c.py", "gone.py", "new.py"]
+    assert watch_checkpoint.baseline_texts(1, changed) == {
+        f"{src}/a.py": "src/a.py v1\n",
+        f"{src}/b.py": "b dirty\n",
+        f"{src}/c.py": "c staged\n",
+        f"{src}/gone.py": "src/gone.py v1\n",
+        f"{src}/new.py": "new at start\n",
+    }
+
+
+def test_repository_config_cannot_run_commands(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    _git(repo, "init", "-q")
+    _write(repo, "a.py", "a\n")
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", "start")
+    marker = tmp_path / "ran"
+    hook = tmp_path / "hook.sh"
+    hook.write_text(f"#!/bin/sh\ntouch {marker}\n")
+    hook.chmod(0o755)
+    _git(repo, "config", "core.fsmonitor", str(hook))
+    _git(repo, "config", "diff.external", str(hook))
+    _write(repo, "a.py", "changed\n")
+
+    snap = git_baseline.snapshot(str(repo), 1024)
+    assert git_baseline.changed_files(str(repo), snap.head, 1024) == [str(repo / "a.py")]
+    assert not marker.exists()
+
+
+@pytest.mark.skipif(not hasattr(os, "geteuid") or os.geteuid() != 0, reason="needs root to chown")
+def test_repository_owned_by_another_user_is_not_trusted(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    _git(repo, "init", "-q")
+    os.chown(repo, 65534, 65534)
+    os.chown(repo / ".git", 65534, 65534)
+    assert not git_baseline.is_work_tree(str(repo))
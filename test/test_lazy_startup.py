@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_app_defers_engine_and_watchdog(tmp_path):
+    code = (
+        "import sys, main, db\n"
+        "assert db.get_engine.cache_info().currsize == 0, 'engine created on import'\n"
+        "assert 'watchdog' not in sys.modules and 'requests_oauthlib' not in sys.modules\n"
+        "assert 'fastapi_utils' not in sys.modules\n"
+        "session = db.SessionLocal()\n"
+        "assert session.get_bind() is db.get_engine() is db.engine\n"
+        "session.close()\n"
+    )
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'lazy.db'}")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    assert out.returncode == 0, out.stderr
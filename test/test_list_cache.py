@@ -0,0 +1,117 @@
+import json
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import db as db_module
+import list_cache
+from db import Base, FileChangeLog, GeneratedPost, TableVersion, table_stamp, track_table_versions
+
+
+def _factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'lists.db'}")
+    Base.metadata.create_all(bind=engine)
+    track_table_versions(engine)
+    monkeypatch.setattr(db_module, "get_engine", lambda: engine)
+    db_module._seed_table_versions()
+    return engine, sessionmaker(bind=engine)
+
+
+def test_stamp_moves_on_insert_update_and_bulk_delete(tmp_path, monkeypatch):
+    engine, factory = _factory(tmp_path, monkeypatch)
+    stamps = []
+
+    def stamp():
+        with engine.connect() as conn:
+            stamps.append(table_stamp(conn, "generated_posts"))
+
+    stamp()
+    db = factory()
+    db.add_all([GeneratedPost(file="a", content="one"), GeneratedPost(file="b", content="two")])
+    db.commit()
+    stamp()
+    for post in db.query(GeneratedPost).all():
+        post.status = "approved"  # two UPDATEs, one bump per transaction
+    db.commit()
+    stamp()
+    db.execute(GeneratedPost.__table__.delete().where(GeneratedPost.id == 2))
+    db.commit()
+    stamp()
+    db.rollback()
+    stamp()
+    assert db.get(TableVersion, "file_change_logs").version == 0
+    db.close()
+    assert stamps == ["0.0", "2.1", "2.2", "1.3", "1.3"]
+
+
+def test_stamp_moves_when_a_lower_id_commits_last(tmp_path, monkeypatch):
+    # Postgres can commit id 10 after id 11; max(id) stays put, so the counter has to move.
+    engine, factory = _factory(tmp_path, monkeypatch)
+    db = factory()
+    db.add(GeneratedPost(id=11, file="b", content="eleven"))
+    db.commit()
+    with engine.connect() as conn:
+        before = table_stamp(conn, "generated_posts")
+    db.add(GeneratedPost(id=10, file="a", content="ten"))
+    db.commit()
+    with engine.connect() as conn:
+        after = table_stamp(conn, "generated_posts")
+    db.close()
+    assert before.split(".")[0] == after.split(".")[0] == "11"
+    assert after != before
+
+
+def test_list_responses_use_etags_and_cache(tmp_path, monkeypatch):
+    engine, factory = _factory(tmp_path, monkeypatch)
+    monkeypatch.setattr(list_cache, "SessionLocal", factory)
+    monkeypatch.setattr(list_cache, "cache", list_cache.ResponseCache(8))
+    builds = []
+
+    def build():
+        builds.append(1)
+        session = factory()
+        try:
+            return [{"id": p.id, "status": p.status} for p in session.query(GeneratedPost).all()]
+        finally:
+            session.close()
+
+    app = Starlette(routes=[Route("/generated-posts/", lambda request: list_cache.cached_list(request, "generated_posts", build))])
+    client = TestClient(app)
+
+    first = client.get("/generated-posts/")
+    assert first.json() == [] and first.headers["etag"].startswith('W/"')
+    assert client.get("/generated-posts/", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+    assert client.get("/generated-posts/").json() == []
+    assert len(builds) == 1  # served from cache
+    assert client.get("/generated-posts/?include_all=true").status_code == 200
+    assert len(builds) == 2  # different query, different entry
+
+    session = factory()
+    session.add(GeneratedPost(file="a", content="one"))
+    session.commit()
+    session.close()
+    changed = client.get("/generated-posts/", headers={"If-None-Match": first.headers["etag"]})
+    assert changed.status_code == 200 and changed.json() == [{"id": 1, "status": "pending"}]
+    assert changed.headers["etag"] != first.headers["etag"]
+
+
+def test_ndjson_streams_rows_in_batches(tmp_path, monkeypatch):
+    engine, factory = _factory(tmp_path, monkeypatch)
+    monkeypatch.setattr(list_cache, "SessionLocal", factory)
+    session = factory()
+    session.add_all([FileChangeLog(session_id=1, file_path=f"/repo/{i}.py", diff_summary="+ é") for i in range(5)])
+    session.commit()
+    session.close()
+
+    def to_dict(log):
+        return {"id": log.id, "file_path": log.file_path, "diff_summary": log.diff_summary}
+
+    app = Starlette(routes=[Route("/file-change-logs/", lambda request: list_cache.stream_ndjson(FileChangeLog, to_dict, batch_size=2))])
+    r = TestClient(app).get("/file-change-logs/")
+    assert r.headers["content-type"] == "application/x-ndjson"
+    lines = r.text.splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [1, 2, 3, 4, 5]
+    assert json.loads(lines[0]) == {"id": 1, "file_path": "/repo/0.py", "diff_summary": "+ é"}
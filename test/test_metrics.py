@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import metrics
+
+pytest.importorskip("prometheus_client")
+
+
+def _sample(name, **labels):
+    from prometheus_client import REGISTRY
+
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_engine_statements_are_timed_by_verb(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    metrics.instrument_engine(engine)
+    before = _sample("autosocial_db_query_duration_seconds_count", operation="SELECT")
+    checked_out = _sample("autosocial_db_pool_connections", state="checked_out")
+    with engine.connect() as conn:
+        conn.execute(text("select 1"))
+        conn.execute(text("SELECT 2"))
+        assert _sample("autosocial_db_pool_connections", state="checked_out") == checked_out + 1
+    assert _sample("autosocial_db_query_duration_seconds_count", operation="SELECT") == before + 2
+    assert _sample("autosocial_db_pool_connections", state="checked_out") == checked_out
+
+
+def test_multiprocess_render_aggregates_workers(tmp_path):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    record = "import metrics; metrics.RETRIES.labels('publish').inc(2)"
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", record], env=env, check=True, cwd=os.path.dirname(metrics.__file__))
+    out = subprocess.run(
+        [sys.executable, "-c", "import sys, metrics; sys.stdout.write(metrics.render()[0].decode())"],
+        env=env, check=True, capture_output=True, text=True, cwd=os.path.dirname(metrics.__file__),
+    ).stdout
+    assert 'autosocial_retries_total{component="publish"} 4.0' in out
+
+
+def test_gunicorn_migration_leaves_no_samples(tmp_path, monkeypatch):
+    import runpy
+
+    hooks = runpy.run_path(os.path.join(os.path.dirname(metrics.__file__), "gunicorn.conf.py"))
+    calls = []
+    monkeypatch.setattr(subprocess, "run", lambda args, **kw: calls.append(kw["env"]) or subprocess.CompletedProcess(args, 0))
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path / "multiproc"))
+    monkeypatch.setenv("AUTO_MIGRATE", "true")
+
+    hooks["on_starting"](server=None)
+
+    assert (tmp_path / "multiproc").is_dir()
+    assert "PROMETHEUS_MULTIPROC_DIR" not in calls[0]
+    assert os.environ["AUTO_MIGRATE"] == "false"
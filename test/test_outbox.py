@@ -0,0 +1,239 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+from pydantic import ValidationError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+import outbox
+from db import Base, GeneratedPost
+from outbox import PublishJob, PublishWorkerPool, enqueue_publish, enqueue_publish_many, resolve_unknown
+from ratelimit import rate_limited_result
+from settings import Settings
+from social import _outcome_unknown
+
+
+def _setup(tmp_path, monkeypatch, publishers):
+    engine = create_engine(f"sqlite:///{tmp_path / 'outbox.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(outbox, "publish_workers", PublishWorkerPool(session_factory=factory, publishers=publishers))
+    db = factory()
+    post = GeneratedPost(file="custom", content="Shipping the outbox", status="approved")
+    db.add(post)
+    db.commit()
+    post_id = post.id
+    db.close()
+    return factory, post_id
+
+
+def test_enqueue_is_idempotent(tmp_path, monkeypatch):
+    factory, post_id = _setup(tmp_path, monkeypatch, {})
+    db = factory()
+    first = [j.id for j in enqueue_publish(db, post_id, ["twitter", "linkedin"])]
+    again = [j.id for j in enqueue_publish(db, post_id, ["linkedin", "twitter"])]
+    assert again == first[::-1]
+    assert db.query(PublishJob).count() == 2
+    db.close()
+
+
+def test_failed_attempt_is_retried_then_marks_post(tmp_path, monkeypatch):
+    calls = []
+
+    def flaky(content, job, timeout):
+        calls.append(content)
+        return {"error": "timeout"} if len(calls) == 1 else {"data": {"id": "42"}}
+
+    factory, post_id = _setup(tmp_path, monkeypatch, {"twitter": flaky})
+    monkeypatch.setattr(outbox.get_settings(), "publish_retry_base_seconds", 0)
+    db = factory()
+    (job,) = enqueue_publish(db, post_id, ["twitter"])
+    db.close()
+
+    pool = outbox.publish_workers
+    assert pool.run_once("w1")
+    assert pool.run_once("w1")
+    assert not pool.run_once("w1")
+
+    db = factory()
+    job = db.get(PublishJob, job.id)
+    post = db.get(GeneratedPost, post_id)
+    assert (job.status, job.attempts, job.last_error) == ("succeeded", 2, None)
+    assert (post.status, post.platform) == ("posted", "twitter")
+    db.close()
+    assert calls == ["Shipping the outbox"] * 2
+
+
+def test_platforms_publish_concurrently_under_a_shared_deadline(tmp_path, monkeypatch):
+    release = threading.Event()
+
+    def slow(content, job, timeout):
+        release.wait(5)
+        return {"id": "slow"}
+
+    def fast(content, job, timeout):
+        time.sleep(0.2)
+        return {"id": "fast"}
+
+    factory, post_id = _setup(tmp_path, monkeypatch, {"twitter": fast, "linkedin": slow})
+    monkeypatch.setattr(outbox.get_settings(), "publish_deadline_seconds", 1.0)
+    db = factory()
+    jobs = enqueue_publish(db, post_id, ["twitter", "linkedin"])
+    db.close()
+
+    pool = outbox.publish_workers
+    started = time.monotonic()
+    assert pool.run_once("w1")
+    assert time.monotonic() - started < 2
+    db = factory()
+    assert [db.get(PublishJob, j.id).status for j in jobs] == ["succeeded", "running"]
+    db.close()
+
+    release.set()
+    pool.stop()
+    db = factory()
+    assert [db.get(PublishJob, j.id).status for j in jobs] == ["succeeded", "succeeded"]
+    assert db.get(GeneratedPost, post_id).platform == "twitter,linkedin"
+    db.close()
+
+
+def test_scheduled_job_waits_until_due(tmp_path, monkeypatch):
+    factory, post_id = _setup(tmp_path, monkeypatch, {"twitter": lambda content, job, timeout: {"id": "1"}})
+    db = factory()
+    due = datetime.now() + timedelta(minutes=5)
+    (job,) = enqueue_publish(db, post_id, ["twitter"], scheduled_at=due)
+    db.close()
+
+    monkeypatch.setattr(outbox.get_settings(), "publish_max_sleep_seconds", 3600)
+    pool = outbox.publish_workers
+    assert not pool.run_once("w1")
+    assert 240 < pool.seconds_until_due() <= 300
+
+    db = factory()
+    enqueue_publish(db, post_id, ["twitter"])  # publish now instead
+    db.close()
+    assert pool.run_once("w1")
+
+
+def test_rate_limited_job_waits_for_reset_without_using_an_attempt(tmp_path, monkeypatch):
+    reset = datetime.now() + timedelta(minutes=15)
+    factory, post_id = _setup(tmp_path, monkeypatch, {"twitter": lambda c, j, t: rate_limited_result("X", reset)})
+    db = factory()
+    (job,) = enqueue_publish(db, post_id, ["twitter"])
+    db.close()
+
+    assert outbox.publish_workers.run_once("w1")
+    db = factory()
+    job = db.get(PublishJob, job.id)
+    assert (job.status, job.attempts, job.next_attempt_at) == ("queued", 0, reset)
+    db.close()
+
+
+def test_bulk_enqueue_reuses_existing_jobs(tmp_path, monkeypatch):
+    factory, post_id = _setup(tmp_path, monkeypatch, {})
+    db = factory()
+    other = GeneratedPost(file="custom", content="Second post", status="approved")
+    db.add(other)
+    db.commit()
+    (job,) = enqueue_publish(db, post_id, ["twitter"])
+    db.query(PublishJob).filter(PublishJob.id == job.id).update({"status": "failed"})
+    db.commit()
+
+    counts = enqueue_publish_many(db, [post_id, other.id], ["twitter", "linkedin"])
+    assert counts == {"queued": 3, "requeued": 1, "rescheduled": 0, "unchanged": 0}
+    assert enqueue_publish_many(db, [post_id, other.id], ["twitter", "linkedin"])["rescheduled"] == 4
+    assert db.query(PublishJob).filter(PublishJob.status == "queued").count() == 4
+    db.close()
+
+
+def test_bulk_enqueue_only_reschedules_posts_with_changed_jobs(tmp_path, monkeypatch):
+    factory, post_id = _setup(tmp_path, monkeypatch, {})
+    db = factory()
+    before, after = datetime(2030, 1, 1, 9), datetime(2030, 2, 1, 9)
+    other = GeneratedPost(file="custom", content="Second post", status="approved")
+    db.add(other)
+    db.query(GeneratedPost).filter(GeneratedPost.id == post_id).update({"scheduled_at": before})
+    db.commit()
+    (job,) = enqueue_publish(db, post_id, ["twitter"], scheduled_at=before)
+    db.query(PublishJob).filter(PublishJob.id == job.id).update({"status": "succeeded", "attempts": 1})
+    db.commit()
+
+    counts = enqueue_publish_many(db, [post_id, other.id], ["twitter"], scheduled_at=after)
+    assert counts == {"queued": 1, "requeued": 0, "rescheduled": 0, "unchanged": 1}
+    db.expire_all()
+    assert db.get(GeneratedPost, post_id).scheduled_at == before  # its job was already sent
+    assert db.get(GeneratedPost, other.id).scheduled_at == after
+    db.close()
+
+
+def test_ambiguous_failures_wait_for_confirmation_instead_of_resending(tmp_path, monkeypatch):
+    calls = []
+
+    def read_timeout(content, job, timeout):
+        calls.append(job.platform)
+        return {"error": "Error posting to X", "outcome_unknown": True}
+
+    factory, post_id = _setup(tmp_path, monkeypatch, {"twitter": read_timeout})
+    monkeypatch.setattr(outbox.get_settings(), "publish_retry_base_seconds", 0)
+    db = factory()
+    (job,) = enqueue_publish(db, post_id, ["twitter"])
+    db.close()
+
+    pool = outbox.publish_workers
+    assert pool.run_once("w1")
+    assert not pool.run_once("w1")
+    db = factory()
+    assert db.get(PublishJob, job.id).status == "unknown"
+    # Publishing the post again does not resend it either.
+    enqueue_publish(db, post_id, ["twitter"])
+    assert not pool.run_once("w1") and calls == ["twitter"]
+
+    assert resolve_unknown(db, job.id, posted=True).status == "succeeded"
+    assert db.get(GeneratedPost, post_id).status == "posted"
+    assert resolve_unknown(db, job.id, posted=False) is None
+    db.close()
+
+
+def test_expired_lease_is_not_sent_again(tmp_path, monkeypatch):
+    calls = []
+    factory, post_id = _setup(tmp_path, monkeypatch, {"twitter": lambda c, j, t: calls.append(j.id) or {"id": "1"}})
+    db = factory()
+    (job,) = enqueue_publish(db, post_id, ["twitter"])
+    # A worker claimed it and died mid-send.
+    db.query(PublishJob).filter(PublishJob.id == job.id).update(
+        {"status": "running", "worker": "dead", "attempts": 1, "lease_until": datetime.now() - timedelta(seconds=1)}
+    )
+    db.commit()
+
+    pool = outbox.publish_workers
+    assert not pool.run_once("w1") and calls == []
+    assert db.get(PublishJob, job.id).status == "unknown"
+
+    resolve_unknown(db, job.id, posted=False)
+    assert pool.run_once("w1") and calls == [job.id]
+    db.expire_all()
+    assert db.get(PublishJob, job.id).status == "succeeded"
+    db.close()
+
+
+def test_failures_after_sending_are_classified_as_unknown():
+    refused = requests.ConnectionError(MaxRetryError(None, "/", NewConnectionError(None, "refused")))
+    assert not _outcome_unknown(refused)
+    assert not _outcome_unknown(requests.exceptions.ConnectTimeout())
+    assert _outcome_unknown(requests.exceptions.ReadTimeout())
+    assert _outcome_unknown(requests.ConnectionError(ProtocolError("Connection aborted.")))
+
+    response = requests.Response()
+    for status, unknown in ((400, False), (401, False), (502, True), (201, True)):
+        response.status_code = status
+        assert _outcome_unknown(ValueError("bad body"), response) is unknown
+
+
+def test_publish_lease_must_outlast_a_send():
+    with pytest.raises(ValidationError):
+        Settings(PUBLISH_DEADLINE_SECONDS=15, PUBLISH_LEASE_SECONDS=30)
+    assert Settings(PUBLISH_DEADLINE_SECONDS=15, PUBLISH_LEASE_SECONDS=31).publish_lease_seconds == 31
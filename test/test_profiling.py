@@ -0,0 +1,57 @@
+import marshal
+import pstats
+import threading
+import time
+
+from profiling import Profiler
+
+
+def slow_endpoint():
+    time.sleep(0.15)
+
+
+def test_samples_only_threads_inside_the_endpoint(tmp_path, monkeypatch):
+    import profiling
+
+    monkeypatch.setattr(profiling.get_settings(), "profile_sample_interval_ms", 2)
+    profiler = Profiler(maxlen=2)
+    scope = {}
+    profile, sampler = profiler.start("POST", "/generate-content/", scope)
+    scope["endpoint"] = slow_endpoint  # set by routing once the request is matched
+    unrelated = threading.Thread(target=time.sleep, args=(0.15,))
+    unrelated.start()
+    slow_endpoint()
+    unrelated.join()
+    profiler.finish(profile, sampler, 200, 0.15, "/generate-content/")
+
+    assert profile.samples > 10
+    assert profile.summary()["merged_calls"] == 0
+    assert all(stack[0][2] == "slow_endpoint" for stack in profile.stacks)
+    assert profile.collapsed().startswith("slow_endpoint (test_profiling.py:")
+
+    path = tmp_path / "profile.pstats"
+    path.write_bytes(profile.pstats())
+    stats = pstats.Stats(str(path))
+    assert any(func == "slow_endpoint" for _, _, func in stats.stats)
+    assert marshal.loads(profile.pstats())
+
+    for _ in range(2):
+        p, s = profiler.start("GET", "/healthz", {})
+        profiler.finish(p, s, 200, 0.0, "/healthz")
+    assert [p["id"] for p in profiler.list()] == [3, 2]
+    assert profiler.get(profile.id) is None
+
+
+def test_concurrent_calls_of_the_endpoint_are_reported(monkeypatch):
+    import profiling
+
+    monkeypatch.setattr(profiling.get_settings(), "profile_sample_interval_ms", 2)
+    profiler = Profiler(maxlen=1)
+    profile, sampler = profiler.start("POST", "/generate-content/", {"endpoint": slow_endpoint})
+    other = threading.Thread(target=slow_endpoint)  # another request on the same route
+    other.start()
+    slow_endpoint()
+    other.join()
+    profiler.finish(profile, sampler, 200, 0.15, "/generate-content/")
+
+    assert profile.merged_calls == 1
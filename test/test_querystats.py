@@ -0,0 +1,46 @@
+import logging
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import querystats
+from db import Base, GeneratedPost
+
+
+def test_counts_statements_and_flags_repeated_shapes(tmp_path, monkeypatch, caplog):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stats.db'}")
+    Base.metadata.create_all(bind=engine)
+    querystats.instrument_engine(engine)
+    factory = sessionmaker(bind=engine)
+    settings = querystats.get_settings()
+    monkeypatch.setattr(settings, "query_budget", 8)
+    monkeypatch.setattr(settings, "query_repeat_threshold", 5)
+
+    db = factory()
+    db.add_all([GeneratedPost(file=f"f{i}", content=f"post {i}") for i in range(6)])
+    db.commit()
+    db.close()  # outside any track() block: not counted
+
+    with caplog.at_level(logging.WARNING, logger="autosocial.querystats"):
+        with querystats.track("GET /n-plus-one") as stats:
+            db = factory()
+            for post_id in range(1, 7):
+                db.get(GeneratedPost, post_id)
+            db.close()
+    assert stats.count == 6
+    assert stats.seconds > 0
+    assert stats.headers()["X-DB-Queries"] == "6"
+    assert "repeated a statement 6 times" in caplog.text
+    assert "budget" not in caplog.text
+
+    caplog.clear()
+    monkeypatch.setattr(settings, "query_budget", 3)
+    with caplog.at_level(logging.WARNING, logger="autosocial.querystats"):
+        with querystats.track("GET /batched") as stats:
+            db = factory()
+            db.query(GeneratedPost).filter(GeneratedPost.id.in_([1, 2, 3])).all()
+            db.query(GeneratedPost).filter(GeneratedPost.id.in_([4, 5])).all()
+            db.close()
+    assert stats.count == 2
+    assert len(stats.shapes) == 1  # IN lists of different lengths share a shape
+    assert caplog.text == ""
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db import Base
+from ratelimit import RateLimiter, retry_after, x_buckets
+
+
+def _limiter(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'limits.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return RateLimiter(session_factory=sessionmaker(bind=engine))
+
+
+def test_budget_learned_from_x_headers_blocks_until_reset(tmp_path):
+    limiter = _limiter(tmp_path)
+    reset = datetime.now().replace(microsecond=0) + timedelta(minutes=10)
+    headers = {
+        "x-rate-limit-limit": "100",
+        "x-rate-limit-remaining": "99",
+        "x-rate-limit-reset": str(int(reset.timestamp())),
+        "x-user-limit-24hour-limit": "17",
+        "x-user-limit-24hour-remaining": "1",
+        "x-user-limit-24hour-reset": str(int(reset.timestamp())),
+    }
+    limiter.learn("x:acct", x_buckets(headers))
+
+    assert limiter.acquire("x:acct") == (True, None)
+    assert limiter.acquire("x:acct") == (False, reset)
+    budgets = {b["bucket"]: b for b in limiter.budgets()}
+    assert (budgets["window"]["remaining"], budgets["24h"]["remaining"]) == (98, 0)
+
+    limiter.learn("x:acct", {"24h": (17, 0, datetime.now() - timedelta(seconds=1))})
+    assert limiter.acquire("x:acct") == (True, None)
+
+
+def test_configured_bucket_and_429_throttle(tmp_path):
+    limiter = _limiter(tmp_path)
+    limiter.configure("linkedin:urn:li:person:1", "daily", 2, 24 * 60 * 60)
+    assert limiter.acquire("linkedin:urn:li:person:1")[0]
+    assert limiter.acquire("linkedin:urn:li:person:1")[0]
+    allowed, retry_at = limiter.acquire("linkedin:urn:li:person:1")
+    assert not allowed and timedelta(hours=11) < retry_at - datetime.now() <= timedelta(hours=12)
+
+    retry = retry_after({"Retry-After": "120"})
+    assert limiter.throttled("linkedin:urn:li:person:2", retry) == retry
+    assert limiter.acquire("linkedin:urn:li:person:2") == (False, retry)
+    limiter.throttled("linkedin:urn:li:person:2", datetime.now() - timedelta(seconds=1))
+    assert limiter.acquire("linkedin:urn:li:person:2") == (True, None)
+
+
+def test_empty_bucket_without_reset_recovers_after_backoff(tmp_path, monkeypatch):
+    import ratelimit
+
+    limiter = _limiter(tmp_path)
+    headers = {"x-rate-limit-limit": "100", "x-rate-limit-remaining": "0", "x-rate-limit-reset": "soon"}
+    before = datetime.now()
+    limiter.learn("x:acct", x_buckets(headers))
+    allowed, retry_at = limiter.acquire("x:acct")
+    assert not allowed and retry_at >= before + timedelta(seconds=ratelimit._DEFAULT_BACKOFF_SECONDS)
+
+    # Once the backoff has passed, the bucket refills instead of blocking the account for good.
+    monkeypatch.setattr(ratelimit, "_DEFAULT_BACKOFF_SECONDS", 0)
+    limiter.learn("x:acct", x_buckets(headers))
+    assert limiter.acquire("x:acct") == (True, None)
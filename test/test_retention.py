@@ -0,0 +1,151 @@
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import sessionmaker
+
+import db as db_module
+import dedupe  # noqa: F401 - registers its tables
+import retention
+from blob_store import ContentBlob, store_text
+from db import Base, FileChangeLog, GeneratedPost
+from watch_checkpoint import WatchSessionFile
+
+
+def _setup(tmp_path, monkeypatch, mode="delete"):
+    engine = create_engine(f"sqlite:///{tmp_path / 'retention.db'}")
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(retention, "get_engine", lambda: engine)
+    monkeypatch.setattr(retention, "_archive_metadata", retention.MetaData())
+    settings = retention.get_settings()
+    monkeypatch.setattr(settings, "retention_mode", mode)
+    monkeypatch.setattr(settings, "retention_policy", None)
+    monkeypatch.setattr(settings, "retention_archive_dir", tmp_path / "archive")
+    monkeypatch.setattr(retention, "_BATCH_PAUSE_SECONDS", 0)
+    return engine, sessionmaker(bind=engine)
+
+
+def _seed(engine):
+    old = datetime.now() - timedelta(days=365)
+    with engine.begin() as conn:
+        conn.execute(FileChangeLog.__table__.insert(), [
+            {"id": 1, "session_id": 1, "file_path": "old.py", "diff_summary": "+old", "created_at": old},
+            {"id": 2, "session_id": 1, "file_path": "new.py", "diff_summary": "+new", "created_at": datetime.now()},
+            {"id": 3, "session_id": 1, "file_path": "unknown.py", "diff_summary": "+?", "created_at": None},
+        ])
+        conn.execute(GeneratedPost.__table__.insert(), [
+            {"id": 1, "file": "a", "content": "a", "status": "rejected", "created_at": old},
+            {"id": 2, "file": "b", "content": "b", "status": "pending", "created_at": old},
+            {"id": 3, "file": "c", "content": "c", "status": "approved", "created_at": old},
+            {"id": 4, "file": "d", "content": "d", "status": "posted", "created_at": datetime.now()},
+            {"id": 5, "file": "e", "content": "e", "status": "rejected", "created_at": None},
+        ])
+
+
+def test_purge_removes_only_expired_unprotected_rows(tmp_path, monkeypatch):
+    engine, _ = _setup(tmp_path, monkeypatch)
+    _seed(engine)
+
+    stats = retention.run_retention()
+
+    assert stats["file_change_logs"] == 1 and stats["generated_posts"] == 1
+    with engine.connect() as conn:
+        assert list(conn.execute(select(FileChangeLog.id).order_by(FileChangeLog.id)).scalars()) == [2, 3]
+        assert list(conn.execute(select(GeneratedPost.id).order_by(GeneratedPost.id)).scalars()) == [2, 3, 4, 5]
+
+
+def test_archive_modes_keep_removed_rows(tmp_path, monkeypatch):
+    engine, factory = _setup(tmp_path, monkeypatch, mode="table")
+    _seed(engine)
+    retention.run_retention()
+    with engine.connect() as conn:
+        archived = conn.execute(text("SELECT id, file_path, archived_at FROM file_change_logs_archive")).all()
+    assert [(r.id, r.file_path) for r in archived] == [(1, "old.py")] and archived[0].archived_at
+
+    monkeypatch.setattr(retention.get_settings(), "retention_mode", "ndjson")
+    db = factory()
+    db.add(GeneratedPost(id=6, file="f", content="x" * 1000, status="rejected", created_at=datetime(2000, 1, 1)))
+    db.commit()
+    db.close()
+    retention.run_retention()
+    # NDJSON archives hold the plain text of offloaded columns.
+    (out,) = (tmp_path / "archive").glob("generated_posts-*.ndjson")
+    rows = [json.loads(line) for line in out.read_text().splitlines()]
+    assert [(r["id"], r["content"]) for r in rows] == [(6, "x" * 1000)]
+
+
+def test_added_timestamp_column_is_backfilled(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE file_change_logs (id INTEGER PRIMARY KEY, session_id INTEGER, file_path VARCHAR)"))
+        conn.execute(text("INSERT INTO file_change_logs (session_id, file_path) VALUES (1, 'a.py')"))
+    monkeypatch.setattr(db_module, "get_engine", lambda: engine)
+
+    db_module._add_missing_columns()
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT created_at FROM file_change_logs")).scalar() is not None
+
+
+def test_compaction_keeps_every_kind_of_reference(tmp_path, monkeypatch):
+    engine, factory = _setup(tmp_path, monkeypatch)
+    big = "x" * 1000
+    db = factory()
+    db.add(GeneratedPost(file="a", content="post " * 100))
+    db.add(FileChangeLog(session_id=1, file_path="a.py", diff_summary="+d" * 300, ai_results=str({"m": big})))
+    db.add(WatchSessionFile(session_id=1, file_path="b.py", baseline_hash=store_text(db.connection(), "base " * 100)))
+    orphan = store_text(db.connection(), "gone " * 100)
+    db.commit()
+    db.close()
+
+    real_still_referenced = retention._still_referenced
+
+    def _write_during_compaction(conn, *args):
+        # A log written after the scan, pointing at a blob that looked unreferenced then.
+        if not getattr(_write_during_compaction, "done", False):
+            _write_during_compaction.done = True
+            refs = json.dumps({"models": {"m": orphan}})
+            conn.execute(FileChangeLog.__table__.insert().values(session_id=2, file_path="c.py", ai_results_refs=refs))
+        return real_still_referenced(conn, *args)
+
+    monkeypatch.setattr(retention, "_still_referenced", _write_during_compaction)
+    assert retention.compact_blobs(batch_size=100) == 0
+
+    with engine.begin() as conn:
+        conn.execute(FileChangeLog.__table__.delete().where(FileChangeLog.session_id == 2))
+    monkeypatch.setattr(retention, "_still_referenced", real_still_referenced)
+    assert retention.compact_blobs(batch_size=100) == 1
+    with engine.connect() as conn:
+        assert orphan not in set(conn.execute(select(ContentBlob.hash)).scalars())
+        assert len(set(conn.execute(select(ContentBlob.hash)).scalars())) == 4
+
+
+def test_purged_posts_take_their_dependents_along(tmp_path, monkeypatch):
+    from dedupe import PostSignatureBand
+    from outbox import PublishJob
+
+    engine, factory = _setup(tmp_path, monkeypatch, mode="table")
+    old = datetime.now() - timedelta(days=365)
+    db = factory()
+    for post_id, content in ((1, "first"), (2, "first again"), (3, "waiting on x")):
+        db.add(GeneratedPost(id=post_id, file="a", content=content, status="posted", created_at=old))
+    db.commit()
+    db.query(GeneratedPost).filter(GeneratedPost.id == 2).update({"duplicate_of": 1, "created_at": datetime.now()})
+    db.add_all([
+        PublishJob(post_id=1, platform="twitter", status="succeeded", attempts=1),
+        PublishJob(post_id=3, platform="twitter", status="succeeded", attempts=1),
+        PublishJob(post_id=3, platform="linkedin", status="unknown", attempts=1),
+    ])
+    db.commit()
+    db.close()
+
+    assert retention.run_retention()["generated_posts"] == 1
+
+    with engine.connect() as conn:
+        # Post 3 still has a job that may have published it.
+        assert list(conn.execute(select(GeneratedPost.id).order_by(GeneratedPost.id)).scalars()) == [2, 3]
+        assert conn.execute(select(GeneratedPost.duplicate_of).where(GeneratedPost.id == 2)).scalar() is None
+        assert set(conn.execute(select(PublishJob.post_id)).scalars()) == {3}
+        assert set(conn.execute(select(PostSignatureBand.post_id)).scalars()) == {2, 3}
+        archived = conn.execute(text("SELECT post_id, status FROM publish_jobs_archive")).all()
+        assert [tuple(r) for r in archived] == [(1, "succeeded")]
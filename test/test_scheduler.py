@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db import Base
+from scheduler import Scheduler, first_of_next_month, month_period
+
+
+def test_monthly_task_runs_once_per_month_across_workers(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'scheduler.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    runs = []
+    workers = [Scheduler(session_factory=factory) for _ in range(2)]
+    for name, worker in zip("ab", workers):
+        worker.register("monthly", first_of_next_month, month_period, lambda name=name: runs.append(name))
+
+    for worker in workers:
+        worker.run_due(datetime(2026, 10, 19, 9, 0))
+    assert runs == []
+    assert workers[0].seconds_until_due(datetime(2026, 10, 31, 23, 0)) == 3600
+
+    for worker in workers:
+        worker.run_due(datetime(2026, 11, 1, 0, 0, 1))
+    assert runs == ["a"]
+    assert all(w.seconds_until_due(datetime(2026, 11, 1, 0, 0, 1)) > 0 for w in workers)
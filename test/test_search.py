@@ -0,0 +1,151 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import search
+from db import Base, FileChangeLog, GeneratedPost
+from search import HIGHLIGHT_END, HIGHLIGHT_START
+
+
+def _setup(tmp_path, monkeypatch, dialect=None):
+    engine = create_engine(f"sqlite:///{tmp_path / 'search.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(search, "get_engine", lambda: engine)
+    monkeypatch.setattr(search, "SessionLocal", factory)
+    if dialect:
+        # Any database other than SQLite/Postgres: plain table, LIKE matching.
+        monkeypatch.setattr(search, "_dialect", lambda bind: dialect)
+    monkeypatch.setattr(search, "_ready", set())
+    assert search.ensure_search_index(engine)
+    return engine, factory
+
+
+def _ids(result):
+    return [(h["type"], h["id"]) for h in result["results"]]
+
+
+def test_listeners_keep_the_index_in_sync(tmp_path, monkeypatch):
+    engine, factory = _setup(tmp_path, monkeypatch)
+    indexed = []
+    index_document = search.index_document
+    monkeypatch.setattr(search, "index_document", lambda conn, *args: indexed.append(args[:2]) or index_document(conn, *args))
+    db = factory()
+    post = GeneratedPost(file="watcher.py", content="Faster watcher startup", status="pending")
+    log = FileChangeLog(session_id=7, file_path="scanner.py", diff_summary="+ skip vendored directories " * 40)
+    db.add_all([post, log])
+    db.commit()
+
+    assert _ids(search.search("watcher")) == [("post", post.id)]
+    hit = search.search("vendored")["results"][0]
+    assert (hit["type"], hit["id"], hit["session_id"], hit["file_path"]) == ("file_change", log.id, 7, "scanner.py")
+    assert f"{HIGHLIGHT_START}vendored{HIGHLIGHT_END}" in hit["snippet"]
+
+    indexed.clear()
+    post.status = "approved"
+    db.commit()
+    assert indexed == []  # no indexed text changed
+
+    post.content = "Rewrote the release notes"
+    db.commit()
+    assert search.search("watcher")["total"] == 1  # still matches the file name
+    assert _ids(search.search("release notes")) == [("post", post.id)]
+    assert indexed == [("post", post.id)]
+
+    db.delete(post)
+    db.commit()
+    assert search.search("release")["total"] == 0
+    db.close()
+
+
+def test_ranking_prefix_and_filters(tmp_path, monkeypatch):
+    engine, factory = _setup(tmp_path, monkeypatch)
+    db = factory(expire_on_commit=False)
+    once = GeneratedPost(file="a", content="cache warmed on startup, then the usual traffic")
+    often = GeneratedPost(file="b", content="cache cache cache: the cache layer now caches lists")
+    log = FileChangeLog(session_id=1, file_path="cache.py", diff_summary="+ cache")
+    db.add_all([once, often, log])
+    db.commit()
+    db.close()
+
+    result = search.search("cache")
+    assert result["total"] == 3
+    scores = [h["score"] for h in result["results"]]
+    assert scores == sorted(scores, reverse=True)
+    posts = search.search("cache", ["post"])
+    assert _ids(posts) == [("post", often.id), ("post", once.id)]
+    assert _ids(search.search("cache", ["post"], limit=1, offset=1)) == [("post", once.id)]
+    assert search.search("warm")["total"] == 1  # last term matches as a prefix
+    # FTS5 syntax in the query is searched for literally rather than parsed.
+    assert search.search('cache" OR NOT (x')["total"] == 0
+    assert search.search("???")["total"] == 0
+    assert search.search("cache", ["unknown"])["total"] == 0
+
+
+def test_like_fallback_on_other_databases(tmp_path, monkeypatch):
+    engine, factory = _setup(tmp_path, monkeypatch, dialect="mysql")
+    db = factory()
+    post = GeneratedPost(file="a", content="Dark mode for the dashboard")
+    db.add(post)
+    db.commit()
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT body FROM search_documents")).scalar() == "a\nDark mode for the dashboard"
+
+    assert _ids(search.search("DARK MODE")) == [("post", post.id)]
+    post.content = "Light mode"
+    db.commit()
+    assert search.search("dark")["total"] == 0
+    db.delete(post)
+    db.commit()
+    assert search.search("light")["total"] == 0
+    db.close()
+
+
+def test_search_needs_an_index(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    monkeypatch.setattr(search, "_ready", set())
+    with pytest.raises(RuntimeError):
+        search.search("anything")
+
+
+def test_bulk_edit_maintains_blobs_signatures_and_index(tmp_path, monkeypatch):
+    import dedupe
+    import main
+    from blob_store import ContentBlob
+    from main import BulkEditRequest, EditContentRequest
+
+    engine, factory = _setup(tmp_path, monkeypatch)
+    monkeypatch.setattr(main, "SessionLocal", factory)
+    monkeypatch.setattr(main.get_settings(), "dedupe_mode", "link")
+    db = factory()
+    first = GeneratedPost(file="a.py", content="Old draft about the scheduler")
+    second = GeneratedPost(file="b.py", content="Another old draft")
+    db.add_all([first, second])
+    db.commit()
+    ids = (first.id, second.id)
+    db.close()
+
+    long_text = "Rewrote the retention sweep " * 20
+    looked_up = []
+    monkeypatch.setattr(dedupe, "find_duplicate", lambda conn, content, exclude_id=None: (
+        looked_up.append(exclude_id) or ("fp-%s" % exclude_id, 1, ids[0] if exclude_id == ids[1] else None)
+    ))
+    result = main.bulk_edit_generated_content(BulkEditRequest(edits=[
+        EditContentRequest(post_id=ids[0], new_content=long_text),
+        EditContentRequest(post_id=ids[1], new_content="Short edit about dashboards"),
+        EditContentRequest(post_id=999, new_content="nobody"),
+    ]))
+    assert result == {"updated": 2, "ids": list(ids), "missing": [999]}
+    assert sorted(looked_up) == list(ids)
+
+    db = factory()
+    posts = {p.id: p for p in db.query(GeneratedPost)}
+    assert posts[ids[0]].content == long_text and posts[ids[0]].content_hash
+    assert db.query(ContentBlob).count() == 1
+    assert posts[ids[1]].content_hash is None and posts[ids[1]].duplicate_of == ids[0]
+    bands = db.query(dedupe.PostSignatureBand.post_id).all()
+    assert sorted(b.post_id for b in bands) == sorted(list(ids) * len(dedupe._BAND_WIDTHS))
+    db.close()
+    assert _ids(search.search("retention")) == [("post", ids[0])]
+    assert _ids(search.search("dashboards")) == [("post", ids[1])]
+    assert search.search("scheduler")["total"] == 0
@@ -0,0 +1,53 @@
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+
+from db import configure_sqlite, sqlite_pragmas
+from settings import Settings
+
+
+def test_tuned_pragmas_are_applied_to_every_connection(tmp_path):
+    assert sqlite_pragmas(Settings(SQLITE_TUNED=False)) == []
+    pragmas = sqlite_pragmas(Settings(SQLITE_TUNED=True, SQLITE_BUSY_TIMEOUT_MS=1234))
+    engine = create_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+    configure_sqlite(engine, pragmas)
+    for _ in range(2):
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 1234
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        engine.dispose()
+
+
+def test_single_writer_serializes_write_transactions(tmp_path):
+    # A zero busy timeout: without the in-process lock the second writer would fail with "database is locked".
+    engine = create_engine(f"sqlite:///{tmp_path / 'writer.db'}", connect_args={"check_same_thread": False, "timeout": 0})
+    configure_sqlite(engine, sqlite_pragmas(Settings(SQLITE_TUNED=True, SQLITE_BUSY_TIMEOUT_MS=0)), single_writer=True)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, writer TEXT)"))
+
+    first_wrote = threading.Event()
+    order = []
+
+    def first():
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO t (writer) VALUES ('first')"))
+            first_wrote.set()
+            time.sleep(0.3)
+            order.append("first commits")
+
+    def second():
+        first_wrote.wait(5)
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO t (writer) VALUES ('second')"))
+            order.append("second wrote")
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert order == ["first commits", "second wrote"]
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT writer FROM t ORDER BY id")).scalars().all() == ["first", "second"]
@@ -0,0 +1,54 @@
+import gzip
+
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+import static_assets
+from static_assets import PrecompressedStaticFiles, precompress
+
+
+def _client(tmp_path):
+    app = Starlette(routes=[Mount("/static", PrecompressedStaticFiles(directory=str(tmp_path)))])
+    return TestClient(app)
+
+
+def test_serves_negotiated_encoding_with_etag_and_304(tmp_path):
+    html = "<html>" + "<p>hello static</p>" * 200 + "</html>"
+    (tmp_path / "index.html").write_text(html)
+    (tmp_path / "shot.png").write_bytes(b"\x89PNG" + b"\x00" * 2000)
+    client = _client(tmp_path)
+
+    r = client.get("/static/index.html", headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["vary"] == "Accept-Encoding"
+    assert "max-age=" in r.headers["cache-control"]
+    assert r.text == html  # decoded by the client
+    gzip_etag = r.headers["etag"]
+
+    identity = client.get("/static/index.html", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    assert identity.headers["etag"] != gzip_etag
+
+    not_modified = client.get("/static/index.html", headers={"Accept-Encoding": "gzip", "If-None-Match": gzip_etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == gzip_etag
+
+    png = client.get("/static/shot.png", headers={"Accept-Encoding": "gzip, br"})
+    assert "content-encoding" not in png.headers and "etag" in png.headers
+    assert client.get("/static/missing.css").status_code == 404
+
+
+def test_prefers_build_time_sidecars(tmp_path, monkeypatch):
+    (tmp_path / "app.css").write_text("body { color: red; }\n" * 100)
+    files, saved = precompress(str(tmp_path))
+    assert files == 1 and saved > 0 and (tmp_path / "app.css.gz").exists()
+
+    compressed = []
+    monkeypatch.setattr(static_assets, "_compress", lambda encoding, data: compressed.append(encoding))
+    monkeypatch.setattr(static_assets, "assets", static_assets.AssetCache())
+    r = _client(tmp_path).get("/static/app.css", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert gzip.decompress((tmp_path / "app.css.gz").read_bytes()) == r.content
+    assert "gzip" not in compressed
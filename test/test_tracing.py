@@ -0,0 +1,43 @@
+import json
+import threading
+
+import tracing
+
+
+def test_spans_nest_and_propagate_through_traceparent(tmp_path, monkeypatch):
+    settings = tracing.get_settings()
+    monkeypatch.setattr(settings, "tracing_exporter", "file")
+    monkeypatch.setattr(settings, "tracing_file", str(tmp_path / "traces.jsonl"))
+
+    with tracing.span("watch.event", path="a.py") as root:
+        with tracing.span("generate.request", kind=tracing.CLIENT) as client:
+            headers = tracing.inject({"Accept": "application/json"})
+        assert tracing.current() == root.context
+    assert tracing.current() is None
+
+    # The receiving side (another thread, no inherited context) continues the trace from the header.
+    received = {}
+
+    def handle():
+        with tracing.span("POST /generate-content/", parent=tracing.extract(headers["traceparent"])) as server:
+            received["span"] = server
+
+    t = threading.Thread(target=handle)
+    t.start()
+    t.join()
+
+    assert client.parent_id == root.context.span_id
+    assert received["span"].trace_id == root.trace_id
+    assert received["span"].parent_id == client.context.span_id
+    assert tracing.extract("garbage") is None
+    assert tracing.extract("00-" + "0" * 32 + "-" + "1" * 16 + "-01") is None
+
+    with tracing.span("publish.x", trace_id=root.trace_id):
+        pass
+    tracing.exporter.flush()
+
+    lines = [json.loads(line) for line in (tmp_path / "traces.jsonl").read_text().splitlines()]
+    assert [line["name"] for line in lines] == ["generate.request", "watch.event", "POST /generate-content/", "publish.x"]
+    assert {line["traceId"] for line in lines} == {root.trace_id}
+    assert lines[1]["attributes"] == [{"key": "path", "value": {"stringValue": "a.py"}}]
+    assert "parentSpanId" not in lines[1]
@@ -0,0 +1,61 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db import Base
+from trends import TrendsCache, TrendsCacheEntry
+
+
+def _cache(tmp_path, fetch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'trends.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    return TrendsCache(session_factory=factory, fetchers={"x": fetch}), factory
+
+
+def test_concurrent_cold_loads_share_one_upstream_call(tmp_path):
+    calls = []
+
+    def fetch(woeid):
+        calls.append(woeid)
+        time.sleep(0.2)
+        return [f"#trend{woeid}"]
+
+    cache, _ = _cache(tmp_path, fetch)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("x", 23424977))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == [23424977]
+    assert all(r["topics"] == ["#trend23424977"] and not r["stale"] for r in results)
+    assert cache.get("x", 1)["topics"] == ["#trend1"]
+
+
+def test_stale_entry_is_served_while_refreshing(tmp_path):
+    refreshed = threading.Event()
+
+    def fetch(woeid):
+        refreshed.set()
+        return ["new"]
+
+    cache, factory = _cache(tmp_path, fetch)
+    db = factory()
+    db.add(TrendsCacheEntry(key="x:1", topics='["old"]', fetched_at=datetime.now() - timedelta(minutes=10)))
+    db.commit()
+    db.close()
+
+    result = cache.get("x", 1)
+    assert (result["topics"], result["stale"]) == (["old"], True)
+    assert refreshed.wait(5)
+    for _ in range(50):
+        if cache.get("x", 1)["topics"] == ["new"]:
+            break
+        time.sleep(0.05)
+    assert cache.get("x", 1) | {"fetched_at": None} == {
+        "topics": ["new"], "woeid": 1, "fetched_at": None, "stale": False, "error": False
+    }
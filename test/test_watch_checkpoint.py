@@ -0,0 +1,147 @@
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+import watch_checkpoint
+from db import Base, FileChangeLog
+from watch_checkpoint import WatchSessionCheckpoint, WatchSessionFile
+from write_queue import WriteQueue
+
+
+def _setup(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'checkpoint.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(watch_checkpoint, "SessionLocal", factory)
+    monkeypatch.setattr(watch_checkpoint, "write_queue", WriteQueue(session_factory=factory))
+    return factory
+
+
+def test_baseline_and_changes_survive_for_the_next_worker(tmp_path, monkeypatch):
+    factory = _setup(tmp_path, monkeypatch)
+    end = datetime.now() + timedelta(hours=1)
+    watch_checkpoint.create(1, "/repo", end, {"/repo/a.py": "a = 1\n", "/repo/b.py": "b = 1\n", "/repo/c.py": "a = 1\n"})
+    watch_checkpoint.record_change(1, "/repo/a.py").result(timeout=5)
+    watch_checkpoint.record_change(1, "/repo/new.py").result(timeout=5)
+    watch_checkpoint.record_change(1, "/repo/a.py").result(timeout=5)
+
+    # Still leased by its owner: nobody else may take it over.
+    assert watch_checkpoint.claim() is None
+    watch_checkpoint.release(1)
+    monkeypatch.setattr(watch_checkpoint, "worker_id", lambda: "other-worker")
+    checkpoint = watch_checkpoint.claim()
+    assert (checkpoint.session_id, checkpoint.path, checkpoint.owner) == (1, "/repo", "other-worker")
+    assert watch_checkpoint.claim() is None
+
+    assert watch_checkpoint.changed_paths(1) == ["/repo/a.py", "/repo/new.py"]
+    rescan = [("/repo/a.py", "a = 2\n"), ("/repo/b.py", "b = 2\n"), ("/repo/c.py", "a = 1\n"), ("/repo/d.py", "d\n")]
+    assert watch_checkpoint.mark_changed_since_baseline(1, rescan) == ["/repo/a.py", "/repo/b.py", "/repo/d.py"]
+    assert set(watch_checkpoint.changed_paths(1)) == {"/repo/a.py", "/repo/b.py", "/repo/new.py", "/repo/d.py"}
+    assert watch_checkpoint.baseline_texts(1, ["/repo/a.py", "/repo/b.py", "/repo/new.py"]) == {
+        "/repo/a.py": "a = 1\n",
+        "/repo/b.py": "b = 1\n",
+    }
+
+    db = factory()
+    db.add(FileChangeLog(session_id=1, file_path="/repo/a.py", diff_summary="+a", ai_results=str({"m": "post"})))
+    db.commit()
+    assert watch_checkpoint.completed_files(1) == {"/repo/a.py": ("+a", {"m": "post"})}
+    watch_checkpoint.discard(db, 1)
+    db.commit()
+    assert db.query(WatchSessionFile).count() == 0 and db.query(WatchSessionCheckpoint).count() == 0
+    db.close()
+
+
+def test_expired_lease_is_claimable(tmp_path, monkeypatch):
+    factory = _setup(tmp_path, monkeypatch)
+    watch_checkpoint.create(7, "/repo", datetime.now(), {})
+    assert watch_checkpoint.renew(7).result(timeout=5) is True
+    monkeypatch.setattr(watch_checkpoint, "worker_id", lambda: "other-worker")
+    assert watch_checkpoint.claim() is None
+
+    # The owner was killed and stopped renewing.
+    db = factory()
+    db.get(WatchSessionCheckpoint, 7).lease_until = datetime.now() - timedelta(seconds=1)
+    db.commit()
+    db.close()
+    assert watch_checkpoint.claim().session_id == 7
+    assert watch_checkpoint.renew(7, end_time=datetime(2030, 1, 1)).result(timeout=5) is True
+
+
+def test_previous_owner_cannot_renew_or_discard_a_taken_over_session(tmp_path, monkeypatch):
+    factory = _setup(tmp_path, monkeypatch)
+    watch_checkpoint.create(3, "/repo", datetime.now(), {"/repo/a.py": "a\n"})
+    db = factory()
+    db.get(WatchSessionCheckpoint, 3).lease_until = datetime.now() - timedelta(seconds=1)
+    db.commit()
+    with monkeypatch.context() as m:
+        m.setattr(watch_checkpoint, "worker_id", lambda: "other-worker")
+        assert watch_checkpoint.claim().session_id == 3
+
+    assert watch_checkpoint.renew(3).result(timeout=5) is False
+    assert watch_checkpoint.discard(db, 3) is False
+    db.commit()
+    assert db.query(WatchSessionFile).count() == 1 and db.get(WatchSessionCheckpoint, 3).owner == "other-worker"
+    db.close()
+
+
+def test_watch_session_stops_once_its_lease_is_lost(monkeypatch):
+    import main
+
+    monkeypatch.setattr(main.get_settings(), "watch_session_lease_seconds", 30)
+    renewals = []
+
+    def renew(session_id, end_time=None):
+        future = Future()
+        renewals.append(future)
+        return future
+
+    monkeypatch.setattr(main.watch_checkpoint, "renew", renew)
+    now = time.monotonic()
+    monkeypatch.setitem(main.watch_session, "renewal", None)
+    monkeypatch.setitem(main.watch_session, "renewal_sent_at", now - 11)
+    monkeypatch.setitem(main.watch_session, "lease_confirmed_at", now - 11)
+
+    assert main._keep_watch_lease(1) and len(renewals) == 1
+    renewals[0].set_result(True)
+    assert main._keep_watch_lease(1) and main.watch_session["lease_confirmed_at"] > now - 1
+
+    # A renewal stuck behind the write queue for a whole lease: assume another worker claimed it.
+    monkeypatch.setitem(main.watch_session, "renewal_sent_at", now - 11)
+    monkeypatch.setitem(main.watch_session, "lease_confirmed_at", now - 25)
+    assert main._keep_watch_lease(1) and len(renewals) == 2
+    monkeypatch.setitem(main.watch_session, "lease_confirmed_at", now - 30)
+    assert not main._keep_watch_lease(1) and len(renewals) == 2
+
+    # A renewal that finds another owner
+    monkeypatch.setitem(main.watch_session, "lease_confirmed_at", now)
+    renewals[1].set_result(False)
+    assert not main._keep_watch_lease(1)
+
+
+def test_finished_sessions_leave_no_orphan_blobs(tmp_path, monkeypatch):
+    from blob_store import ContentBlob, content_hash
+    from db import GeneratedPost
+
+    factory = _setup(tmp_path, monkeypatch)
+    shared, own, posted = "shared = 1\n" * 40, "own = 1\n" * 40, "posted text " * 40
+    end = datetime.now() + timedelta(hours=1)
+    watch_checkpoint.create(1, "/repo", end, {"/repo/a.py": shared, "/repo/b.py": own, "/repo/c.py": posted})
+    watch_checkpoint.create(2, "/repo", end, {"/repo/a.py": shared})
+    db = factory()
+    db.add(GeneratedPost(file="c.py", content=posted))  # offloaded to the same blob as c.py's baseline
+    db.commit()
+
+    def blobs():
+        return set(db.execute(select(ContentBlob.hash)).scalars())
+
+    assert watch_checkpoint.discard(db, 1)
+    db.commit()
+    assert blobs() == {content_hash(shared), content_hash(posted)}
+    assert watch_checkpoint.discard(db, 2)
+    db.commit()
+    assert blobs() == {content_hash(posted)}
+    db.close()
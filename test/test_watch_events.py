@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+import watch_events
+from watch_events import EventBroker, format_sse
+
+
+def test_events_published_from_threads_reach_subscribers(monkeypatch):
+    async def scenario():
+        broker = EventBroker()
+        subscription = broker.subscribe()
+        worker = threading.Thread(target=broker.publish, args=("file_changed",), kwargs={"path": "/repo/a.py"})
+        worker.start()
+        worker.join()
+        event = await subscription.next(timeout=1)
+        assert event["type"] == "file_changed" and event["data"] == {"path": "/repo/a.py"}
+        assert format_sse(event) == f'id: {event["id"]}\nevent: file_changed\ndata: {{"path": "/repo/a.py"}}\n\n'
+        assert await subscription.next(timeout=0.01) is None
+
+        # A subscriber that cannot keep up is told to resync instead of growing without bound.
+        monkeypatch.setattr(watch_events, "_QUEUE_LIMIT", 3)
+        slow = broker.subscribe()
+        for i in range(10):
+            broker.publish("diff_ready", path=f"/repo/{i}.py")
+        await asyncio.sleep(0.01)
+        types = [(await slow.next(timeout=1))["type"] for _ in range(3)]
+        assert types == ["diff_ready", "diff_ready", "resync"]
+
+        broker.unsubscribe(subscription)
+        broker.unsubscribe(slow)
+        assert broker.subscriber_count == 0
+
+    asyncio.run(scenario())
+
+
+def test_event_stream_sends_snapshot_then_events_uncompressed():
+    import main
+
+    async def scenario():
+        chunks = asyncio.Queue()
+        disconnect = asyncio.Event()
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": "/watch-session-events/", "raw_path": b"/watch-session-events/", "root_path": "", "query_string": b"",
+            "headers": [(b"host", b"testserver"), (b"accept-encoding", b"gzip")], "client": ("test", 1), "server": ("testserver", 80),
+        }
+
+        async def receive():
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            await chunks.put(message)
+
+        async def body_until(marker):
+            body = b""
+            while marker not in body:
+                message = await asyncio.wait_for(chunks.get(), 5)
+                body += message.get("body", b"")
+            return body.decode()
+
+        app = asyncio.ensure_future(main.app(scope, receive, send))
+        start = await asyncio.wait_for(chunks.get(), 5)
+        headers = dict(start["headers"])
+        assert start["status"] == 200 and headers[b"content-type"].startswith(b"text/event-stream")
+        assert b"content-encoding" not in headers
+
+        snapshot = await body_until(b"event: snapshot")
+        assert '"active": false' in snapshot
+        main.watch_broker.publish("file_changed", path="/repo/a.py")
+        assert 'event: file_changed\ndata: {"path": "/repo/a.py"}' in await body_until(b"file_changed")
+
+        disconnect.set()
+        app.cancel()
+        try:
+            await app
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(0)
+        assert main.watch_broker.subscriber_count == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,37 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db import Base, FileChangeLog, GeneratedPost
+from write_queue import WriteQueue
+
+
+def _queue(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'queue.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    return WriteQueue(session_factory=factory), factory
+
+
+def test_batched_inserts_resolve_to_ids(tmp_path):
+    wq, factory = _queue(tmp_path)
+    futures = [wq.submit(GeneratedPost(file=f"f{i}", content=f"post {i}")) for i in range(50)]
+    futures += wq.submit_many([FileChangeLog(session_id=1, file_path="a.py", diff_summary="+x")])
+    wq.shutdown()
+    ids = [f.result(timeout=5) for f in futures]
+    assert len(set(ids[:50])) == 50 and ids[50]
+
+    db = factory()
+    assert db.query(GeneratedPost).count() == 50
+    assert db.query(FileChangeLog).count() == 1
+    db.close()
+
+
+def test_failing_write_does_not_sink_its_batch(tmp_path):
+    wq, factory = _queue(tmp_path)
+    ok = wq.submit(GeneratedPost(file="ok", content="fine"))
+    bad = wq.submit(GeneratedPost(file=None, content="file is required"))
+    after = wq.call(lambda db: db.query(GeneratedPost).count())
+    wq.shutdown()
+    assert ok.result(timeout=5)
+    assert bad.exception(timeout=5) is not None
+    assert after.result(timeout=5) == 1
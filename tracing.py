@@ -0,0 +1,254 @@
+"""
+Lightweight tracing from file event to published post.
+
+The current span lives in a contextvar. Plain threads do not inherit it, so thread hand-offs pass a
+SpanContext explicitly, and loopback HTTP calls carry a W3C traceparent header that the request
+middleware continues. Work that happens much later (review, publishing) joins the trace stored on the
+post's trace_id column.
+
+Finished spans are exported in the background according to TRACING_EXPORTER:
+- none: trace ids are still generated and stored, nothing is exported
+- file: one OTLP/JSON span per line appended to TRACING_FILE
+- otlp: batches POSTed as OTLP/HTTP JSON to TRACING_OTLP_ENDPOINT (e.g. http://localhost:4318/v1/traces)
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from settings import get_settings
+
+logger = logging.getLogger("autosocial.tracing")
+
+_BATCH_SIZE = 256
+_FLUSH_SECONDS = 1.0
+_QUEUE_LIMIT = 10000  # spans beyond this are dropped rather than growing memory without bound
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    trace_id: str  # 32 hex chars
+    span_id: str  # 16 hex chars
+
+
+@dataclass
+class Span:
+    name: str
+    context: SpanContext
+    parent_id: Optional[str] = None
+    kind: int = INTERNAL
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.context.trace_id
+
+    def set(self, **attributes) -> None:
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+_current: ContextVar[Optional[SpanContext]] = ContextVar("autosocial_span", default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+def current() -> Optional[SpanContext]:
+    return _current.get()
+
+
+def current_trace_id() -> Optional[str]:
+    ctx = _current.get()
+    return ctx.trace_id if ctx else None
+
+
+@contextmanager
+def span(
+    name: str,
+    parent: Optional[SpanContext] = None,
+    trace_id: Optional[str] = None,
+    kind: int = INTERNAL,
+    **attributes,
+) -> Iterator[Span]:
+    """
+    Run a block as a span. The parent defaults to the current span; trace_id joins an existing trace
+    without a known parent (e.g. the trace stored on a post). Exceptions mark the span as failed.
+    """
+    parent = parent or (None if trace_id else _current.get())
+    trace = parent.trace_id if parent else (trace_id or _new_id(16))
+    s = Span(name, SpanContext(trace, _new_id(8)), parent.span_id if parent else None, kind)
+    s.set(**attributes)
+    token = _current.set(s.context)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        s.end_ns = time.time_ns()
+        exporter.export(s)
+
+
+def record(name: str, parent: Optional[SpanContext], start_ns: int, end_ns: int, kind: int = INTERNAL, **attributes) -> None:
+    """
+    Export an already-timed span, e.g. for a batch that did work on behalf of several traces.
+    """
+    if parent is None:
+        return
+    s = Span(name, SpanContext(parent.trace_id, _new_id(8)), parent.span_id, kind, start_ns, end_ns)
+    s.set(**attributes)
+    exporter.export(s)
+
+
+def inject(headers: Optional[dict] = None) -> dict:
+    """
+    Add a traceparent header for the current span so the receiving request continues the trace.
+    """
+    headers = dict(headers or {})
+    ctx = _current.get()
+    if ctx is not None:
+        headers["traceparent"] = f"00-{ctx.trace_id}-{ctx.span_id}-01"
+    return headers
+
+
+def extract(traceparent: Optional[str]) -> Optional[SpanContext]:
+    """
+    Parse a W3C traceparent header ("00-<trace>-<span>-<flags>"); None when absent or malformed.
+    """
+    parts = (traceparent or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return SpanContext(parts[1], parts[2])
+
+
+class Exporter:
+    """
+    Hands finished spans to a background thread that writes them in batches.
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue" = queue.Queue(maxsize=_QUEUE_LIMIT)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def export(self, s: Span) -> None:
+        if get_settings().tracing_exporter == "none":
+            return
+        try:
+            self._queue.put_nowait(s)
+        except queue.Full:
+            self.dropped += 1
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="autosocial-tracing", daemon=True)
+                self._thread.start()
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """
+        Write everything queued so far (best effort, bounded by timeout).
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _run(self) -> None:
+        while True:
+            batch: List[Span] = [self._queue.get()]
+            deadline = time.monotonic() + _FLUSH_SECONDS
+            while len(batch) < _BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.warning("Dropped %s spans: %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: List[Span]) -> None:
+        settings = get_settings()
+        spans = [s.to_otlp() for s in batch]
+        if settings.tracing_exporter == "file":
+            path = settings.tracing_file
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                for item in spans:
+                    item["service"] = settings.tracing_service_name
+                    f.write(json.dumps(item) + "\n")
+        elif settings.tracing_exporter == "otlp":
+            if not settings.tracing_otlp_endpoint:
+                raise RuntimeError("TRACING_OTLP_ENDPOINT is not set")
+            import requests
+
+            payload = {
+                "resourceSpans": [
+                    {
+                        "resource": {
+                            "attributes": [{"key": "service.name", "value": {"stringValue": settings.tracing_service_name}}]
+                        },
+                        "scopeSpans": [{"scope": {"name": "autosocial"}, "spans": spans}],
+                    }
+                ]
+            }
+            resp = requests.post(settings.tracing_otlp_endpoint, json=payload, timeout=10)
+            resp.raise_for_status()
+
+
+exporter = Exporter()
+atexit.register(exporter.flush)
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import Column, DateTime, String, Text, and_, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from db import Base, SessionLocal
+from metrics import CACHE_REQUESTS
+from settings import get_settings
+
+logger = logging.getLogger("autosocial.trends")
+
+_WAIT_POLL_SECONDS = 0.25
+
+
+class TrendsCacheEntry(Base):
+    """
+    Last good trends response per source and location, shared by all workers.
+    refreshing_until is a lease: the worker that sets it is the only one calling upstream for that key.
+    After a failed refresh it is extended by TRENDS_ERROR_BACKOFF_SECONDS and last_error is set.
+    """
+
+    __tablename__ = "trends_cache"
+
+    key = Column(String, primary_key=True)  # e.g. "x:1" (source:woeid)
+    topics = Column(Text, nullable=True)  # JSON list; NULL until the first successful fetch
+    fetched_at = Column(DateTime, nullable=True)
+    refreshing_until = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+
+def _fetch_x(woeid: int) -> List[str]:
+    from social import fetch_x_trends
+
+    return fetch_x_trends(woeid)
+
+
+class TrendsCache:
+    """
+    TTL cache with stale-while-revalidate for trend lookups.
+
+    - Fresh (younger than TRENDS_TTL_SECONDS): served from the table.
+    - Stale (up to TRENDS_MAX_STALE_SECONDS older): served from the table while one background refresh runs.
+    - Missing or older: the caller waits for a refresh.
+    Refreshes are coalesced in-process (one in-flight call per key) and across workers (DB lease), so
+    concurrent page loads make at most one upstream call.
+    """
+
+    def __init__(self, session_factory=SessionLocal, fetchers: Optional[Dict[str, Callable[[int], List[str]]]] = None):
+        self._session_factory = session_factory
+        self._fetchers = fetchers if fetchers is not None else {"x": _fetch_x}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, source: str, woeid: int) -> dict:
+        """
+        Return {"topics", "woeid", "fetched_at", "stale", "error"} for a source and location.
+        """
+        key = f"{source}:{int(woeid)}"
+        entry = self._load(key)
+        freshness = self._freshness(entry)
+        CACHE_REQUESTS.labels("trends", freshness or "miss").inc()
+        if freshness == "fresh":
+            return self._result(entry, woeid, stale=False)
+        if freshness == "stale":
+            self._refresh(key, source, woeid)
+            return self._result(entry, woeid, stale=True)
+
+        try:
+            self._refresh(key, source, woeid).result(timeout=get_settings().trends_refresh_lease_seconds)
+        except Exception as e:
+            logger.debug("Trends refresh for %s did not complete: %s", key, e)
+        entry = self._load(key)
+        if entry and entry["topics"] is not None:
+            return self._result(entry, woeid, stale=self._freshness(entry) != "fresh")
+        return {
+            "topics": [entry["last_error"] if entry and entry["last_error"] else "Trending topics are unavailable"],
+            "woeid": int(woeid),
+            "fetched_at": None,
+            "stale": False,
+            "error": True,
+        }
+
+    # --- Internals ---
+
+    @staticmethod
+    def _freshness(entry: Optional[dict]) -> Optional[str]:
+        if not entry or entry["topics"] is None or entry["fetched_at"] is None:
+            return None
+        settings = get_settings()
+        age = (datetime.now() - entry["fetched_at"]).total_seconds()
+        if age <= settings.trends_ttl_seconds:
+            return "fresh"
+        if age <= settings.trends_ttl_seconds + settings.trends_max_stale_seconds:
+            return "stale"
+        return "expired"
+
+    @staticmethod
+    def _result(entry: dict, woeid: int, stale: bool) -> dict:
+        return {
+            "topics": json.loads(entry["topics"]),
+            "woeid": int(woeid),
+            "fetched_at": entry["fetched_at"].isoformat(),
+            "stale": stale,
+            "error": False,
+        }
+
+    def _load(self, key: str) -> Optional[dict]:
+        db = self._session_factory()
+        try:
+            row = db.get(TrendsCacheEntry, key)
+            if row is None:
+                return None
+            return {
+                "topics": row.topics,
+                "fetched_at": row.fetched_at,
+                "refreshing_until": row.refreshing_until,
+                "last_error": row.last_error,
+            }
+        finally:
+            db.close()
+
+    def _refresh(self, key: str, source: str, woeid: int) -> Future:
+        """
+        Start (or join) the refresh for key. The future resolves once new topics are stored, or once
+        another worker holding the lease has finished.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = Future()
+            self._inflight[key] = future
+        threading.Thread(target=self._run_refresh, args=(key, source, woeid, future), daemon=True).start()
+        return future
+
+    def _run_refresh(self, key: str, source: str, woeid: int, future: Future) -> None:
+        try:
+            if self._claim(key):
+                self._fetch_and_store(key, source, woeid)
+            else:
+                self._wait_for_other_worker(key)
+            future.set_result(None)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _claim(self, key: str) -> bool:
+        now = datetime.now()
+        lease_until = now + timedelta(seconds=get_settings().trends_refresh_lease_seconds)
+        db = self._session_factory()
+        try:
+            res = db.execute(
+                update(TrendsCacheEntry)
+                .where(
+                    and_(
+                        TrendsCacheEntry.key == key,
+                        or_(TrendsCacheEntry.refreshing_until.is_(None), TrendsCacheEntry.refreshing_until < now),
+                    )
+                )
+                .values(refreshing_until=lease_until, last_error=None)
+            )
+            if res.rowcount == 1:
+                db.commit()
+                return True
+            db.rollback()
+            if db.get(TrendsCacheEntry, key) is not None:
+                return False
+            db.add(TrendsCacheEntry(key=key, refreshing_until=lease_until))
+            try:
+                db.commit()
+                return True
+            except IntegrityError:
+                db.rollback()
+                return False
+        finally:
+            db.close()
+
+    def _fetch_and_store(self, key: str, source: str, woeid: int) -> None:
+        fetcher = self._fetchers.get(source)
+        if fetcher is None:
+            raise ValueError(f"Unknown trends source: {source}")
+        try:
+            topics = fetcher(woeid)
+        except Exception as e:
+            # Hold the key for the backoff period so no worker retries upstream right away.
+            backoff = timedelta(seconds=get_settings().trends_error_backoff_seconds)
+            self._update(key, last_error=str(e), refreshing_until=datetime.now() + backoff)
+            raise
+        self._update(key, topics=json.dumps(topics), fetched_at=datetime.now(), refreshing_until=None, last_error=None)
+
+    def _update(self, key: str, **values) -> None:
+        db = self._session_factory()
+        try:
+            db.execute(update(TrendsCacheEntry).where(TrendsCacheEntry.key == key).values(**values))
+            db.commit()
+        finally:
+            db.close()
+
+    def _wait_for_other_worker(self, key: str) -> None:
+        deadline = time.monotonic() + get_settings().trends_refresh_lease_seconds
+        while time.monotonic() < deadline:
+            entry = self._load(key)
+            if entry is None or entry["refreshing_until"] is None or entry["refreshing_until"] < datetime.now():
+                return
+            if entry["last_error"] is not None:
+                # The lease is an error backoff, not a fetch in progress.
+                return
+            time.sleep(_WAIT_POLL_SECONDS)
+
+
+trends_cache = TrendsCache()
@@ -0,0 +1,349 @@
+"""
+Durable checkpoints for watch sessions, so a restart or deploy does not lose a running session.
+
+At start a session stores its baseline: one watch_session_files row per scanned file, pointing at the
+file's content in content_blobs (de-duplicated, so unchanged files cost one small row per session).
+The first change to each file is recorded on its row as it happens, and every file whose generation
+finished has its file_change_logs row, which is what a resumed finalize skips.
+
+A watch_session_checkpoints row owns the session: the worker running it renews a lease, like publish
+jobs (see outbox.py). A worker that shuts down cleanly releases the lease; one that is killed leaves it
+to expire. Either way another worker (or the restarted one) claims the session, rescans for changes made
+while nobody was watching and carries on watching until end_time, or finalizes right away when that has
+passed. Both tables are cleared when the session finishes, along with the baseline blobs no other row
+references.
+
+Baselines go to content_blobs whatever BLOB_STORAGE and BLOB_MIN_BYTES say: those settings decide
+whether row columns are offloaded, while a baseline has no inline column to fall back to, and must
+survive the worker that wrote it. Unchanged files cost one shared blob across sessions.
+
+Sessions on a git work tree keep a much smaller baseline (see git_baseline.py): the checkpoint records
+the start commit, and only files that were staged (as git blob ids) or dirty (as content) get a row.
+"""
+from __future__ import annotations
+
+import ast
+import os
+import socket
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, String, UniqueConstraint, delete, or_, select, update
+
+import git_baseline
+from blob_store import batched_hydration, content_hash, load_texts, store_texts
+from db import Base, FileChangeLog, SessionLocal
+from settings import get_settings
+from write_queue import write_queue
+
+_ROW_CHUNK = 500
+
+
+class WatchSessionCheckpoint(Base):
+    """
+    A resumable watch session (watch_session_logs.id) and the worker currently running it.
+    """
+
+    __tablename__ = "watch_session_checkpoints"
+
+    session_id = Column(Integer, primary_key=True)
+    path = Column(String, nullable=False)
+    # Python-side clock, like the lease; moved forward to the stop time when a session is stopped early.
+    end_time = Column(DateTime, nullable=False)
+    owner = Column(String, nullable=True)
+    lease_until = Column(DateTime, nullable=True)  # an owned session whose lease expired is claimable again
+    git_head = Column(String(64), nullable=True)  # start commit of a session on a git work tree
+
+
+class WatchSessionFile(Base):
+    """
+    A file in a session: its baseline content (content_blobs.hash, NULL for files created during the
+    session) and when it first changed. In git mode, a file staged at the start has its blob id instead,
+    and files without a row are read from the start commit.
+    """
+
+    __tablename__ = "watch_session_files"
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, nullable=False, index=True)
+    file_path = Column(String, nullable=False)
+    baseline_hash = Column(String(64), nullable=True)
+    baseline_object = Column(String(64), nullable=True)  # git blob id
+    changed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (UniqueConstraint("session_id", "file_path", name="uq_watch_session_files_path"),)
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _lease() -> timedelta:
+    return timedelta(seconds=max(1, get_settings().watch_session_lease_seconds))
+
+
+def create(
+    session_id: int,
+    path: str,
+    end_time: datetime,
+    baseline: Dict[str, str],
+    git_head: Optional[str] = None,
+    git_objects: Optional[Dict[str, str]] = None,
+) -> None:
+    """
+    Persist a new session and its baseline (path -> content, and in git mode path -> blob id), owned by
+    this worker.
+    """
+    db = SessionLocal()
+    try:
+        items = list(baseline.items())
+        hashes = store_texts(db.connection(), (content for _, content in items))
+        db.add(WatchSessionCheckpoint(
+            session_id=session_id,
+            path=path,
+            end_time=end_time,
+            owner=worker_id(),
+            lease_until=datetime.now() + _lease(),
+            git_head=git_head,
+        ))
+        rows = [
+            {"session_id": session_id, "file_path": file_path, "baseline_hash": h, "baseline_object": None}
+            for (file_path, _), h in zip(items, hashes)
+        ]
+        rows += [
+            {"session_id": session_id, "file_path": file_path, "baseline_hash": None, "baseline_object": object_id}
+            for file_path, object_id in (git_objects or {}).items()
+            if file_path not in baseline
+        ]
+        for i in range(0, len(rows), _ROW_CHUNK):
+            db.execute(WatchSessionFile.__table__.insert(), rows[i:i + _ROW_CHUNK])
+        db.commit()
+    finally:
+        db.close()
+
+
+def _mark_changed(db, session_id: int, paths: Iterable[str]) -> None:
+    now = datetime.now()
+    paths = list(paths)
+    known = set(db.execute(
+        select(WatchSessionFile.file_path).where(WatchSessionFile.session_id == session_id, WatchSessionFile.file_path.in_(paths))
+    ).scalars())
+    if known:
+        db.execute(
+            update(WatchSessionFile)
+            .where(
+                WatchSessionFile.session_id == session_id,
+                WatchSessionFile.file_path.in_(known),
+                WatchSessionFile.changed_at.is_(None),
+            )
+            .values(changed_at=now)
+        )
+    new = [p for p in paths if p not in known]
+    if new:
+        db.execute(WatchSessionFile.__table__.insert(), [{"session_id": session_id, "file_path": p, "changed_at": now} for p in new])
+
+
+def record_change(session_id: int, path: str) -> Future:
+    """
+    Record a file's first change in the session (queued for the batching writer).
+    """
+    return write_queue.call(lambda db: _mark_changed(db, session_id, [path]))
+
+
+def renew(session_id: int, end_time: Optional[datetime] = None) -> Future:
+    """
+    Extend this worker's lease, and move end_time when given. Resolves to False when the lease was lost.
+    """
+    values = {"lease_until": datetime.now() + _lease()}
+    if end_time is not None:
+        values["end_time"] = end_time
+    me = worker_id()
+
+    def _renew(db):
+        res = db.execute(
+            update(WatchSessionCheckpoint)
+            .where(WatchSessionCheckpoint.session_id == session_id, WatchSessionCheckpoint.owner == me)
+            .values(**values)
+        )
+        return res.rowcount == 1
+
+    return write_queue.call(_renew)
+
+
+def release(session_id: int) -> None:
+    """
+    Give the session up so the next worker can claim it without waiting for the lease to expire.
+    """
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(WatchSessionCheckpoint)
+            .where(WatchSessionCheckpoint.session_id == session_id, WatchSessionCheckpoint.owner == worker_id())
+            .values(owner=None, lease_until=None)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def discard(db, session_id: int) -> bool:
+    """
+    Drop a finished session's checkpoint and the baseline blobs nothing else uses, in the caller's
+    transaction, if this worker still owns it. Returns False (and drops nothing) when another worker has
+    taken the session over.
+    """
+    from retention import release_blobs  # retention imports this module
+
+    res = db.execute(
+        delete(WatchSessionCheckpoint).where(
+            WatchSessionCheckpoint.session_id == session_id, WatchSessionCheckpoint.owner == worker_id()
+        )
+    )
+    if res.rowcount != 1:
+        return False
+    hashes = list(db.execute(
+        select(WatchSessionFile.baseline_hash)
+        .where(WatchSessionFile.session_id == session_id, WatchSessionFile.baseline_hash.isnot(None))
+    ).scalars())
+    db.execute(delete(WatchSessionFile).where(WatchSessionFile.session_id == session_id))
+    release_blobs(db.connection(), hashes)
+    return True
+
+
+def _claimable(now: datetime):
+    return or_(WatchSessionCheckpoint.owner.is_(None), WatchSessionCheckpoint.lease_until < now)
+
+
+def claim() -> Optional[WatchSessionCheckpoint]:
+    """
+    Take over the oldest session nobody is running, if any.
+    """
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        now = datetime.now()
+        candidates = db.execute(
+            select(WatchSessionCheckpoint.session_id).where(_claimable(now)).order_by(WatchSessionCheckpoint.session_id)
+        ).scalars().all()
+        for session_id in candidates:
+            # Conditional UPDATE: of several workers racing for the same session, one wins.
+            res = db.execute(
+                update(WatchSessionCheckpoint)
+                .where(WatchSessionCheckpoint.session_id == session_id, _claimable(now))
+                .values(owner=worker_id(), lease_until=now + _lease())
+            )
+            if res.rowcount == 1:
+                db.commit()
+                return db.get(WatchSessionCheckpoint, session_id)
+        db.commit()
+        return None
+    finally:
+        db.close()
+
+
+def changed_paths(session_id: int) -> List[str]:
+    db = SessionLocal()
+    try:
+        return list(db.execute(
+            select(WatchSessionFile.file_path)
+            .where(WatchSessionFile.session_id == session_id, WatchSessionFile.changed_at.isnot(None))
+            .order_by(WatchSessionFile.id)
+        ).scalars())
+    finally:
+        db.close()
+
+
+def mark_changed_since_baseline(session_id: int, files: Iterable[Tuple[str, str]]) -> List[str]:
+    """
+    Compare (path, content) pairs from a rescan with the baseline and record the files that differ.
+    Used on resume for changes made while no worker was watching.
+    """
+    db = SessionLocal()
+    try:
+        baseline = dict(db.execute(
+            select(WatchSessionFile.file_path, WatchSessionFile.baseline_hash).where(WatchSessionFile.session_id == session_id)
+        ).all())
+        changed = [path for path, content in files if path not in baseline or baseline[path] != content_hash(content)]
+        for i in range(0, len(changed), _ROW_CHUNK):
+            _mark_changed(db, session_id, changed[i:i + _ROW_CHUNK])
+        db.commit()
+        return changed
+    finally:
+        db.close()
+
+
+def baseline_texts(session_id: int, paths: Iterable[str]) -> Dict[str, str]:
+    """
+    Content at session start of the given files; files created during the session are left out.
+    """
+    paths = list(paths)
+    db = SessionLocal()
+    try:
+        checkpoint = db.get(WatchSessionCheckpoint, session_id)
+        hashes, objects = {}, {}
+        for i in range(0, len(paths), _ROW_CHUNK):
+            for file_path, h, object_id in db.execute(
+                select(WatchSessionFile.file_path, WatchSessionFile.baseline_hash, WatchSessionFile.baseline_object).where(
+                    WatchSessionFile.session_id == session_id,
+                    WatchSessionFile.file_path.in_(paths[i:i + _ROW_CHUNK]),
+                )
+            ):
+                if h is not None:
+                    hashes[file_path] = h
+                elif object_id is not None:
+                    objects[file_path] = object_id
+        texts = load_texts(db.connection(), hashes.values())
+    finally:
+        db.close()
+    result = {path: texts[h] for path, h in hashes.items() if h in texts}
+    if checkpoint is not None and checkpoint.git_head:
+        # Unchanged at the start: as in the start commit
+        for file_path in paths:
+            if file_path not in hashes and file_path not in objects:
+                objects[file_path] = git_baseline.relative_spec(checkpoint.git_head, checkpoint.path, file_path)
+        blobs = git_baseline.read_objects(checkpoint.path, objects.values())
+        for file_path, spec in objects.items():
+            if blobs.get(spec) is not None:
+                result[file_path] = blobs[spec].decode("utf-8", "replace")
+    return result
+
+
+def changed_since_start(session_id: int, max_bytes: int) -> List[str]:
+    """
+    Git mode: the files that may differ from the session's start state, whether or not a watch event
+    reported them. Files that were dirty at the start and are unchanged since are included; callers skip
+    them by comparing content.
+    """
+    db = SessionLocal()
+    try:
+        checkpoint = db.get(WatchSessionCheckpoint, session_id)
+        recorded = list(db.execute(
+            select(WatchSessionFile.file_path).where(
+                WatchSessionFile.session_id == session_id,
+                (WatchSessionFile.baseline_hash.isnot(None)) | (WatchSessionFile.baseline_object.isnot(None)),
+            )
+        ).scalars())
+    finally:
+        db.close()
+    changed = git_baseline.changed_files(checkpoint.path, checkpoint.git_head, max_bytes)
+    return list(dict.fromkeys(changed + recorded))
+
+
+def completed_files(session_id: int) -> Dict[str, Tuple[str, object]]:
+    """
+    Files whose generation already finished in this session: path -> (diff, model responses).
+    """
+    db = SessionLocal()
+    try:
+        with batched_hydration(db):
+            logs = db.query(FileChangeLog).filter(FileChangeLog.session_id == session_id).all()
+        done = {}
+        for log in logs:
+            try:
+                responses = ast.literal_eval(log.ai_results) if log.ai_results else {}
+            except (ValueError, SyntaxError, MemoryError, RecursionError):
+                responses = log.ai_results
+            done[log.file_path] = (log.diff_summary, responses)
+        return done
+    finally:
+        db.close()
@@ -0,0 +1,93 @@
+"""
+Push channel for watch-session progress (served as Server-Sent Events by main.py).
+
+Watcher and finalize threads publish small incremental events; every connected client has its own
+asyncio queue on the event loop that serves it. Events:
+- session_started: path, end_time (and resumed=True when a restarted worker picks the session up)
+- file_changed: path (first change of a file in the session)
+- diff_ready: path
+- generation_done: path, error (None on success)
+- session_finished: files, errors
+
+A client that falls too far behind is sent a "resync" event and disconnected; the browser's EventSource
+reconnects and starts again from a fresh snapshot. State lives in the worker process that runs the
+session, like the status endpoint it replaces.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from itertools import count
+from typing import Optional, Set
+
+_QUEUE_LIMIT = 1000
+
+
+class Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: "asyncio.Queue[dict]" = asyncio.Queue(maxsize=_QUEUE_LIMIT)
+        self.overflowed = False
+
+    def _put(self, event: dict) -> None:
+        # Runs on the subscriber's loop.
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait({"id": event["id"], "type": "resync", "data": {}})
+
+    async def next(self, timeout: float) -> Optional[dict]:
+        """
+        The next event, or None when nothing arrived within timeout (time for a keep-alive).
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBroker:
+    def __init__(self):
+        self._subscribers: Set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._ids = count(1)
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event_type: str, **data) -> None:
+        """
+        Send an event to every subscriber. Safe to call from any thread.
+        """
+        event = {"id": next(self._ids), "type": event_type, "data": data}
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, event)
+            except RuntimeError:  # loop closed
+                self.unsubscribe(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+
+def format_sse(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+broker = EventBroker()
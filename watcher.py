@@ -19,7 +19,7 @@ class ChangeHandler(FileSystemEventHandler):
             prompt = f"Change detected in {event.src_path}"
             # Generate content
             gen_resp = requests.post(
-                "http://127.0.0.1:8000/generate-content/",
+                f"{get_settings().app_base_url}/generate-content/",
                 json={"prompt": prompt},
                 timeout=10,
             )
@@ -27,7 +27,7 @@ class ChangeHandler(FileSystemEventHandler):
             content = gen_resp.json().get("model_responses") or gen_resp.json().get("responses", "")
             # Post content (to Twitter as example)
             post_resp = requests.post(
-                "http://127.0.0.1:8000/post-content/",
+                f"{get_settings().app_base_url}/post-content/",
                 json={"platform": "twitter", "content": str(content)},
                 timeout=10,
             )
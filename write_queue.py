@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+from sqlalchemy import inspect as sa_inspect
+
+from db import SessionLocal
+from metrics import RETRIES
+import tracing
+from settings import get_settings
+
+logger = logging.getLogger("autosocial.write_queue")
+
+_STOP = object()
+
+
+class _Op:
+    __slots__ = ("obj", "fn", "future", "snapshot", "span")
+
+    def __init__(self, obj=None, fn: Optional[Callable] = None):
+        self.obj = obj
+        self.fn = fn
+        self.future: Future = Future()
+        # Submitting span; the commit is recorded in its trace even though it runs on the writer thread.
+        self.span = tracing.current()
+        # Column values as submitted; flush listeners rewrite some of them (e.g. blob offloading).
+        self.snapshot = None
+        if obj is not None:
+            state = sa_inspect(obj)
+            self.snapshot = {
+                attr.key: state.dict[attr.key] for attr in state.mapper.column_attrs if attr.key in state.dict
+            }
+
+    def reset(self) -> None:
+        """
+        Put a rolled-back insert back into its submitted state so it can be retried.
+        """
+        if self.obj is None:
+            return
+        state = sa_inspect(self.obj)
+        for attr in state.mapper.column_attrs:
+            if attr.key in self.snapshot:
+                state.dict[attr.key] = self.snapshot[attr.key]
+            else:
+                state.dict.pop(attr.key, None)
+        state.info.clear()
+
+
+class WriteQueue:
+    """
+    Single writer thread that drains queued inserts and commits them in batches.
+
+    A batch closes when it reaches WRITE_QUEUE_MAX_BATCH operations or WRITE_QUEUE_MAX_DELAY_MS after its
+    first operation arrived, and is written in one transaction (bulk INSERTs via a single flush).
+    Inserts resolve their future to the new row id; call() futures resolve to the function's return value.
+    With WRITE_QUEUE=false every operation is committed synchronously in the caller's thread.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    # --- Public API ---
+
+    def submit(self, obj) -> Future:
+        """
+        Queue an ORM instance for insert. The future resolves to its id.
+        """
+        return self.submit_many([obj])[0]
+
+    def submit_many(self, objs) -> List[Future]:
+        """
+        Queue several inserts together; they land in the same batch, in order.
+        """
+        return self._enqueue([_Op(obj=o) for o in objs])
+
+    def call(self, fn: Callable[[Any], Any]) -> Future:
+        """
+        Run fn(session) in the writer's transaction, after everything queued before it.
+        """
+        return self._enqueue([_Op(fn=fn)])[0]
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """
+        Block until everything queued so far is committed (or failed).
+        """
+        self.call(lambda db: None).result(timeout=timeout)
+
+    def shutdown(self, timeout: Optional[float] = 10.0) -> None:
+        """
+        Commit everything already queued, then stop the writer thread.
+        Later submissions are written synchronously so nothing is dropped.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.warning("Write queue did not drain within %ss", timeout)
+
+    # --- Internals ---
+
+    def _enqueue(self, ops: List[_Op]) -> List[Future]:
+        if not get_settings().write_queue:
+            self._commit(ops)
+            return [op.future for op in ops]
+        with self._lock:
+            if self._closed:
+                run_inline = True
+            else:
+                run_inline = False
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="autosocial-writer", daemon=True)
+                    self._thread.start()
+                self._queue.put(ops)
+        if run_inline:
+            self._commit(ops)
+        return [op.future for op in ops]
+
+    def _run(self) -> None:
+        settings = get_settings()
+        max_batch = max(1, settings.write_queue_max_batch)
+        max_delay = max(0, settings.write_queue_max_delay_ms) / 1000.0
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = list(item)
+            deadline = time.monotonic() + max_delay
+            while len(batch) < max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.extend(item)
+            self._commit(batch)
+
+    def _commit(self, ops: List[_Op]) -> None:
+        # expire_on_commit=False keeps inserted objects readable by callers after the session closes.
+        db = self._session_factory(expire_on_commit=False)
+        start_ns = time.time_ns()
+        try:
+            results = []
+            for op in ops:
+                if op.fn is not None:
+                    db.flush()
+                    results.append(op.fn(db))
+                else:
+                    db.add(op.obj)
+                    results.append(None)
+            db.flush()
+            results = [op.obj.id if op.fn is None else r for op, r in zip(ops, results)]
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            db.close()
+            if len(ops) == 1:
+                ops[0].future.set_exception(e)
+                return
+            # Isolate the failing operation instead of failing the whole batch.
+            logger.warning("Batch of %s writes failed (%s); retrying individually", len(ops), e)
+            RETRIES.labels("write_queue").inc(len(ops))
+            for op in ops:
+                op.reset()
+                self._commit([op])
+            return
+        db.close()
+        end_ns = time.time_ns()
+        for parent in {op.span for op in ops if op.span is not None}:
+            rows = sum(1 for op in ops if op.span == parent)
+            tracing.record("db.write", parent, start_ns, end_ns, rows=rows, batch_size=len(ops))
+        for op, result in zip(ops, results):
+            op.future.set_result(result)
+
+
+write_queue = WriteQueue()
+atexit.register(write_queue.shutdown)